@@ -3,14 +3,20 @@
 from langgraph.graph import StateGraph, START, END
 from agent.utils.state import GraphState
 from agent.utils.nodes import select_diverse_recipes, handle_chat_refinement
+from app.services.metrics import metrics
+
+
+# Every node runs inside a "graph.node" span (latency histogram per node)
+select_recipes_node = metrics.timed("graph.node", node="select_recipes")(select_diverse_recipes)
+handle_chat_node = metrics.timed("graph.node", node="handle_chat")(handle_chat_refinement)
 
 
 # Create the workflow
 workflow = StateGraph(GraphState)
 
 # Add nodes
-workflow.add_node("select_recipes", select_diverse_recipes)
-workflow.add_node("handle_chat", handle_chat_refinement)
+workflow.add_node("select_recipes", select_recipes_node)
+workflow.add_node("handle_chat", handle_chat_node)
 
 # Define edges for initial search workflow
 # START -> select_recipes -> END
@@ -22,8 +28,8 @@ graph = workflow.compile()
 
 # For chat refinement, create a workflow that supports re-search
 chat_workflow = StateGraph(GraphState)
-chat_workflow.add_node("handle_chat", handle_chat_refinement)
-chat_workflow.add_node("select_recipes", select_diverse_recipes)
+chat_workflow.add_node("handle_chat", handle_chat_node)
+chat_workflow.add_node("select_recipes", select_recipes_node)
 
 # Start with chat handler
 chat_workflow.add_edge(START, "handle_chat")
@@ -48,4 +54,14 @@ chat_workflow.add_conditional_edges(
 # After re-search, end
 chat_workflow.add_edge("select_recipes", END)
 
-chat_graph = chat_workflow.compile()
+
+def compile_chat_graph(checkpointer=None):
+    """
+    Compile the chat workflow. With a checkpointer each session is a thread
+    (thread_id = session_id) and a turn only sends the new message.
+    """
+    return chat_workflow.compile(checkpointer=checkpointer)
+
+
+# Stateless variant: callers pass the full state
+chat_graph = compile_chat_graph()
@@ -0,0 +1,121 @@
+"""Local diversity selection over recipe features (replaces the LLM pick)."""
+
+import random
+import re
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+# Relative importance of each feature family when measuring variety
+FEATURE_WEIGHTS = {
+    "cuisine": 3.0,
+    "dish": 2.0,
+    "meal": 1.0,
+    "time": 1.5,
+    "calories": 1.0,
+    "label": 0.5,
+}
+
+LABEL_STOPWORDS = {"a", "and", "the", "with", "of", "in", "on", "for", "recipe", "style", "easy", "best"}
+
+
+def _time_bucket(minutes: float) -> str:
+    if not minutes:
+        return "unknown"
+    if minutes <= 20:
+        return "quick"
+    if minutes <= 45:
+        return "medium"
+    if minutes <= 90:
+        return "long"
+    return "slow"
+
+
+def _calorie_bucket(calories: float, servings: int) -> str:
+    per_serving = calories / max(servings or 1, 1)
+    if per_serving < 400:
+        return "light"
+    if per_serving < 700:
+        return "regular"
+    return "hearty"
+
+
+def recipe_tokens(recipe: dict) -> List[str]:
+    """Return the feature tokens ("cuisine:italian", "time:quick", ...) of a recipe."""
+    tokens = [f"cuisine:{c.lower()}" for c in recipe.get("cuisineType", [])]
+    tokens += [f"dish:{d.lower()}" for d in recipe.get("dishType", [])]
+    tokens += [f"meal:{m.lower()}" for m in recipe.get("mealType", [])]
+    tokens.append(f"time:{_time_bucket(recipe.get('totalTime', 0))}")
+    tokens.append(f"calories:{_calorie_bucket(recipe.get('calories', 0), recipe.get('yield_servings', 4))}")
+    for word in re.findall(r"[a-zæøå]+", recipe.get("label", "").lower()):
+        if len(word) > 2 and word not in LABEL_STOPWORDS:
+            tokens.append(f"label:{word}")
+    return tokens
+
+
+def feature_matrix(recipes: List[dict]) -> np.ndarray:
+    """Build a weighted binary (recipes x features) matrix."""
+    token_lists = [recipe_tokens(recipe) for recipe in recipes]
+    vocabulary: Dict[str, int] = {}
+    for tokens in token_lists:
+        for token in tokens:
+            vocabulary.setdefault(token, len(vocabulary))
+
+    matrix = np.zeros((len(recipes), len(vocabulary)))
+    for row, tokens in enumerate(token_lists):
+        for token in tokens:
+            matrix[row, vocabulary[token]] = FEATURE_WEIGHTS[token.split(":", 1)[0]]
+    return matrix
+
+
+def select_diverse(
+    recipes: List[dict],
+    k: int = 9,
+    discovery_share: float = 0.3,
+    seed: Optional[int] = None,
+    coverage_weight: float = 0.7,
+) -> List[int]:
+    """
+    Pick `k` diverse recipe indices.
+
+    The "smart" share is chosen greedily, maximizing
+    `coverage_weight * new_feature_coverage - (1 - coverage_weight) * max_similarity`
+    against the recipes already picked (max-coverage / MMR). The remaining
+    `discovery_share` is drawn at random from the rest for discovery.
+    Deterministic for a given seed.
+    """
+    n = len(recipes)
+    if n <= k:
+        return list(range(n))
+
+    rng = random.Random(seed)
+    matrix = feature_matrix(recipes)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    unit = matrix / np.where(norms == 0, 1, norms)
+    similarity = unit @ unit.T
+    # Tiny seeded jitter breaks ties without changing meaningful rankings
+    jitter = np.array([rng.random() for _ in range(n)]) * 1e-6
+
+    n_discovery = int(round(k * discovery_share))
+    n_smart = k - n_discovery
+
+    selected: List[int] = []
+    covered = np.zeros(matrix.shape[1], dtype=bool)
+    available = np.ones(n, dtype=bool)
+    max_similarity = np.zeros(n)
+
+    for _ in range(n_smart):
+        coverage = (matrix * ~covered).sum(axis=1) / matrix.sum(axis=1).clip(min=1e-9)
+        scores = coverage_weight * coverage - (1 - coverage_weight) * max_similarity + jitter
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+
+        selected.append(best)
+        available[best] = False
+        covered |= matrix[best] > 0
+        max_similarity = np.maximum(max_similarity, similarity[best])
+
+    remaining = [i for i in range(n) if available[i]]
+    selected.extend(rng.sample(remaining, n_discovery))
+    return selected
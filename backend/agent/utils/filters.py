@@ -0,0 +1,85 @@
+"""Structured recipe filters evaluated locally over a session's recipes."""
+
+import re
+from typing import List, Optional
+from pydantic import BaseModel
+
+
+class RecipeFilter(BaseModel):
+    """
+    Conjunctive predicate over recipe dicts.
+
+    Every set field must hold for a recipe to match; list fields within a
+    field are alternatives (cuisines) or requirements (health_labels,
+    excluded_ingredients). Calories are per serving.
+    """
+
+    cuisines: List[str] = []  # cuisineType in {...}
+    dish_types: List[str] = []  # dishType in {...}
+    meal_types: List[str] = []  # mealType in {...}
+    max_time: Optional[float] = None  # 0 < totalTime <= N minutes
+    min_calories: Optional[float] = None
+    max_calories: Optional[float] = None
+    health_labels: List[str] = []  # All required
+    excluded_ingredients: List[str] = []  # None may appear in ingredientLines
+    label_contains: Optional[str] = None  # Substring of the recipe name
+
+    def is_empty(self) -> bool:
+        return self == RecipeFilter()
+
+    def describe(self) -> str:
+        """Short human-readable summary, e.g. "italian, under 30 minutes"."""
+        parts = [*self.cuisines, *self.dish_types, *self.meal_types, *self.health_labels]
+        if self.label_contains:
+            parts.append(f'named "{self.label_contains}"')
+        if self.excluded_ingredients:
+            parts.append(f"without {', '.join(self.excluded_ingredients)}")
+        if self.max_time:
+            parts.append(f"under {self.max_time:g} minutes")
+        if self.min_calories is not None:
+            parts.append(f"at least {self.min_calories:g} kcal per serving")
+        if self.max_calories is not None:
+            parts.append(f"at most {self.max_calories:g} kcal per serving")
+        return ", ".join(parts)
+
+    def matches(self, recipe: dict) -> bool:
+        if not _any_in(self.cuisines, recipe.get("cuisineType", [])):
+            return False
+        if not _any_in(self.dish_types, recipe.get("dishType", [])):
+            return False
+        if not _any_in(self.meal_types, recipe.get("mealType", [])):
+            return False
+        if self.max_time and not 0 < recipe.get("totalTime", 0) <= self.max_time:
+            return False
+
+        if self.min_calories is not None or self.max_calories is not None:
+            per_serving = recipe.get("calories", 0) / max(recipe.get("yield_servings") or 1, 1)
+            if self.min_calories is not None and per_serving < self.min_calories:
+                return False
+            if self.max_calories is not None and per_serving > self.max_calories:
+                return False
+
+        recipe_labels = {h.lower() for h in recipe.get("healthLabels", [])}
+        if any(label.lower() not in recipe_labels for label in self.health_labels):
+            return False
+
+        if self.excluded_ingredients:
+            ingredients = " ".join(recipe.get("ingredientLines", [])).lower()
+            for ingredient in self.excluded_ingredients:
+                if re.search(rf"\b{re.escape(ingredient.lower())}", ingredients):
+                    return False
+
+        if self.label_contains and self.label_contains.lower() not in recipe.get("label", "").lower():
+            return False
+        return True
+
+    def apply(self, recipes: List[dict]) -> List[int]:
+        """Return the indices of matching recipes."""
+        return [i for i, recipe in enumerate(recipes) if self.matches(recipe)]
+
+
+def _any_in(wanted: List[str], values: List[str]) -> bool:
+    if not wanted:
+        return True
+    values = {v.lower() for v in values}
+    return any(w.lower() in values for w in wanted)
@@ -0,0 +1,28 @@
+"""Rolling extractive summary of chat messages that left the history window."""
+
+from typing import List
+
+SUMMARY_SEPARATOR = "; "
+MAX_ITEM_CHARS = 80  # Longer requests are clipped in the summary
+
+
+def _clip(text: str) -> str:
+    text = " ".join(text.split()).replace(SUMMARY_SEPARATOR, ", ")
+    return text if len(text) <= MAX_ITEM_CHARS else text[:MAX_ITEM_CHARS - 1].rstrip() + "…"
+
+
+def extend_summary(summary: str, dropped: List[dict], max_chars: int) -> str:
+    """
+    Fold messages leaving the window into the summary.
+
+    The summary is the user's earlier requests, oldest first, which is what
+    later refinements refer back to ("like before, but ..."); assistant
+    replies are dropped. Only the newly dropped messages are processed, and
+    the oldest requests fall off once the summary exceeds `max_chars`.
+    """
+    items = summary.split(SUMMARY_SEPARATOR) if summary else []
+    items += [_clip(m.get("content", "")) for m in dropped if m.get("role") == "user" and m.get("content")]
+    while len(items) > 1 and len(SUMMARY_SEPARATOR.join(items)) > max_chars:
+        items.pop(0)
+    return SUMMARY_SEPARATOR.join(items)
+
@@ -0,0 +1,184 @@
+"""Rule-based intent classifier for chat refinement messages."""
+
+import re
+from typing import List, Optional
+from pydantic import BaseModel
+from agent.utils.lexicon import INGREDIENT_LEXICON
+
+
+# Phrase (Norwegian or English) -> Edamam cuisineType
+CUISINE_LEXICON = {
+    "italian": "italian", "italiensk": "italian", "italienske": "italian",
+    "mexican": "mexican", "meksikansk": "mexican", "meksikanske": "mexican",
+    "indian": "indian", "indisk": "indian", "indiske": "indian",
+    "asian": "asian", "asiatisk": "asian", "asiatiske": "asian",
+    "chinese": "chinese", "kinesisk": "chinese", "kinesiske": "chinese",
+    "japanese": "japanese", "japansk": "japanese", "japanske": "japanese",
+    "korean": "korean", "koreansk": "korean", "koreanske": "korean",
+    "french": "french", "fransk": "french", "franske": "french",
+    "greek": "greek", "gresk": "greek", "greske": "greek",
+    "mediterranean": "mediterranean", "middelhavs": "mediterranean",
+    "nordic": "nordic", "nordisk": "nordic", "nordiske": "nordic",
+    "norsk": "nordic", "norske": "nordic", "norwegian": "nordic",
+    "american": "american", "amerikansk": "american", "amerikanske": "american",
+    "british": "british", "britisk": "british", "britiske": "british",
+    "caribbean": "caribbean", "middle eastern": "middle eastern",
+}
+
+# Phrase -> Edamam health label
+HEALTH_LEXICON = {
+    "vegetarian": "vegetarian", "vegetar": "vegetarian", "vegetarisk": "vegetarian",
+    "vegetariske": "vegetarian", "veggie": "vegetarian",
+    "vegan": "vegan", "vegansk": "vegan", "veganske": "vegan",
+    "gluten free": "gluten-free", "glutenfri": "gluten-free", "glutenfrie": "gluten-free",
+    "dairy free": "dairy-free", "melkefri": "dairy-free", "melkefrie": "dairy-free",
+    "laktosefri": "dairy-free", "laktosefrie": "dairy-free",
+    "pescatarian": "pescatarian",
+}
+
+# Phrase -> Edamam diet label
+DIET_LEXICON = {
+    "more protein": "high-protein", "high protein": "high-protein", "proteinrik": "high-protein",
+    "mer protein": "high-protein", "low carb": "low-carb", "lavkarbo": "low-carb",
+    "low fat": "low-fat", "fettfattig": "low-fat", "more fiber": "high-fiber",
+}
+
+QUICK_WORDS = {"quick", "quicker", "fast", "faster", "rask", "raskere", "kjapp", "kjappere", "enkel", "easy", "easier"}
+QUICK_DEFAULT_MINUTES = 30
+
+NEGATIONS = r"(?:no|not|without|don't want|dont want|don't like|dont like|hate|skip|less|ingen|ikke|uten|drop)"
+FILTER_MARKERS = r"^(?:show|only|just|which|filter|vis|bare|kun|hvilke)\b|\b(?:show only|only the|just the|which ones|which of these|vis bare|bare de|kun de)\b"
+CHANGE_MARKERS = r"\b(?:instead|different|other|new|another|more|change|i stedet|andre|nye|annet|mer|bytt)\b"
+QUESTION_WORDS = r"^(?:how|what|why|when|where|who|can|could|is|are|does|do|tell|hvordan|hva|hvorfor|når|hvor|kan|er)\b"
+
+# Words that carry no meaning on their own, ignored when measuring coverage
+FILLER_WORDS = {
+    "i", "me", "my", "we", "us", "please", "pls", "the", "a", "an", "some", "any", "of", "for",
+    "with", "and", "or", "to", "recipes", "recipe", "meals", "meal", "dishes", "dish", "food",
+    "ones", "one", "them", "these", "it", "want", "like", "something", "give", "find",
+    "make", "let's", "lets", "minutes", "min", "mins", "under", "less", "than", "jeg", "vi",
+    "meg", "oss", "takk", "oppskrifter", "retter", "mat", "noe", "med", "og", "til", "minutter",
+    "show", "only", "just", "which", "filter", "are", "is", "vis", "bare", "kun", "hvilke",
+    "de", "er", "som",
+}
+
+
+class LocalIntent(BaseModel):
+    """Result of the local classifier."""
+
+    intent: str  # "change_recipes" | "filter" | "question"
+    confidence: float
+    excluded: List[str] = []  # Negated ingredients ("no fish")
+    query: Optional[str] = None  # Ingredient asked for ("more chicken")
+    cuisines: List[str] = []
+    health_labels: List[str] = []
+    diet: List[str] = []
+    max_time: Optional[int] = None  # Minutes
+    negated: List[str] = []  # Rejected cuisines, labels or time limits ("not italian"), left to the LLM
+
+    def has_entities(self) -> bool:
+        return bool(
+            self.excluded or self.query or self.cuisines or self.health_labels
+            or self.diet or self.max_time
+        )
+
+
+def _find_phrases(text: str, lexicon: dict) -> List[tuple]:
+    """Return (start, end, value) for lexicon phrases in `text`, longest first."""
+    matches = []
+    taken = [False] * len(text)
+    for phrase in sorted(lexicon, key=len, reverse=True):
+        for match in re.finditer(rf"(?<![a-zæøå]){re.escape(phrase)}(?![a-zæøå])", text):
+            if not any(taken[match.start():match.end()]):
+                matches.append((match.start(), match.end(), lexicon[phrase]))
+                for i in range(match.start(), match.end()):
+                    taken[i] = True
+    return sorted(matches)
+
+
+def _is_negated(text: str, start: int) -> bool:
+    """True when a negation ends at most one word before `start`."""
+    return bool(re.search(rf"\b{NEGATIONS}\s+(?:\w+\s+)?$", text[:start]))
+
+
+def classify_intent(message: str) -> LocalIntent:
+    """
+    Classify a chat message with keyword and pattern rules.
+
+    Returns the intent, extracted entities and a confidence in [0, 1].
+    Questions never get high confidence because answering them needs the
+    LLM; messages with many unrecognised words are also marked uncertain.
+    Edamam can only exclude ingredients, so a negated cuisine, diet label or
+    time limit ("no italian", "ikke vegetar") keeps the confidence below the
+    local threshold instead of being applied as the opposite.
+    """
+    text = " ".join(re.sub(r"[^a-zæøå0-9' ]", " ", message.lower()).split())
+    result = LocalIntent(intent="question", confidence=0.3)
+    recognized: List[tuple] = []
+
+    for start, end, ingredient in _find_phrases(text, INGREDIENT_LEXICON):
+        recognized.append((start, end))
+        if _is_negated(text, start):
+            if ingredient not in result.excluded:
+                result.excluded.append(ingredient)
+        elif result.query is None:
+            result.query = ingredient
+
+    for lexicon, values in (
+        (CUISINE_LEXICON, result.cuisines),
+        (HEALTH_LEXICON, result.health_labels),
+        (DIET_LEXICON, result.diet),
+    ):
+        for start, end, value in _find_phrases(text, lexicon):
+            recognized.append((start, end))
+            if _is_negated(text, start):
+                result.negated.append(value)
+            elif value not in values:
+                values.append(value)
+
+    minutes = re.search(r"(?:under|less than|max|maks|within|innen|på)?\s*(\d{1,3})\s*(?:min|minutes|minutter|mins)\b", text)
+    quick = re.search(rf"\b(?:{'|'.join(QUICK_WORDS)})\b", text)
+    if minutes:
+        recognized.append(minutes.span())
+        if _is_negated(text, minutes.start()):
+            result.negated.append("time")
+        else:
+            result.max_time = int(minutes.group(1))
+    elif quick:
+        if _is_negated(text, quick.start()):
+            result.negated.append("time")
+        else:
+            result.max_time = QUICK_DEFAULT_MINUTES
+
+    is_filter = bool(re.search(FILTER_MARKERS, text))
+    is_change = bool(re.search(CHANGE_MARKERS, text)) or bool(result.excluded)
+    is_question = message.strip().endswith("?") or bool(re.search(QUESTION_WORDS, text))
+
+    # Words not explained by entities or markers make the message ambiguous
+    residual = text
+    for start, end in sorted(recognized, reverse=True):
+        residual = residual[:start] + " " + residual[end:]
+    residual = re.sub(rf"\b{NEGATIONS}\b|\b{CHANGE_MARKERS}", " ", residual)
+    unknown = [
+        word for word in residual.split()
+        if word not in FILLER_WORDS and word not in QUICK_WORDS and not word.isdigit()
+    ]
+
+    if not result.has_entities():
+        return result
+
+    if is_filter and not result.excluded and not result.query and not result.diet:
+        result.intent, result.confidence = "filter", 0.9
+    elif is_question and not is_filter:
+        result.intent, result.confidence = "question", 0.4
+        return result
+    elif not is_filter:
+        result.intent, result.confidence = "change_recipes", 0.9 if is_change else 0.8
+    else:
+        # Filter wording combined with a change request ("only ones without fish")
+        result.intent, result.confidence = "change_recipes", 0.6
+
+    result.confidence *= 0.85 ** len(unknown)
+    if result.negated:
+        result.confidence = min(result.confidence, 0.5)
+    return result
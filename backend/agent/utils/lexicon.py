@@ -0,0 +1,105 @@
+"""Norwegian/English allergen and dislike lexicon for custom preferences."""
+
+import re
+from typing import List
+
+# Phrase (lowercase, Norwegian or English) -> Edamam `excluded` ingredient
+INGREDIENT_LEXICON = {
+    # Nuts
+    "nøtter": "nuts", "nøtt": "nuts", "nøtte": "nuts", "nuts": "nuts", "nut": "nuts",
+    "tree nuts": "nuts", "tree nut": "nuts",
+    "peanøtter": "peanuts", "peanøtt": "peanuts", "peanøttsmør": "peanuts",
+    "peanuts": "peanuts", "peanut": "peanuts", "peanut butter": "peanuts",
+    "hasselnøtter": "hazelnuts", "hazelnuts": "hazelnuts",
+    "mandler": "almonds", "almonds": "almonds",
+    "valnøtter": "walnuts", "walnuts": "walnuts",
+    "cashewnøtter": "cashews", "cashew": "cashews", "cashews": "cashews",
+    # Dairy and eggs
+    "melk": "milk", "milk": "milk", "laktose": "milk", "lactose": "milk",
+    "melkeprodukter": "milk", "dairy": "milk",
+    "ost": "cheese", "cheese": "cheese", "fløte": "cream", "cream": "cream",
+    "smør": "butter", "butter": "butter",
+    "egg": "egg", "eggs": "egg",
+    # Gluten
+    "gluten": "wheat", "hvete": "wheat", "wheat": "wheat",
+    # Fish and shellfish
+    "fisk": "fish", "fiske": "fish", "fish": "fish", "laks": "salmon", "salmon": "salmon",
+    "skalldyr": "shellfish", "shellfish": "shellfish",
+    "reker": "shrimp", "reke": "shrimp", "shrimp": "shrimp", "prawns": "shrimp",
+    "krabbe": "crab", "crab": "crab", "blåskjell": "mussels", "mussels": "mussels",
+    # Other allergens
+    "soya": "soy", "soy": "soy", "sesam": "sesame", "sesame": "sesame",
+    "selleri": "celery", "celery": "celery", "sennep": "mustard", "mustard": "mustard",
+    # Meat
+    "svinekjøtt": "pork", "svin": "pork", "pork": "pork",
+    "storfekjøtt": "beef", "biff": "beef", "beef": "beef",
+    "kylling": "chicken", "chicken": "chicken", "lam": "lamb", "lamb": "lamb",
+    # Vegetables and common dislikes
+    "sopp": "mushrooms", "mushroom": "mushrooms", "mushrooms": "mushrooms",
+    "brokkoli": "broccoli", "broccoli": "broccoli",
+    "rosenkål": "brussels sprouts", "brussels sprouts": "brussels sprouts",
+    "hvitløk": "garlic", "garlic": "garlic",
+    "løk": "onion", "onion": "onion", "onions": "onion",
+    "koriander": "cilantro", "cilantro": "cilantro", "coriander": "cilantro",
+    "tomat": "tomato", "tomater": "tomato", "tomato": "tomato", "tomatoes": "tomato",
+    "paprika": "bell pepper", "bell pepper": "bell pepper",
+    "oliven": "olives", "olives": "olives", "kokos": "coconut", "coconut": "coconut",
+    "chili": "chili", "aubergine": "eggplant", "eggplant": "eggplant",
+}
+
+# Words that mark a preference as something the user wants rather than avoids
+POSITIVE_MARKERS = {"love", "loves", "like", "likes", "prefer", "prefers", "elsker", "liker", "foretrekker"}
+NEGATIVE_MARKERS = {
+    "not", "no", "don't", "dont", "doesn't", "doesnt", "hate", "hates", "dislike", "dislikes",
+    "allergic", "allergy", "intolerant", "avoid", "without", "never",
+    "ikke", "allergisk", "allergi", "intoleranse", "fri", "uten", "hater", "unngå", "tåler", "aldri",
+}
+
+# Norwegian compound suffixes split off before matching ("laktoseintolerant")
+COMPOUND_SUFFIXES = ("intoleranse", "intolerant", "allergisk", "allergi", "fri")
+
+# Short free-text preferences (e.g. "garlic") are taken as an ingredient
+# name even if they are not in the lexicon; longer sentences are not.
+MAX_BARE_INGREDIENT_WORDS = 2
+
+_WORD = r"[a-zæøå']"
+
+
+def _normalize(text: str) -> str:
+    words = []
+    for word in re.sub(r"[^a-zæøå' ]", " ", text.lower()).split():
+        for suffix in COMPOUND_SUFFIXES:
+            if word.endswith(suffix) and len(word) > len(suffix):
+                word = f"{word[:-len(suffix)]} {suffix}"
+                break
+        words.append(word)
+    return " ".join(words)
+
+
+def extract_excluded_ingredients(preference: str) -> List[str]:
+    """
+    Extract Edamam `excluded` ingredients from one free-text preference.
+
+    "er allergisk mot nøtter" -> ["nuts"], "doesn't like broccoli" ->
+    ["broccoli"], "garlic" -> ["garlic"]. Preferences that express a liking,
+    or long sentences with no known ingredient, yield nothing.
+    """
+    text = _normalize(preference)
+    words = set(text.split())
+    if not text or (words & POSITIVE_MARKERS and not words & NEGATIVE_MARKERS):
+        return []
+
+    found: List[str] = []
+    remaining = text
+    # Longest phrases first so "peanut butter" wins over "butter"
+    for phrase in sorted(INGREDIENT_LEXICON, key=len, reverse=True):
+        pattern = rf"(?<!{_WORD}){re.escape(phrase)}(?!{_WORD})"
+        if re.search(pattern, remaining):
+            ingredient = INGREDIENT_LEXICON[phrase]
+            if ingredient not in found:
+                found.append(ingredient)
+            remaining = re.sub(pattern, " ", remaining)
+
+    if not found and len(text.split()) <= MAX_BARE_INGREDIENT_WORDS and not words & NEGATIVE_MARKERS:
+        found.append(text)
+    return found
@@ -0,0 +1,122 @@
+"""Helpers for calling LLMs from graph nodes without blocking the event loop."""
+
+import asyncio
+import time
+from typing import Awaitable, Callable, List, Optional
+from langchain_core.callbacks import get_usage_metadata_callback
+from langchain_core.messages import BaseMessage
+from agent.utils.prompts import count_message_tokens
+from app.config import settings
+from app.services.metrics import metrics
+from app.services.resilience import DeadlineExceeded
+
+
+def new_deadline(seconds: Optional[float] = None) -> float:
+    """Absolute deadline (epoch seconds) for a request starting now."""
+    return time.time() + (seconds or settings.REQUEST_DEADLINE_SECONDS)
+
+
+def remaining_seconds(deadline: Optional[float]) -> Optional[float]:
+    return None if deadline is None else deadline - time.time()
+
+
+async def _hedged(call: Callable[[], Awaitable], delay: float, node: str):
+    """
+    Send the request made by `call`; if it has not answered after `delay`
+    seconds, send a duplicate and return whichever finishes first. The
+    loser is cancelled.
+    """
+    first = asyncio.ensure_future(call())
+    pending = {first}
+    try:
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if done:
+            return first.result()
+
+        print(f"[{node}] LLM slower than {delay:.2f}s, hedging")
+        metrics.increment("llm_hedges", node=node)
+        second = asyncio.ensure_future(call())
+        pending.add(second)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    metrics.increment("llm_hedge_wins", node=node, winner="hedge" if task is second else "original")
+                    return task.result()
+        # Both failed: surface the original request's error
+        return first.result()
+    finally:
+        # Also runs when the caller times out or is cancelled
+        for task in pending:
+            task.cancel()
+
+
+async def ainvoke_llm(
+    llm,
+    messages: List[BaseMessage],
+    timeout: Optional[float] = None,
+    node: Optional[str] = None,
+    deadline: Optional[float] = None,
+):
+    """
+    Await an LLM call with a per-call timeout.
+
+    Raises asyncio.TimeoutError when the call takes longer than `timeout`
+    (default LLM_TIMEOUT) or runs past `deadline` (epoch seconds, from
+    GraphState). With less than LLM_MIN_REMAINING_SECONDS before the
+    deadline the call is not made and DeadlineExceeded is raised, so the
+    node falls back to its local result. Cancellation of the calling task
+    (e.g. a client disconnect) propagates into the underlying HTTP request.
+
+    With LLM_HEDGE_ENABLED, a duplicate request is sent once the call takes
+    longer than the node's recent p95 latency.
+
+    When `node` is given, the prompt is checked against the node's entry in
+    PROMPT_TOKEN_BUDGETS and prompt/completion token usage is logged. Every
+    call is recorded as an "llm.call" span with token counts.
+    """
+    node_label = node or "other"
+    timeout = timeout or settings.LLM_TIMEOUT
+    remaining = remaining_seconds(deadline)
+    if remaining is not None:
+        if remaining < settings.LLM_MIN_REMAINING_SECONDS:
+            metrics.increment("llm_deadline_skips", node=node_label)
+            raise DeadlineExceeded(f"{remaining:.2f}s left before the request deadline")
+        timeout = min(timeout, remaining)
+
+    estimated = count_message_tokens(messages)
+    budget = settings.PROMPT_TOKEN_BUDGETS.get(node)
+    if budget and estimated > budget:
+        print(f"[{node}] Prompt of ~{estimated} tokens exceeds budget of {budget}")
+
+    def call():
+        return llm.ainvoke(messages)
+
+    if settings.LLM_HEDGE_ENABLED:
+        p95_ms = metrics.percentile(
+            "llm.call_duration_ms", 95, min_count=settings.LLM_HEDGE_MIN_SAMPLES, node=node_label
+        )
+        delay = p95_ms / 1000 if p95_ms is not None else settings.LLM_HEDGE_DEFAULT_DELAY
+        request = _hedged(call, delay, node_label)
+    else:
+        request = call()
+
+    with metrics.span("llm.call", node=node_label) as span:
+        with get_usage_metadata_callback() as usage:
+            response = await asyncio.wait_for(request, timeout=timeout)
+        prompt_tokens = sum(u.get("input_tokens", 0) for u in usage.usage_metadata.values())
+        completion_tokens = sum(u.get("output_tokens", 0) for u in usage.usage_metadata.values())
+        span.set(
+            prompt_tokens=prompt_tokens or estimated,
+            prompt_tokens_estimated=not prompt_tokens,
+            completion_tokens=completion_tokens,
+        )
+    metrics.increment("llm_prompt_tokens", prompt_tokens or estimated, node=node_label)
+    metrics.increment("llm_completion_tokens", completion_tokens, node=node_label)
+
+    if node is not None:
+        print(
+            f"[{node}] Tokens: prompt={prompt_tokens or f'~{estimated}'} "
+            f"completion={completion_tokens}"
+        )
+    return response
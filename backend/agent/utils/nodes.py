@@ -1,41 +1,41 @@
 """Node functions for the LangGraph agent."""
 
+import copy
+import hashlib
 import random
 import json
 from typing import List, Dict, Any, Optional
 from agent.utils.state import GraphState
 from agent.utils.tools import search_edamam_recipes
-from langchain_openai import ChatOpenAI
+from agent.utils.search import fan_out_search, search_params_key, time_range
+from agent.utils.llm import ainvoke_llm
+from agent.utils.params import build_search_params
+from agent.utils.diversity import select_diverse
+from agent.utils.intent import LocalIntent, classify_intent
+from agent.utils.filters import RecipeFilter
+from agent.utils.schemas import RefinementDecision
+from agent.utils.stream import emit
+from agent.utils.prompts import count_tokens, fit_recipes
 from langchain_core.messages import HumanMessage, SystemMessage
 from app.config import settings
+from app.services.llm_registry import llm_registry
+from app.services.cache import TTLCache
+from app.services.metrics import metrics
+from app.services.recipe_store import recipe_store
 
 
-async def construct_search_query(
-    family_info: str,
-    diet_labels: List[str],
-    excluded_ingredients: List[str],
-    custom_preferences: List[str],
-    user_message: Optional[str] = None
-) -> Dict[str, Any]:
-    """
-    Use GPT to intelligently construct Edamam search parameters.
-
-    Analyzes family preferences and optional user message to decide
-    which Edamam parameters to use for optimal recipe search.
+# Bump when the construct_search_query prompt changes so cached params are not reused
+SEARCH_QUERY_PROMPT_VERSION = 1
 
-    Args:
-        family_info: Formatted string with family member preferences
-        diet_labels: Health labels from user profiles (e.g., ["vegan", "gluten-free"])
-        excluded_ingredients: Ingredients to exclude (from customPreferences)
-        custom_preferences: User custom preferences/allergies
-        user_message: Optional user request (e.g., "find me fish recipes", "quick italian dinner")
+# GPT-constructed search params keyed on preference fingerprint + message
+search_query_cache = TTLCache(
+    max_entries=settings.SEARCH_QUERY_CACHE_MAX_ENTRIES,
+    ttl=settings.SEARCH_QUERY_CACHE_TTL_SECONDS,
+)
 
-    Returns:
-        Dictionary with Edamam search parameters
-    """
-    llm = ChatOpenAI(model=settings.OPENAI_MODEL, temperature=0.3)
-
-    system_prompt = """You are an expert at constructing recipe search queries for the Edamam Recipe API.
+# System prompts are static (per-call data goes in the user message), so they
+# are built once and form a stable, cacheable prompt prefix
+SEARCH_QUERY_SYSTEM_PROMPT = """You are an expert at constructing recipe search queries for the Edamam Recipe API.
 
 Your task: Analyze family dietary preferences and user requests, then construct optimal Edamam search parameters.
 
@@ -123,6 +123,124 @@ Respond with JSON ONLY:
     "time": "range or null"
 }"""
 
+SELECTION_SYSTEM_PROMPT = """You are a meal planning assistant helping users find diverse and interesting recipes.
+
+Your task: Select at least 9 recipes (or all available if fewer than 9) from the provided list.
+Recipes are given as a table, one per line: i|name|cuisine|dish|meal|min|kcal/serving
+
+Selection strategy (smart 70% + random 30%):
+- SMART SELECTION (~7 recipes): Maximize variety in:
+  * Cuisine types (Italian, Asian, Mexican, American, Mediterranean, etc.)
+  * Protein sources (chicken, beef, fish, vegetarian, vegan)
+  * Cooking times (quick 15-30min meals AND elaborate 60+ min dishes)
+  * Dish types (soups, salads, mains, sides, appetizers)
+  * Respect all dietary restrictions and preferences
+
+- RANDOM ELEMENT (~2-3 recipes): Include some unexpected but valid options for discovery
+  * Pick interesting/unusual recipes that still meet dietary needs
+  * Add element of surprise and variety
+
+IMPORTANT:
+- Select AT LEAST 9 recipes (if available)
+- If there are fewer than 9 recipes total, select ALL of them
+- Avoid selecting very similar recipes (e.g., don't pick 4 pasta dishes)
+
+Respond with ONLY a JSON array of indices, like: [0, 3, 5, 8, 12, 15, 18, 21, 25]"""
+
+REFINEMENT_SYSTEM_PROMPT = """You are a helpful meal planning assistant. The user is chatting about their recipe suggestions.
+Recipes are given as a table, one per line: i|name|cuisine|dish|meal|min|kcal/serving
+
+Analyze the user's message and detect their intent:
+
+1. "change_recipes" - User wants DIFFERENT recipes (trigger re-search):
+   Examples: "no fish", "I don't like broccoli", "make it healthier", "easier recipes", "more protein", "I hate pasta"
+   Return the COMPLETE search_params for the new search: start from the current parameters,
+   keep the family's health labels and excluded ingredients, and apply the user's change.
+
+2. "filter" - User wants to FILTER current recipes (no re-search):
+   Examples: "show only Italian", "which ones are vegetarian", "show me the quick meals"
+   Describe the filter as a predicate; it is evaluated over all recipes found.
+
+3. "question" - User is asking a QUESTION (no changes):
+   Examples: "how do I cook this?", "what's in dish #3?", "tell me about the pasta", "why did you choose these?"
+
+IMPORTANT:
+- Only use "change_recipes" if user explicitly wants different/new recipes
+- Use "question" if user is just asking about existing recipes
+- Use "filter" to narrow down current selection"""
+
+
+def search_query_cache_key(
+    family_info: str,
+    diet_labels: List[str],
+    excluded_ingredients: List[str],
+    custom_preferences: List[str],
+    user_message: Optional[str],
+) -> str:
+    """
+    Hash the inputs that determine construct_search_query's output.
+
+    family_info is part of the prompt (member names, per-member preferences
+    and a first message's request), so it is part of the key too.
+    """
+    fingerprint = {
+        "family": " ".join(family_info.lower().split()),
+        "diet_labels": sorted(label.lower() for label in diet_labels),
+        "excluded": sorted(item.lower() for item in excluded_ingredients),
+        "custom": sorted(pref.strip().lower() for pref in custom_preferences),
+        "message": " ".join(user_message.lower().split()) if user_message else None,
+        "prompt_version": SEARCH_QUERY_PROMPT_VERSION,
+        "model": settings.OPENAI_MODEL,
+    }
+    return hashlib.sha256(json.dumps(fingerprint, sort_keys=True).encode()).hexdigest()
+
+
+async def construct_search_query(
+    family_info: str,
+    diet_labels: List[str],
+    excluded_ingredients: List[str],
+    custom_preferences: List[str],
+    user_message: Optional[str] = None,
+    deadline: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Use GPT to intelligently construct Edamam search parameters.
+
+    Analyzes family preferences and optional user message to decide
+    which Edamam parameters to use for optimal recipe search.
+
+    Without a user message (and DETERMINISTIC_INITIAL_SEARCH enabled) the
+    parameters come from the local rule table in build_search_params instead.
+
+    Args:
+        family_info: Formatted string with family member preferences
+        diet_labels: Health labels from user profiles (e.g., ["vegan", "gluten-free"])
+        excluded_ingredients: Ingredients to exclude (from customPreferences)
+        custom_preferences: User custom preferences/allergies
+        user_message: Optional user request (e.g., "find me fish recipes", "quick italian dinner")
+        deadline: Request deadline (epoch seconds); near it the rule table is used instead of GPT
+
+    Returns:
+        Dictionary with Edamam search parameters
+    """
+    if not user_message and settings.DETERMINISTIC_INITIAL_SEARCH:
+        # No free text to interpret: the rule table covers profile preferences
+        params = build_search_params(diet_labels, excluded_ingredients, custom_preferences)
+        print(f"[construct_search_query] Deterministic params: {params}")
+        return params
+
+    cache_key = search_query_cache_key(
+        family_info, diet_labels, excluded_ingredients, custom_preferences, user_message
+    )
+    cached = search_query_cache.get(cache_key)
+    if cached is not None:
+        print(f"[construct_search_query] Cache hit: {cached}")
+        metrics.increment("search_query_cache", result="hit")
+        return copy.deepcopy(cached)
+    metrics.increment("search_query_cache", result="miss")
+
+    llm = llm_registry.get(temperature=0.3)
+
     if user_message:
         user_prompt = f"""{family_info}
 
@@ -148,7 +266,7 @@ Construct optimal Edamam search parameters for general meal discovery."""
 
     try:
         messages = [
-            SystemMessage(content=system_prompt),
+            SystemMessage(content=SEARCH_QUERY_SYSTEM_PROMPT),
             HumanMessage(content=user_prompt),
         ]
 
@@ -158,7 +276,9 @@ Construct optimal Edamam search parameters for general meal discovery."""
         print(f"  - custom_preferences: {custom_preferences}")
         print(f"  - user_message: {user_message}")
 
-        response = llm.invoke(messages)
+        response = await ainvoke_llm(
+            llm, messages, node="construct_search_query", deadline=deadline
+        )
         content = response.content.strip()
 
         print(f"[construct_search_query] GPT raw response: {content[:500]}")
@@ -175,6 +295,7 @@ Construct optimal Edamam search parameters for general meal discovery."""
         cleaned_params = {k: v for k, v in params.items() if v is not None and v != ""}
 
         print(f"[construct_search_query] Final params: {cleaned_params}")
+        search_query_cache.set(cache_key, copy.deepcopy(cleaned_params))
         return cleaned_params
 
     except Exception as e:
@@ -182,27 +303,9 @@ Construct optimal Edamam search parameters for general meal discovery."""
         print(f"[construct_search_query] GPT failed, using fallback. Error: {e}")
         print(f"[construct_search_query] diet_labels: {diet_labels}")
 
-        # Separate health labels from diet labels
-        health_only = []
-        diet_only = []
-
-        for label in diet_labels:
-            label_lower = label.lower()
-            if label_lower in ["balanced", "high-fiber", "high-protein", "low-carb", "low-fat", "low-sodium"]:
-                diet_only.append(label)
-            else:
-                health_only.append(label)
-
-        fallback_params = {
-            "query": "recipe",
-        }
-
-        if health_only:
-            fallback_params["health_labels"] = health_only
-        if diet_only:
-            fallback_params["diet"] = diet_only
-        if excluded_ingredients:
-            fallback_params["excluded"] = excluded_ingredients
+        fallback_params = build_search_params(
+            diet_labels, excluded_ingredients, custom_preferences
+        )
 
         print(f"[construct_search_query] Fallback params: {fallback_params}")
         return fallback_params
@@ -215,8 +318,10 @@ async def select_diverse_recipes(state: GraphState) -> GraphState:
     The agent:
     1. Receives family member preferences from state
     2. Uses GPT to intelligently construct Edamam search parameters
-    3. Calls search_edamam_recipes tool to get ~30 recipes
-    4. Selects 9+ recipes with 70% smart variety + 30% random discovery
+    3. Calls search_edamam_recipes tool to get ~30 recipes (or fans out
+       several diversified queries when FANOUT_SEARCH_ENABLED is set)
+    4. Selects 9+ recipes with 70% smart variety + 30% random discovery,
+       locally (SELECTION_STRATEGY="local") or by asking GPT ("llm")
     5. Returns all recipes if fewer than 9 available
     """
     # Get family member info and preferences
@@ -227,102 +332,108 @@ async def select_diverse_recipes(state: GraphState) -> GraphState:
     current_message = state.get("current_message", None)
 
     # Check if agent should search (initial search or re-search)
-    # If all_recipes is empty, agent needs to search
-    should_search = len(state.get("all_recipes", [])) == 0
+    # If all_recipe_uris is empty, agent needs to search
+    should_search = len(state.get("all_recipe_uris", [])) == 0
 
     if not should_search:
         # Already have recipes, just select from them
-        all_recipes = state["all_recipes"]
+        all_uris = state["all_recipe_uris"]
     else:
         # Agent needs to search Edamam API
         # Use GPT to intelligently construct search parameters
         try:
-            search_params = await construct_search_query(
+            # Params already set by the local intent fast path are reused
+            search_params = state.get("search_params") or await construct_search_query(
                 family_info=family_info,
                 diet_labels=diet_labels,
                 excluded_ingredients=excluded_ingredients,
                 custom_preferences=custom_preferences,
-                user_message=current_message
+                user_message=current_message,
+                deadline=state.get("deadline"),
             )
 
             print(f"[select_diverse_recipes] Search params: {search_params}")
             print(f"[select_diverse_recipes] User message: {current_message}")
 
-            all_recipes = await search_edamam_recipes.ainvoke({
-                **search_params,
-                "max_results": 30
-            })
-
-            print(f"[select_diverse_recipes] Received {len(all_recipes)} recipes from Edamam")
-            state["all_recipes"] = all_recipes
+            prefetched = state.get("prefetched", {}).get(search_params_key(search_params))
+            if prefetched:
+                print(f"[select_diverse_recipes] Using {len(prefetched)} prefetched recipes")
+                all_uris = prefetched
+                emit("candidates", recipes=recipe_store.views(all_uris))
+            elif settings.FANOUT_SEARCH_ENABLED:
+                # fan_out_search emits candidates per query
+                all_uris = await fan_out_search(
+                    search_params,
+                    num_queries=settings.FANOUT_QUERIES,
+                    max_results=settings.MAX_RECIPES_FETCH,
+                    deadline=state.get("deadline"),
+                )
+            else:
+                all_uris = await search_edamam_recipes.ainvoke({
+                    **search_params,
+                    "max_results": 30,
+                    "deadline": state.get("deadline"),
+                })
+                emit("candidates", recipes=recipe_store.views(all_uris))
+
+            print(f"[select_diverse_recipes] Received {len(all_uris)} recipes from Edamam")
+            state["all_recipe_uris"] = all_uris
+            state["search_params"] = search_params
         except Exception as e:
             print(f"[select_diverse_recipes] Error during search: {e}")
-            state["all_recipes"] = []
-            state["selected_recipes"] = []
+            state["all_recipe_uris"] = []
+            state["selected_recipe_uris"] = []
             return state
 
     # If no recipes found, return empty
-    if not all_recipes:
-        state["selected_recipes"] = []
+    if not all_uris:
+        state["selected_recipe_uris"] = []
         return state
 
     # If fewer than 9 recipes, return all of them
-    if len(all_recipes) <= 9:
-        state["selected_recipes"] = all_recipes
+    if len(all_uris) <= 9:
+        state["selected_recipe_uris"] = list(all_uris)
         return state
 
-    # Agent selects 9+ recipes with variety
-    llm = ChatOpenAI(model=settings.OPENAI_MODEL, temperature=0.7)
-
-    # Create recipe summaries for the agent
-    recipe_summaries = []
-    for i, recipe in enumerate(all_recipes):
-        summary = {
-            "index": i,
-            "name": recipe.get("label", "Unknown"),
-            "cuisine": recipe.get("cuisineType", []),
-            "dish_type": recipe.get("dishType", []),
-            "meal_type": recipe.get("mealType", []),
-            "cooking_time": recipe.get("totalTime", 0),
-            "calories": recipe.get("calories", 0),
-        }
-        recipe_summaries.append(summary)
-
-    # Build system prompt with family info
-    system_prompt = f"""You are a meal planning assistant helping users find diverse and interesting recipes.
-
-{family_info}
-
-Your task: Select at least 9 recipes (or all available if fewer than 9) from the provided list.
-
-Selection strategy (smart 70% + random 30%):
-- SMART SELECTION (~7 recipes): Maximize variety in:
-  * Cuisine types (Italian, Asian, Mexican, American, Mediterranean, etc.)
-  * Protein sources (chicken, beef, fish, vegetarian, vegan)
-  * Cooking times (quick 15-30min meals AND elaborate 60+ min dishes)
-  * Dish types (soups, salads, mains, sides, appetizers)
-  * Respect all dietary restrictions and preferences
-
-- RANDOM ELEMENT (~2-3 recipes): Include some unexpected but valid options for discovery
-  * Pick interesting/unusual recipes that still meet dietary needs
-  * Add element of surprise and variety
-
-IMPORTANT:
-- Select AT LEAST 9 recipes (if available)
-- If there are fewer than 9 recipes total, select ALL of them
-- Avoid selecting very similar recipes (e.g., don't pick 4 pasta dishes)
-
-Respond with ONLY a JSON array of indices, like: [0, 3, 5, 8, 12, 15, 18, 21, 25]"""
+    all_recipes = recipe_store.views(all_uris)
+    all_uris = [recipe["uri"] for recipe in all_recipes]  # Aligned with the views
+
+    if settings.SELECTION_STRATEGY == "local":
+        # Feature-based max-coverage selection plus seeded random discovery
+        indices = select_diverse(
+            all_recipes,
+            k=9,
+            discovery_share=settings.SELECTION_DISCOVERY_SHARE,
+            seed=settings.SELECTION_SEED,
+        )
+        state["selected_recipe_uris"] = [all_uris[i] for i in indices]
+        return state
 
-    user_prompt = f"Here are {len(recipe_summaries)} recipes to choose from:\n\n{json.dumps(recipe_summaries, indent=2)}\n\nSelect at least 9 diverse recipes (or all if fewer than 9) and return their indices as a JSON array."
+    # Agent selects 9+ recipes with variety
+    llm = llm_registry.get(temperature=0.7)
+
+    # Family info goes in the user message so the system prompt stays static
+    user_prompt_head = f"{family_info}\n\n"
+    user_prompt_tail = (
+        "\n\nSelect at least 9 diverse recipes (or all if fewer than 9) "
+        "and return their indices as a JSON array."
+    )
+    table, included = fit_recipes(
+        all_recipes,
+        budget=settings.PROMPT_TOKEN_BUDGETS["select_diverse_recipes"],
+        used=count_tokens(SELECTION_SYSTEM_PROMPT + user_prompt_head + user_prompt_tail) + 20,
+    )
+    user_prompt = f"{user_prompt_head}Here are {included} recipes to choose from:\n{table}{user_prompt_tail}"
 
     try:
         messages = [
-            SystemMessage(content=system_prompt),
+            SystemMessage(content=SELECTION_SYSTEM_PROMPT),
             HumanMessage(content=user_prompt),
         ]
 
-        response = llm.invoke(messages)
+        response = await ainvoke_llm(
+            llm, messages, node="select_diverse_recipes", deadline=state.get("deadline")
+        )
         content = response.content.strip()
 
         # Parse indices
@@ -337,8 +448,8 @@ Respond with ONLY a JSON array of indices, like: [0, 3, 5, 8, 12, 15, 18, 21, 25
         # Validate and get selected recipes
         selected = []
         for idx in selected_indices:
-            if 0 <= idx < len(all_recipes):
-                selected.append(all_recipes[idx])
+            if 0 <= idx < included:
+                selected.append(all_uris[idx])
 
         # Ensure we have at least 9 (or all if fewer available)
         min_required = min(9, len(all_recipes))
@@ -348,15 +459,110 @@ Respond with ONLY a JSON array of indices, like: [0, 3, 5, 8, 12, 15, 18, 21, 25
             needed = min_required - len(selected)
             if needed > 0 and remaining_indices:
                 additional = random.sample(remaining_indices, min(needed, len(remaining_indices)))
-                selected.extend([all_recipes[i] for i in additional])
+                selected.extend([all_uris[i] for i in additional])
 
-        state["selected_recipes"] = selected
+        state["selected_recipe_uris"] = selected
 
     except Exception:
         # Fallback: randomly select 9 recipes (or all if fewer)
         num_to_select = min(9, len(all_recipes))
-        state["selected_recipes"] = random.sample(all_recipes, num_to_select)
+        state["selected_recipe_uris"] = random.sample(all_uris, num_to_select)
+
+    return state
+
+
+def _describe_intent(local: LocalIntent) -> str:
+    parts = [*local.cuisines, *local.health_labels, *local.diet]
+    if local.query:
+        parts.append(f"with {local.query}")
+    if local.excluded:
+        parts.append(f"without {', '.join(local.excluded)}")
+    if local.max_time:
+        parts.append(f"under {local.max_time} minutes")
+    return " ".join(parts)
+
 
+def apply_recipe_filter(state: GraphState, recipe_filter: RecipeFilter) -> int:
+    """
+    Evaluate `recipe_filter` over all recipes of the session.
+
+    Matching recipes become the selection (diversified down to 9 when more
+    match); with no match the current selection is kept. Returns the number
+    of matching recipes.
+    """
+    recipes = recipe_store.views(state.get("all_recipe_uris") or state.get("selected_recipe_uris", []))
+    indices = recipe_filter.apply(recipes)
+    print(f"[apply_recipe_filter] {recipe_filter.describe()}: {len(indices)}/{len(recipes)} match")
+    if not indices:
+        return 0
+
+    matching = [recipes[i] for i in indices]
+    if len(matching) > 9:
+        picks = select_diverse(
+            matching,
+            k=9,
+            discovery_share=settings.SELECTION_DISCOVERY_SHARE,
+            seed=settings.SELECTION_SEED,
+        )
+        matching = [matching[i] for i in picks]
+    state["selected_recipe_uris"] = [recipe["uri"] for recipe in matching]
+    return len(indices)
+
+
+def apply_local_intent(state: GraphState, local: LocalIntent) -> GraphState:
+    """
+    Apply a confidently classified chat message without calling GPT.
+
+    "change_recipes" extends the previous search parameters and triggers a
+    re-search; "filter" runs a RecipeFilter over the session's recipes.
+    """
+    description = _describe_intent(local)
+
+    if local.intent == "filter":
+        state["action"] = "filter"
+        recipe_filter = RecipeFilter(
+            cuisines=local.cuisines,
+            health_labels=local.health_labels,
+            max_time=local.max_time,
+        )
+        if apply_recipe_filter(state, recipe_filter):
+            count = len(state["selected_recipe_uris"])
+            state["agent_response"] = f"Here are {count} recipes that are {description}."
+        else:
+            state["agent_response"] = (
+                f"None of the current recipes are {description}. "
+                "Ask me for new recipes if you want me to search again."
+            )
+        return state
+
+    search_params = copy.deepcopy(state.get("search_params") or build_search_params(
+        state.get("diet_labels", []),
+        state.get("excluded_ingredients", []),
+        state.get("custom_preferences", []),
+    ))
+    for key, values in (
+        ("excluded", local.excluded),
+        ("health_labels", local.health_labels),
+        ("diet", local.diet),
+    ):
+        merged = search_params.get(key, [])
+        search_params[key] = merged + [v for v in values if v not in merged]
+        if not search_params[key]:
+            del search_params[key]
+    if local.query:
+        search_params["query"] = local.query
+    if local.cuisines:
+        search_params["cuisine_type"] = local.cuisines
+    if local.max_time:
+        search_params["time"] = time_range(local.max_time)
+
+    state["action"] = "re_search"
+    state["all_recipe_uris"] = []
+    state["selected_recipe_uris"] = []
+    state["search_params"] = search_params
+    existing = state.get("excluded_ingredients", [])
+    state["excluded_ingredients"] = existing + [i for i in local.excluded if i not in existing]
+    state["agent_response"] = f"Sure! Let me find new recipes {description}."
     return state
 
 
@@ -371,97 +577,85 @@ async def handle_chat_refinement(state: GraphState) -> GraphState:
     """
     current_message = state.get("current_message", "")
     chat_history = state.get("chat_history", [])
-    selected_recipes = state.get("selected_recipes", [])
+    selected_uris = state.get("selected_recipe_uris", [])
+    all_uris = state.get("all_recipe_uris") or selected_uris
     family_info = state.get("family_members_info", "")
 
     if not current_message:
         return state
 
-    # Initialize LLM
-    llm = ChatOpenAI(model=settings.OPENAI_MODEL, temperature=0.7)
-
-    # Build context with current recipes
-    recipe_summaries = [
-        {
-            "index": i,
-            "name": r.get("label", ""),
-            "cuisine": r.get("cuisineType", []),
-            "dish_type": r.get("dishType", []),
-            "calories": r.get("calories", 0),
-            "time": r.get("totalTime", 0),
-        }
-        for i, r in enumerate(selected_recipes)
-    ]
-
-    system_prompt = f"""You are a helpful meal planning assistant. The user is chatting about their recipe suggestions.
-
-{family_info}
-
-Current selected recipes: {len(selected_recipes)} recipes
-
-Analyze the user's message and detect their intent:
-
-1. "change_recipes" - User wants DIFFERENT recipes (trigger re-search):
-   Examples: "no fish", "I don't like broccoli", "make it healthier", "easier recipes", "more protein", "I hate pasta"
-
-2. "filter" - User wants to FILTER current recipes (no re-search):
-   Examples: "show only Italian", "which ones are vegetarian", "show me the quick meals"
-
-3. "question" - User is asking a QUESTION (no changes):
-   Examples: "how do I cook this?", "what's in dish #3?", "tell me about the pasta", "why did you choose these?"
-
-Respond in JSON format:
-{{
-    "intent": "change_recipes" or "filter" or "question",
-    "response": "Your helpful message to the user",
-    "selected_indices": [indices if filtering],
-    "search_params": {{health_labels: [], excluded: [], query: ""}} if re-searching
-}}
-
-IMPORTANT:
-- Only use "change_recipes" if user explicitly wants different/new recipes
-- Use "question" if user is just asking about existing recipes
-- Use "filter" to narrow down current selection"""
-
-    user_prompt = f"""Current recipes: {json.dumps(recipe_summaries, indent=2)}
+    # Clear-cut refinements ("no fish", "show only italian") skip GPT; the
+    # local intent is also the fallback when GPT fails or the deadline is near
+    local = classify_intent(current_message)
+    if settings.LOCAL_INTENT_ENABLED:
+        print(f"[handle_chat_refinement] Local intent: {local.intent} ({local.confidence:.2f})")
+        if local.intent != "question" and local.confidence >= settings.INTENT_CONFIDENCE_THRESHOLD:
+            emit("intent", intent=local.intent, source="local", confidence=local.confidence)
+            metrics.increment("chat_intent", intent=local.intent, source="local")
+            return apply_local_intent(state, local)
+
+    # One structured round trip returns intent, reply and full search params
+    llm = llm_registry.get(temperature=0.7).with_structured_output(
+        RefinementDecision, method="function_calling"
+    )
+
+    current_params = state.get("search_params") or build_search_params(
+        state.get("diet_labels", []),
+        state.get("excluded_ingredients", []),
+        state.get("custom_preferences", []),
+    )
+    recent_chat = "\n".join(
+        f"{m.get('role', '?')}: {m.get('content', '')}" for m in chat_history[-3:]
+    ) or "None"
+    # Requests older than the history window, kept as a short rolling summary
+    chat_summary = state.get("chat_summary")
+    earlier_chat = f"\n\nEarlier requests: {chat_summary}" if chat_summary else ""
+
+    user_prompt_head = f"""{family_info}
+
+Current Edamam search parameters: {json.dumps(current_params, separators=(",", ":"))}
+All recipes found: {len(all_uris)} (filters are evaluated over all of them)
+"""
+    user_prompt_tail = f"""
 
 User message: "{current_message}"
 
-Recent chat: {chat_history[-3:] if len(chat_history) > 0 else "None"}
+Recent chat:
+{recent_chat}{earlier_chat}
 
 What is the user's intent and how should I respond?"""
+    selected_recipes = recipe_store.views(selected_uris)
+    table, included = fit_recipes(
+        selected_recipes,
+        budget=settings.PROMPT_TOKEN_BUDGETS["handle_chat_refinement"],
+        used=count_tokens(REFINEMENT_SYSTEM_PROMPT + user_prompt_head + user_prompt_tail) + 20,
+    )
+    user_prompt = f"{user_prompt_head}Current selected recipes ({included} of {len(selected_recipes)}):\n{table}{user_prompt_tail}"
 
     try:
         messages = [
-            SystemMessage(content=system_prompt),
+            SystemMessage(content=REFINEMENT_SYSTEM_PROMPT),
             HumanMessage(content=user_prompt),
         ]
 
-        response = llm.invoke(messages)
-        content = response.content.strip()
+        decision: RefinementDecision = await ainvoke_llm(
+            llm, messages, node="handle_chat_refinement", deadline=state.get("deadline")
+        )
+        state["agent_response"] = decision.response
+        emit("intent", intent=decision.intent, source="llm")
+        metrics.increment("chat_intent", intent=decision.intent, source="llm")
 
-        # Handle JSON extraction
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0].strip()
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0].strip()
-
-        agent_decision = json.loads(content)
-
-        intent = agent_decision.get("intent", "question")
-        agent_response = agent_decision.get("response", "I understand your request.")
-
-        state["agent_response"] = agent_response
-
-        if intent == "change_recipes":
+        if decision.intent == "change_recipes":
             # User wants different recipes - trigger re-search
             state["action"] = "re_search"
-            state["all_recipes"] = []
-            state["selected_recipes"] = []
-
-            # Extract search parameters if provided
-            search_params = agent_decision.get("search_params", {})
-            if search_params:
+            state["all_recipe_uris"] = []
+            state["selected_recipe_uris"] = []
+            # select_diverse_recipes reuses these; empty params make it construct fresh ones
+            state["search_params"] = {}
+
+            if decision.search_params:
+                search_params = decision.search_params.to_search_params()
+                state["search_params"] = search_params
                 if "health_labels" in search_params:
                     state["diet_labels"] = search_params["health_labels"]
                 if "excluded" in search_params:
@@ -469,20 +663,27 @@ What is the user's intent and how should I respond?"""
                     new_excluded = search_params["excluded"]
                     state["excluded_ingredients"] = list(set(existing + new_excluded))
 
-        elif intent == "filter":
-            # Filter existing recipes
+        elif decision.intent == "filter":
+            # Evaluate the predicate locally over all recipes
             state["action"] = "filter"
-            indices = agent_decision.get("selected_indices", [])
-            if indices:
-                new_selected = [selected_recipes[i] for i in indices if 0 <= i < len(selected_recipes)]
-                if new_selected:
-                    state["selected_recipes"] = new_selected
+            recipe_filter = decision.filter or RecipeFilter()
+            if not recipe_filter.is_empty() and not apply_recipe_filter(state, recipe_filter):
+                state["agent_response"] = (
+                    f"None of the current recipes are {recipe_filter.describe()}, "
+                    "so I kept your selection."
+                )
 
         else:  # question
             # Just answer - no changes to recipes
             state["action"] = "question"
 
-    except Exception:
+    except Exception as e:
+        print(f"[handle_chat_refinement] Error: {e}")
+        if local.intent != "question" and local.has_entities():
+            print(f"[handle_chat_refinement] Falling back to local intent: {local.intent}")
+            emit("intent", intent=local.intent, source="local_fallback", confidence=local.confidence)
+            metrics.increment("chat_intent", intent=local.intent, source="local_fallback")
+            return apply_local_intent(state, local)
         state["action"] = "question"
         state["agent_response"] = "I understand. Let me help you with that."
 
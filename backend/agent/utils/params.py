@@ -0,0 +1,44 @@
+"""Deterministic Edamam search parameters for searches without a user message."""
+
+from typing import Any, Dict, List
+from agent.utils.lexicon import extract_excluded_ingredients
+from app.services.edamam_service import EdamamService
+
+
+def build_search_params(
+    diet_labels: List[str],
+    excluded_ingredients: List[str],
+    custom_preferences: List[str],
+) -> Dict[str, Any]:
+    """
+    Map profile preferences to Edamam parameters with a rule table.
+
+    Profile dietLabels are split into Edamam health and diet labels, and
+    allergens/dislikes are extracted from customPreferences with the local
+    Norwegian/English lexicon.
+    """
+    health_labels = []
+    diet = []
+    for label in diet_labels:
+        if label.lower() in EdamamService.VALID_DIET_LABELS:
+            diet.append(label)
+        else:
+            health_labels.append(label)
+
+    excluded = []
+    for ingredient in excluded_ingredients:
+        if ingredient not in excluded:
+            excluded.append(ingredient)
+    for preference in custom_preferences:
+        for ingredient in extract_excluded_ingredients(preference):
+            if ingredient not in excluded:
+                excluded.append(ingredient)
+
+    params: Dict[str, Any] = {"query": "recipe"}
+    if health_labels:
+        params["health_labels"] = health_labels
+    if diet:
+        params["diet"] = diet
+    if excluded:
+        params["excluded"] = excluded
+    return params
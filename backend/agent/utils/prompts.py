@@ -0,0 +1,108 @@
+"""Compact prompt encodings and token counting for agent LLM calls."""
+
+import threading
+import time
+from typing import List, Optional, Sequence, Tuple
+from langchain_core.messages import BaseMessage
+from app.config import settings
+
+
+# One line per recipe; columns are explained once in the header
+RECIPE_TABLE_HEADER = "i|name|cuisine|dish|meal|min|kcal/serving"
+MAX_NAME_CHARS = 48
+CHARS_PER_TOKEN = 4  # Fallback estimate when tiktoken is unavailable
+MESSAGE_OVERHEAD_TOKENS = 4  # Role and separators per chat message
+
+
+def _join(values: Sequence[str], limit: int = 2) -> str:
+    return ",".join(v.lower() for v in values[:limit]) or "-"
+
+
+def recipe_row(index: int, recipe: dict) -> str:
+    """Encode one recipe as "3|Chicken Curry|indian|main course|lunch/dinner|45|520"."""
+    name = recipe.get("label", "?").replace("|", "/")[:MAX_NAME_CHARS]
+    servings = max(recipe.get("yield_servings") or 1, 1)
+    kcal = int(round(recipe.get("calories", 0) / servings, -1))
+    minutes = int(round(recipe.get("totalTime", 0)))
+    return "|".join([
+        str(index),
+        name,
+        _join(recipe.get("cuisineType", [])),
+        _join(recipe.get("dishType", [])),
+        _join(recipe.get("mealType", []), limit=1),
+        str(minutes) if minutes else "-",
+        str(kcal),
+    ])
+
+
+def encode_recipes(recipes: List[dict]) -> str:
+    """Encode recipes as a header line plus one row per recipe."""
+    return "\n".join([RECIPE_TABLE_HEADER] + [recipe_row(i, r) for i, r in enumerate(recipes)])
+
+
+_encoding = None  # tiktoken Encoding once loaded
+_load_started_at: Optional[float] = None
+ENCODING_RETRY_SECONDS = 300.0  # Wait between attempts after a failed load
+
+
+def load_encoding() -> bool:
+    """
+    Load the tiktoken encoding for the configured model; blocking.
+
+    tiktoken ships with langchain-openai but downloads its BPE file on
+    first use, which can hang or fail offline. The FastAPI lifespan runs
+    this in a thread; until it succeeds count_tokens estimates.
+    """
+    global _encoding, _load_started_at
+    _load_started_at = time.monotonic()
+    try:
+        import tiktoken
+        try:
+            _encoding = tiktoken.encoding_for_model(settings.OPENAI_MODEL)
+        except KeyError:
+            _encoding = tiktoken.get_encoding("o200k_base")
+        return True
+    except Exception as e:
+        print(f"[prompts] tiktoken unavailable, estimating tokens: {e}")
+        return False
+
+
+def count_tokens(text: str) -> int:
+    """
+    Number of tokens in `text` for the configured model.
+
+    Never blocks on loading the encoding: without it the count is estimated
+    and a load is retried in a background thread (at most every
+    ENCODING_RETRY_SECONDS).
+    """
+    global _load_started_at
+    encoding = _encoding
+    if encoding is None:
+        if _load_started_at is None or time.monotonic() - _load_started_at > ENCODING_RETRY_SECONDS:
+            _load_started_at = time.monotonic()
+            threading.Thread(target=load_encoding, name="tiktoken-load", daemon=True).start()
+        return len(text) // CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text))
+
+
+def count_message_tokens(messages: List[BaseMessage]) -> int:
+    return sum(count_tokens(str(m.content)) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def fit_recipes(recipes: List[dict], budget: int, used: int) -> Tuple[str, int]:
+    """
+    Encode as many recipes as fit in `budget - used` tokens.
+
+    Returns the table and the number of recipes included (rows keep their
+    original index, so included recipes are always a prefix).
+    """
+    lines = [RECIPE_TABLE_HEADER]
+    remaining = budget - used - count_tokens(RECIPE_TABLE_HEADER)
+    for i, recipe in enumerate(recipes):
+        row = recipe_row(i, recipe)
+        cost = count_tokens(row) + 1
+        if cost > remaining:
+            break
+        lines.append(row)
+        remaining -= cost
+    return "\n".join(lines), len(lines) - 1
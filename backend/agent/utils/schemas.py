@@ -0,0 +1,37 @@
+"""Structured-output schemas for LLM calls in the agent."""
+
+from typing import List, Literal, Optional
+from pydantic import BaseModel, Field
+from agent.utils.filters import RecipeFilter
+
+
+class EdamamSearchParams(BaseModel):
+    """Complete Edamam recipe search parameters (keyword arguments of search_edamam_recipes)."""
+
+    query: str = Field(description='Search text, e.g. "chicken curry"; "recipe" for a general search')
+    health_labels: Optional[List[str]] = Field(default=None, description='e.g. ["vegetarian", "dairy-free"]')
+    excluded: Optional[List[str]] = Field(default=None, description="Ingredients to exclude")
+    cuisine_type: Optional[List[str]] = Field(default=None, description='e.g. ["italian", "asian"]')
+    meal_type: Optional[List[str]] = Field(default=None, description='e.g. ["dinner"]')
+    dish_type: Optional[List[str]] = Field(default=None, description='e.g. ["main course"]')
+    diet: Optional[List[str]] = Field(default=None, description='e.g. ["high-protein", "low-carb"]')
+    ingr: Optional[str] = Field(default=None, description='Ingredient count range, e.g. "5-8"')
+    time: Optional[str] = Field(default=None, description='Total time range in minutes, e.g. "1-30"')
+
+    def to_search_params(self) -> dict:
+        """Drop unset fields so the params match construct_search_query output."""
+        return self.model_dump(exclude_none=True)
+
+
+class RefinementDecision(BaseModel):
+    """Intent, reply and follow-up parameters for one chat message."""
+
+    intent: Literal["change_recipes", "filter", "question"]
+    response: str = Field(description="Helpful message to the user")
+    filter: Optional[RecipeFilter] = Field(
+        default=None, description='Predicate over the current recipes when intent is "filter"'
+    )
+    search_params: Optional[EdamamSearchParams] = Field(
+        default=None,
+        description='Full parameters for the new search when intent is "change_recipes"',
+    )
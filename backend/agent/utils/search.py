@@ -0,0 +1,170 @@
+"""Recipe search helpers: fan-out queries and refinement prefetch variants."""
+
+import asyncio
+import json
+import random
+import re
+from typing import Any, Dict, List, Optional
+from agent.utils.intent import QUICK_DEFAULT_MINUTES
+from agent.utils.tools import search_edamam_recipes
+from agent.utils.stream import emit
+from app.services.recipe_store import recipe_store
+
+
+# Buckets used to diversify queries that do not already constrain them
+FANOUT_CUISINES = [
+    "italian", "asian", "mexican", "mediterranean",
+    "nordic", "american", "indian", "french", "middle eastern",
+]
+FANOUT_DISH_TYPES = ["main course", "soup", "salad", "starter", "side dish"]
+
+# Parameters accepted by search_edamam_recipes (besides max_results)
+SEARCH_PARAM_KEYS = {
+    "query", "health_labels", "excluded", "cuisine_type", "meal_type",
+    "dish_type", "diet", "ingr", "time",
+}
+
+
+def time_range(max_minutes: int) -> str:
+    """Edamam `time` value for recipes ready within `max_minutes`."""
+    return f"1-{max_minutes}"
+
+
+def search_params_key(search_params: Dict[str, Any]) -> str:
+    """
+    Canonical key for a set of search parameters.
+
+    Ignores unknown keys, empty values, case and list order, so equivalent
+    searches produced by different code paths map to the same key. A bare
+    maximum time ("30", as GPT tends to write it) is keyed as time_range(30).
+    """
+    normalized = {}
+    for key, value in search_params.items():
+        if key not in SEARCH_PARAM_KEYS or value in (None, "", []):
+            continue
+        if isinstance(value, list):
+            normalized[key] = sorted(str(v).lower() for v in value)
+        elif key == "time" and str(value).strip().isdigit():
+            normalized[key] = time_range(int(value))
+        else:
+            normalized[key] = str(value).lower()
+    return json.dumps(normalized, sort_keys=True)
+
+
+def build_prefetch_variants(search_params: Dict[str, Any], max_variants: int) -> List[Dict[str, Any]]:
+    """
+    Derive the refinements users most often ask for after a search.
+
+    In order of likelihood: quicker (QUICK_DEFAULT_MINUTES, what a local
+    "quicker" refinement asks for), vegetarian and italian. Variants that
+    would not change the search are skipped.
+    """
+    base = {k: v for k, v in search_params.items() if k in SEARCH_PARAM_KEYS}
+    variants = []
+
+    if not base.get("time"):
+        variants.append({**base, "time": time_range(QUICK_DEFAULT_MINUTES)})
+
+    health_labels = base.get("health_labels") or []
+    if not {"vegetarian", "vegan"} & {label.lower() for label in health_labels}:
+        variants.append({**base, "health_labels": health_labels + ["vegetarian"]})
+
+    if not base.get("cuisine_type"):
+        variants.append({**base, "cuisine_type": ["italian"]})
+
+    return variants[:max_variants]
+
+
+def normalize_label(label: str) -> str:
+    """Normalize a recipe label for near-duplicate detection."""
+    label = re.sub(r"[^a-z0-9 ]", " ", label.lower())
+    return " ".join(label.split())
+
+
+def build_fanout_variants(search_params: Dict[str, Any], num_queries: int) -> List[Dict[str, Any]]:
+    """
+    Derive diversified variants of a search.
+
+    The original parameters are always the first variant. The rest pin a
+    different cuisine each, or a different dish type if the user already
+    asked for a cuisine. If both are constrained, no variants are added.
+    """
+    variants = [dict(search_params)]
+    if num_queries <= 1:
+        return variants
+
+    if not search_params.get("cuisine_type"):
+        field, buckets = "cuisine_type", FANOUT_CUISINES
+    elif not search_params.get("dish_type"):
+        field, buckets = "dish_type", FANOUT_DISH_TYPES
+    else:
+        return variants
+
+    for bucket in random.sample(buckets, min(num_queries - 1, len(buckets))):
+        variants.append({**search_params, field: [bucket]})
+    return variants
+
+
+def merge_recipe_results(result_lists: List[List[str]], max_results: int) -> List[str]:
+    """
+    Merge lists of recipe URIs round-robin, dropping duplicates by URI and label.
+
+    Interleaving keeps the capped pool balanced across variants instead of
+    filling it from the first query.
+    """
+    merged: List[str] = []
+    seen_uris = set()
+    seen_labels = set()
+
+    longest = max((len(results) for results in result_lists), default=0)
+    for position in range(longest):
+        for results in result_lists:
+            if position >= len(results):
+                continue
+            uri = results[position]
+            recipe = recipe_store.view(uri)
+            if recipe is None:
+                continue
+            label = normalize_label(recipe.get("label", ""))
+            if uri in seen_uris or label in seen_labels:
+                continue
+            seen_uris.add(uri)
+            seen_labels.add(label)
+            merged.append(uri)
+            if len(merged) >= max_results:
+                return merged
+
+    return merged
+
+
+async def fan_out_search(
+    search_params: Dict[str, Any], num_queries: int, max_results: int, deadline: Optional[float] = None
+) -> List[str]:
+    """
+    Run diversified variants of a search concurrently and merge the results.
+
+    Returns recipe URIs. Failed variants are skipped; the search only fails
+    if every variant fails. Every variant stops at `deadline` (epoch seconds).
+    """
+    variants = build_fanout_variants(search_params, num_queries)
+    per_query = max_results if len(variants) == 1 else max(10, max_results // len(variants) * 2)
+
+    async def run_variant(variant: Dict[str, Any]) -> List[str]:
+        uris = await search_edamam_recipes.ainvoke({**variant, "max_results": per_query, "deadline": deadline})
+        # Streaming clients see each variant's candidates as soon as it lands
+        emit("candidates", recipes=recipe_store.views(uris))
+        return uris
+
+    results = await asyncio.gather(
+        *(run_variant(variant) for variant in variants),
+        return_exceptions=True,
+    )
+
+    # BaseException: a cancelled query is a failure, not a result
+    successful = [r for r in results if not isinstance(r, BaseException)]
+    failed = [r for r in results if isinstance(r, BaseException)]
+    print(f"[fan_out_search] {len(successful)}/{len(variants)} queries succeeded")
+    if not successful:
+        raise failed[0]
+
+    return merge_recipe_results(successful, max_results)
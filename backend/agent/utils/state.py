@@ -1,6 +1,6 @@
 """State definition for the LangGraph agent."""
 
-from typing import TypedDict, List, Optional
+from typing import TypedDict, Any, Dict, List, Optional
 
 
 class GraphState(TypedDict):
@@ -14,14 +14,18 @@ class GraphState(TypedDict):
     custom_preferences: List[str]  # User's free-text preferences for AI
     family_members_info: str  # Formatted string with family member preferences for agent prompt
 
-    # Recipes data
-    all_recipes: List[dict]  # All recipes from Edamam (populated by agent)
-    selected_recipes: List[dict]  # Agent-selected recipes (9+ diverse options)
+    # Recipes data: URIs into recipe_store (resolve with recipe_store.views)
+    all_recipe_uris: List[str]  # All recipes from Edamam (populated by agent)
+    selected_recipe_uris: List[str]  # Agent-selected recipes (9+ diverse options)
+    search_params: Dict[str, Any]  # Edamam params that produced all_recipe_uris
+    prefetched: Dict[str, List[str]]  # search_params_key -> speculatively fetched recipe URIs
 
     # Chat interaction
-    chat_history: List[dict]
+    chat_history: List[dict]  # Last CHAT_HISTORY_WINDOW messages
+    chat_summary: str  # Earlier user requests (see agent.utils.history)
     current_message: Optional[str]
 
     # Agent state
     action: str  # "initial_search" | "refine" | "re_search"
     agent_response: Optional[str]
+    deadline: float  # Epoch seconds by which all LLM calls and Edamam requests must finish (local fallbacks after)
@@ -0,0 +1,17 @@
+"""Progress events from graph nodes for streaming clients."""
+
+from typing import Any
+from langgraph.config import get_stream_writer
+
+
+def emit(event: str, **data: Any) -> None:
+    """
+    Send a custom stream event ({"event": ..., **data}) to LangGraph's
+    "custom" stream mode. A no-op when the node is not running inside a
+    graph (e.g. called directly from tests) or nobody is streaming.
+    """
+    try:
+        writer = get_stream_writer()
+    except RuntimeError:
+        return
+    writer({"event": event, **data})
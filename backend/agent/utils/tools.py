@@ -1,7 +1,8 @@
 """Tools for the LangGraph agent to interact with services."""
 
-from typing import List, Optional
+from typing import Annotated, List, Optional
 from langchain.tools import tool
+from langchain_core.tools import InjectedToolArg
 
 
 @tool
@@ -16,7 +17,8 @@ async def search_edamam_recipes(
     ingr: Optional[str] = None,
     time: Optional[str] = None,
     max_results: int = 30,
-) -> List[dict]:
+    deadline: Annotated[Optional[float], InjectedToolArg] = None,
+) -> List[str]:
     """
     Search for recipes using the Edamam Recipe API.
 
@@ -82,9 +84,11 @@ async def search_edamam_recipes(
         ingr: Ingredient count filter (format: "5-8", "10+", "5")
         time: Time range in minutes (format: "30", "20-40", "60+")
         max_results: Maximum number of results (default 30)
+        deadline: Request deadline (epoch seconds) from GraphState; set by
+            the caller, not by the model
 
     Returns:
-        List of recipe dictionaries with full details (ingredients, nutrition, etc.)
+        List of recipe URIs; the recipes themselves are in recipe_store
 
     Examples:
         - search_edamam_recipes(query="fish", health_labels=["dairy-free"], meal_type=["dinner"])
@@ -93,6 +97,7 @@ async def search_edamam_recipes(
         - search_edamam_recipes(meal_type=["breakfast"], time="20", dish_type=["bread"])
     """
     from app.services.edamam_service import edamam_service
+    from app.services.recipe_store import recipe_store
 
     print(f"[search_edamam_recipes] Called with parameters:")
     print(f"  - query: {query}")
@@ -117,10 +122,11 @@ async def search_edamam_recipes(
         ingr=ingr,
         time=time,
         max_results=max_results,
+        deadline=deadline,
     )
 
     print(f"[search_edamam_recipes] Returned {len(recipes)} recipes")
-    return [recipe.model_dump() for recipe in recipes]
+    return recipe_store.add(recipes)
 
 
 @tool
@@ -1,41 +1,236 @@
 """API endpoint for chat interaction with the agent."""
 
-from typing import List
-from fastapi import APIRouter, HTTPException
-from app.models.chat import ChatRequest, ChatResponse
+import json
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from langchain_core.utils.json import parse_partial_json
+from app.models.chat import ChatHistoryResponse, ChatRequest, ChatResponse
+from app.models.job import Job
 from app.models.recipe import EdamamRecipe
-from app.services.session_service import session_service
+from app.models.user import MergedPreferences
+from app.services.session_service import Session, session_service
+from app.services.checkpoint_service import checkpoint_service
 from app.services.user_service import user_service
-from agent.agent import chat_graph, graph
+from app.services.prefetch_service import prefetch_service
+from app.services.metrics import metrics
+from app.services.recipe_store import recipe_store
+from app.api.cancellation import run_until_disconnect
+from app.api.initial_search import create_search_session, format_family_info, initial_state
+from app.api.jobs import submit_job
+from agent.agent import graph
+from agent.utils.llm import new_deadline
 
 router = APIRouter()
 
 
-def _format_family_info(user_ids: List[int], user_message: str = None) -> str:
-    """Format family member preferences for agent prompt."""
-    family_info_parts = ["You are helping plan meals for:"]
+def _initial_state(request: ChatRequest, merged_prefs) -> dict:
+    """Graph input for a first message that creates a session."""
+    return initial_state(request.user_ids, merged_prefs, request.message)
 
-    for user_id in user_ids:
-        user = user_service.get_user(user_id)
-        if user:
-            diet_str = ", ".join(user.dietLabels) if user.dietLabels else "no restrictions"
-            custom_str = ", ".join(user.customPreferences) if user.customPreferences else ""
 
-            if custom_str:
-                family_info_parts.append(f"- {user.name} ({diet_str}): \"{custom_str}\"")
-            else:
-                family_info_parts.append(f"- {user.name} ({diet_str})")
+def _session_state(session) -> dict:
+    """Full graph state rebuilt from a session (seeds sessions without a checkpoint)."""
+    return {
+        "user_ids": session.user_ids,
+        "diet_labels": session.merged_preferences.diet_labels,
+        "excluded_ingredients": session.merged_preferences.excluded_ingredients,
+        "fridge_items": session.merged_preferences.fridge_items,
+        "custom_preferences": session.merged_preferences.custom_preferences,
+        "family_members_info": format_family_info(session.user_ids),
+        "all_recipe_uris": recipe_store.add(session.all_recipes),
+        "selected_recipe_uris": recipe_store.add(session.selected_recipes),
+        "search_params": session.search_params,
+        "chat_history": [msg.model_dump() for msg in session.chat_history],
+        "chat_summary": session.chat_summary,
+        "action": "refine",
+    }
+
+
+@metrics.timed("api.build_state")
+async def _chat_input(request: ChatRequest, session) -> dict:
+    """
+    Graph input for a refinement message in an existing session.
+
+    Only the message and per-turn values are sent; the rest of the state is
+    resumed from the session's checkpoint (seeded from the session once if
+    it has none). The session's recipes were added to the recipe store when
+    they entered it and stay resolvable while the session holds them.
+    """
+    if await checkpoint_service.load(session.session_id) is None:
+        await checkpoint_service.save(session.session_id, _session_state(session))
+    return {
+        "current_message": request.message,
+        "action": "refine",
+        "agent_response": None,
+        "deadline": new_deadline(),
+        # Filled in the background by PrefetchService, so read from the session
+        "prefetched": {key: [r.uri for r in recipes] for key, recipes in session.prefetched.items()},
+    }
+
+
+def _recipe_models(session, uris: List[str]) -> List[EdamamRecipe]:
+    """Models for `uris`, from the session first and the recipe store for new results."""
+    models = []
+    for uri in uris:
+        recipe = session.get_recipe(uri) or recipe_store.model(uri)
+        if recipe is not None:
+            models.append(recipe)
+    if len(models) < len(uris):
+        print(f"[agent] {len(uris) - len(models)} of {len(uris)} recipes could not be resolved")
+        metrics.increment("recipes_unresolved", len(uris) - len(models))
+    return models
+
+
+def _with_history(result: dict, session) -> dict:
+    """Graph state with the session's (bounded) history, after it recorded the turn."""
+    return {
+        **result,
+        "chat_history": [msg.model_dump() for msg in session.chat_history],
+        "chat_summary": session.chat_summary,
+    }
+
+
+async def _restore_session(session_id: str):
+    """Rebuild a session from its checkpoint (e.g. after a restart), or None."""
+    values = await checkpoint_service.load(session_id)
+    if not values or not values.get("user_ids"):
+        return None
+    merged_prefs = MergedPreferences(
+        user_ids=values["user_ids"],
+        diet_labels=values.get("diet_labels", []),
+        excluded_ingredients=values.get("excluded_ingredients", []),
+        fridge_items=values.get("fridge_items", []),
+        custom_preferences=values.get("custom_preferences", []),
+    )
+    session = Session(
+        session_id=session_id,
+        user_ids=values["user_ids"],
+        merged_preferences=merged_prefs,
+        all_recipes=recipe_store.models(values.get("all_recipe_uris", [])),
+        selected_recipes=recipe_store.models(values.get("selected_recipe_uris", [])),
+        chat_history=values.get("chat_history", []),
+        chat_summary=values.get("chat_summary", ""),
+        search_params=values.get("search_params", {}),
+        created_at=datetime.now().isoformat(),
+    )
+    session_service.add_session(session)
+    print(f"[agent] Restored session {session_id} from its checkpoint")
+    return session
+
+
+@metrics.timed("api.finish", endpoint="initial_search")
+async def _finish_initial_search(request: ChatRequest, merged_prefs, result: dict) -> ChatResponse:
+    """Create the session from an initial search result."""
+    session_id, selected_recipes, _ = create_search_session(request.user_ids, merged_prefs, result)
+
+    # Check if user request might conflict with dietary restrictions
+    conflict_warning = ""
+    if request.message:
+        user_msg_lower = request.message.lower()
+        # Check for potential conflicts
+        if any(keyword in user_msg_lower for keyword in ["fish", "meat", "chicken", "beef", "pork", "seafood", "shrimp"]):
+            if "vegan" in merged_prefs.diet_labels or "vegetarian" in merged_prefs.diet_labels:
+                conflict_warning = " Note: Your request may conflict with vegetarian/vegan dietary preferences in the family."
+        if any(keyword in user_msg_lower for keyword in ["dairy", "cheese", "milk", "butter", "cream"]):
+            if "dairy-free" in merged_prefs.diet_labels:
+                conflict_warning = " Note: Your request may conflict with dairy-free dietary restrictions."
+        if any(keyword in user_msg_lower for keyword in ["gluten", "bread", "pasta", "wheat"]):
+            if "gluten-free" in merged_prefs.diet_labels:
+                conflict_warning = " Note: Your request may conflict with gluten-free dietary restrictions."
+
+    agent_response = f"I found {len(selected_recipes)} recipes that match your request!{conflict_warning}"
+    session = session_service.update_chat_history(session_id, request.message, agent_response)
+    await checkpoint_service.save(session_id, _with_history(result, session))
+
+    return ChatResponse(
+        recipes=selected_recipes,
+        response=agent_response,
+        action_taken="initial_search",
+        session_id=session_id,
+    )
+
+
+@metrics.timed("api.finish", endpoint="refinement")
+async def _finish_refinement(request: ChatRequest, session, result: dict) -> ChatResponse:
+    """Store a refinement result in the session."""
+    action_taken = result.get("action", "no_change")
+    agent_response = result.get("agent_response", "I understand your request.")
+
+    selected_uris = result.get("selected_recipe_uris", [])
+    final_recipes = _recipe_models(session, selected_uris)
+    if selected_uris and not final_recipes:
+        # Nothing resolvable: keep the current selection rather than emptying it
+        final_recipes = session.selected_recipes
+
+    # Only a re-search changes the recipe pool; models are reused from the session and store
+    all_uris = result.get("all_recipe_uris", [])
+    all_recipes = None
+    if all_uris and all_uris != session.all_recipe_uris:
+        all_recipes = _recipe_models(session, all_uris) or None
+    search_params = result.get("search_params") if action_taken == "re_search" else None
+
+    def apply_turn(stored) -> None:
+        if all_recipes is not None:
+            stored.all_recipes = all_recipes
+        if search_params:
+            # Old speculative results no longer apply
+            stored.search_params = search_params
+            stored.prefetched = {}
+        stored.selected_recipes = final_recipes
+
+    # One versioned write for the whole turn
+    session = session_service.update_chat_history(
+        request.session_id, request.message, agent_response, change=apply_turn
+    ) or session
+    if search_params:
+        prefetch_service.schedule(request.session_id, search_params)
+
+    # Records the state after this turn (with the bounded history) as the latest checkpoint
+    await checkpoint_service.save(request.session_id, _with_history(result, session))
+
+    return ChatResponse(
+        recipes=final_recipes, response=agent_response, action_taken=action_taken
+    )
+
+
+async def _run_initial_search(request: ChatRequest, merged_prefs) -> ChatResponse:
+    """Run the initial search graph for a first message and create the session."""
+    try:
+        result = await graph.ainvoke(_initial_state(request, merged_prefs))
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error searching for recipes: {str(e)}"
+        )
+    return await _finish_initial_search(request, merged_prefs, result)
 
-    family_info = "\n".join(family_info_parts)
 
-    if user_message:
-        family_info += f"\n\nUser's request: \"{user_message}\""
+async def _load_session(request: ChatRequest):
+    """
+    Session the message refines, or None when it starts a new one.
 
-    return family_info
+    Sessions missing from SessionService but present in the checkpointer
+    (a restart with CHECKPOINTER="sqlite") are restored first.
+    """
+    if request.session_id:
+        session = await session_service.load_session(request.session_id)
+        if session is None:
+            session = await _restore_session(request.session_id)
+        if session is not None:
+            return session
+    if not request.user_ids or len(request.user_ids) == 0:
+        raise HTTPException(
+            status_code=400,
+            detail="No session found. Please provide user_ids to create a new search."
+        )
+    return None
 
 
 @router.post("/chat", response_model=ChatResponse)
-async def chat_with_agent(request: ChatRequest):
+async def chat_with_agent(request: ChatRequest, http_request: Request):
     """
     Chat with the agent to refine recipe selections OR create initial search.
 
@@ -47,127 +242,163 @@ async def chat_with_agent(request: ChatRequest):
 
     Maintains conversation history within the session.
     """
-    if not request.session_id or not session_service.session_exists(request.session_id):
-        if not request.user_ids or len(request.user_ids) == 0:
-            raise HTTPException(
-                status_code=400,
-                detail="No session found. Please provide user_ids to create a new search."
-            )
-
+    session = await _load_session(request)
+    if session is None:
         # Create new session with initial search
         merged_prefs = user_service.merge_preferences(request.user_ids)
-        family_members_info = _format_family_info(request.user_ids, request.message)
-
-        initial_state = {
-            "user_ids": request.user_ids,
-            "diet_labels": merged_prefs.diet_labels,
-            "excluded_ingredients": merged_prefs.excluded_ingredients,
-            "fridge_items": merged_prefs.fridge_items,
-            "custom_preferences": merged_prefs.custom_preferences,
-            "family_members_info": family_members_info,
-            "all_recipes": [],
-            "selected_recipes": [],
-            "chat_history": [],
-            "current_message": None,
-            "action": "initial_search",
-            "agent_response": None,
-        }
-
-        try:
-            result = await graph.ainvoke(initial_state)
-        except Exception as e:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Error searching for recipes: {str(e)}"
-            )
-
-        selected_recipes_dict = result.get("selected_recipes", [])
-        all_recipes_dict = result.get("all_recipes", [])
-
-        if not selected_recipes_dict:
-            detail = (
-                "No recipes found matching the preferences." if not all_recipes_dict
-                else f"Found {len(all_recipes_dict)} recipes but couldn't select any."
-            )
-            raise HTTPException(status_code=404, detail=detail)
-
-        # Convert to Pydantic models
-        selected_recipes = [EdamamRecipe(**r) for r in selected_recipes_dict]
-        all_recipes = [EdamamRecipe(**r) for r in all_recipes_dict]
-
-        session_id = session_service.create_session(
-            user_ids=request.user_ids,
-            all_recipes=all_recipes,
-            selected_recipes=selected_recipes,
-            merged_preferences=merged_prefs,
-        )
+        return await run_until_disconnect(http_request, _run_initial_search(request, merged_prefs))
+
+    # Existing session - resume its graph state with the new message
+    chat_input = await _chat_input(request, session)
+    result = await run_until_disconnect(
+        http_request,
+        checkpoint_service.graph.ainvoke(
+            chat_input, checkpoint_service.config(session.session_id), durability="exit"
+        ),
+    )
+    return await _finish_refinement(request, session, result)
+
+
+@router.post("/chat/jobs", response_model=Job, status_code=202)
+async def submit_chat_job(request: ChatRequest):
+    """
+    Asynchronous variant of /chat for first messages (new sessions).
 
-        # Check if user request might conflict with dietary restrictions
-        conflict_warning = ""
-        if request.message:
-            user_msg_lower = request.message.lower()
-            # Check for potential conflicts
-            if any(keyword in user_msg_lower for keyword in ["fish", "meat", "chicken", "beef", "pork", "seafood", "shrimp"]):
-                if "vegan" in merged_prefs.diet_labels or "vegetarian" in merged_prefs.diet_labels:
-                    conflict_warning = " Note: Your request may conflict with vegetarian/vegan dietary preferences in the family."
-            if any(keyword in user_msg_lower for keyword in ["dairy", "cheese", "milk", "butter", "cream"]):
-                if "dairy-free" in merged_prefs.diet_labels:
-                    conflict_warning = " Note: Your request may conflict with dairy-free dietary restrictions."
-            if any(keyword in user_msg_lower for keyword in ["gluten", "bread", "pasta", "wheat"]):
-                if "gluten-free" in merged_prefs.diet_labels:
-                    conflict_warning = " Note: Your request may conflict with gluten-free dietary restrictions."
-
-        agent_response = f"I found {len(selected_recipes)} recipes that match your request!{conflict_warning}"
-        session_service.update_chat_history(session_id, request.message, agent_response)
-
-        return ChatResponse(
-            recipes=selected_recipes,
-            response=agent_response,
-            action_taken="initial_search",
-            session_id=session_id,
+    Returns a job immediately; the initial search runs on the background job
+    pool and GET /api/jobs/{job_id} returns the ChatResponse, including the
+    new session_id, when done. Refinements of an existing session are quick
+    enough for /chat and are rejected here. Returns 503 when the queue is full.
+    """
+    if await _load_session(request) is not None:
+        raise HTTPException(
+            status_code=400,
+            detail="Jobs are only for new searches; use /chat to refine an existing session."
         )
+    merged_prefs = user_service.merge_preferences(request.user_ids)
+    return submit_job("chat", lambda: _run_initial_search(request, merged_prefs))
 
-    # Existing session - refine recipes
-    session = session_service.get_session(request.session_id)
-    family_members_info = _format_family_info(session.user_ids)
 
-    all_recipes_dict = [r.model_dump() for r in session.all_recipes]
-    selected_recipes_dict = [r.model_dump() for r in session.selected_recipes]
-    chat_history_dict = [msg.model_dump() for msg in session.chat_history]
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
 
-    chat_state = {
-        "user_ids": session.user_ids,
-        "diet_labels": session.merged_preferences.diet_labels,
-        "excluded_ingredients": session.merged_preferences.excluded_ingredients,
-        "fridge_items": session.merged_preferences.fridge_items,
-        "custom_preferences": session.merged_preferences.custom_preferences,
-        "family_members_info": family_members_info,
-        "all_recipes": all_recipes_dict,
-        "selected_recipes": selected_recipes_dict,
-        "chat_history": chat_history_dict,
-        "current_message": request.message,
-        "action": "refine",
-        "agent_response": None,
-    }
 
-    result = await chat_graph.ainvoke(chat_state)
+def _response_delta(message, buffers: Dict[str, str], sent: Dict[str, int]) -> str:
+    """
+    New characters of the agent's reply in a streamed LLM chunk.
 
-    action_taken = result.get("action", "no_change")
-    agent_response = result.get("agent_response", "I understand your request.")
+    The refinement call returns its reply inside structured tool-call
+    arguments, so the partial JSON is parsed as it grows and only the
+    unseen suffix of its "response" field is returned.
+    """
+    run_id = message.id or ""
+    for tool_chunk in getattr(message, "tool_call_chunks", None) or []:
+        buffers[run_id] = buffers.get(run_id, "") + (tool_chunk.get("args") or "")
+    if run_id not in buffers:
+        return ""
+    partial = parse_partial_json(buffers[run_id]) if buffers[run_id] else None
+    text = partial.get("response") if isinstance(partial, dict) else None
+    if not isinstance(text, str) or len(text) <= sent.get(run_id, 0):
+        return ""
+    delta = text[sent.get(run_id, 0):]
+    sent[run_id] = len(text)
+    return delta
+
+
+async def _chat_events(
+    agent_graph,
+    state: dict,
+    finish: Callable[[dict], Awaitable[ChatResponse]],
+    config: Optional[dict] = None,
+):
+    """
+    Run the graph and translate its stream into SSE events.
+
+    Events: "status" (immediately), "intent", "token" (reply text),
+    "candidates" (recipes as they arrive from Edamam), "selection" (recipes
+    changed by a node), then "result" (the ChatResponse) or "error".
+    """
+    yield _sse("status", {"action": state["action"]})
+
+    result = state
+    stream_kwargs = {"durability": "exit"} if config else {}
+    selected = state.get("selected_recipe_uris", [])
+    buffers: Dict[str, str] = {}
+    sent: Dict[str, int] = {}
+    try:
+        async for mode, chunk in agent_graph.astream(
+            state, config, stream_mode=["updates", "custom", "messages", "values"], **stream_kwargs
+        ):
+            if mode == "custom":
+                yield _sse(chunk["event"], {k: v for k, v in chunk.items() if k != "event"})
+            elif mode == "messages":
+                message, metadata = chunk
+                if metadata.get("langgraph_node") == "handle_chat":
+                    delta = _response_delta(message, buffers, sent)
+                    if delta:
+                        yield _sse("token", {"text": delta})
+            elif mode == "updates":
+                for node, update in chunk.items():
+                    new_selected = (update or {}).get("selected_recipe_uris")
+                    if new_selected and new_selected != selected:
+                        selected = new_selected
+                        yield _sse("selection", {"node": node, "recipes": recipe_store.views(selected)})
+            elif mode == "values":
+                result = chunk
+        response = await finish(result)
+    except HTTPException as e:
+        yield _sse("error", {"status_code": e.status_code, "detail": e.detail})
+        return
+    except Exception as e:
+        yield _sse("error", {"status_code": 500, "detail": f"Error running agent: {str(e)}"})
+        return
+
+    yield _sse("result", response.model_dump(mode="json"))
+
+
+@router.post("/chat/stream")
+async def stream_chat_with_agent(request: ChatRequest):
+    """
+    Streaming variant of /chat using server-sent events.
 
-    selected_recipes_dict = result.get("selected_recipes", [])
-    all_recipes_dict = result.get("all_recipes", [])
+    Emits progress as the agent graph runs (see _chat_events) so clients can
+    render the intent, reply text and candidate recipes before the final
+    selection. The session is updated exactly as by /chat. Closing the
+    connection cancels the graph run.
+    """
+    session = await _load_session(request)
+    if session is None:
+        merged_prefs = user_service.merge_preferences(request.user_ids)
+        events = _chat_events(
+            graph,
+            _initial_state(request, merged_prefs),
+            lambda result: _finish_initial_search(request, merged_prefs, result),
+        )
+    else:
+        events = _chat_events(
+            checkpoint_service.graph,
+            await _chat_input(request, session),
+            lambda result: _finish_refinement(request, session, result),
+            config=checkpoint_service.config(session.session_id),
+        )
 
-    final_recipes = [EdamamRecipe(**r) for r in selected_recipes_dict]
-    all_recipes = [EdamamRecipe(**r) for r in all_recipes_dict]
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    if all_recipes:
-        session.all_recipes = all_recipes
-    session.selected_recipes = final_recipes
 
-    session_service.update_chat_history(request.session_id, request.message, agent_response)
-    session_service.update_selected_recipes(request.session_id, final_recipes)
+@router.get("/history/{session_id}", response_model=ChatHistoryResponse)
+async def get_chat_history(session_id: str):
+    """
+    Get the full chat history of a session.
 
-    return ChatResponse(
-        recipes=final_recipes, response=agent_response, action_taken=action_taken
+    Sessions keep only their most recent messages; older ones are read
+    back from the chat archive.
+    """
+    session = await session_service.load_session(session_id) or await _restore_session(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return ChatHistoryResponse(
+        messages=session_service.get_chat_history(session_id), summary=session.chat_summary
     )
@@ -0,0 +1,34 @@
+"""Cancel in-flight agent work when the HTTP client disconnects."""
+
+import asyncio
+from typing import Awaitable, TypeVar
+from fastapi import HTTPException, Request
+
+T = TypeVar("T")
+
+# nginx convention for "client closed request"
+CLIENT_CLOSED_REQUEST = 499
+
+
+async def run_until_disconnect(
+    http_request: Request, awaitable: Awaitable[T], poll_interval: float = 0.25
+) -> T:
+    """
+    Run `awaitable`, cancelling it if the client disconnects first.
+
+    Cancellation propagates through the graph into pending LLM and Edamam
+    requests, so abandoned requests stop consuming quota and worker time.
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                print(f"[run_until_disconnect] Client disconnected, cancelling {http_request.url.path}")
+                task.cancel()
+                raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request")
+    finally:
+        if not task.done():
+            task.cancel()
@@ -0,0 +1,97 @@
+"""Initial recipe search shared by /recipes/search, first-message /agent/chat and jobs."""
+
+from typing import List, Optional, Tuple
+from fastapi import HTTPException
+from app.models.recipe import EdamamRecipe
+from app.services.recipe_store import recipe_store
+from app.models.user import MergedPreferences
+from app.services.session_service import session_service
+from app.services.user_service import user_service
+from app.services.prefetch_service import prefetch_service
+from agent.utils.llm import new_deadline
+
+
+def format_family_info(user_ids: List[int], user_message: Optional[str] = None) -> str:
+    """Format family member preferences for agent prompt."""
+    family_info_parts = ["You are helping plan meals for:"]
+
+    for user_id in user_ids:
+        user = user_service.get_user(user_id)
+        if user:
+            diet_str = ", ".join(user.dietLabels) if user.dietLabels else "no restrictions"
+            custom_str = ", ".join(user.customPreferences) if user.customPreferences else ""
+
+            if custom_str:
+                family_info_parts.append(f"- {user.name} ({diet_str}): \"{custom_str}\"")
+            else:
+                family_info_parts.append(f"- {user.name} ({diet_str})")
+
+    family_info = "\n".join(family_info_parts)
+
+    if user_message:
+        family_info += f"\n\nUser's request: \"{user_message}\""
+
+    return family_info
+
+
+def initial_state(
+    user_ids: List[int], merged_prefs: MergedPreferences, message: Optional[str] = None
+) -> dict:
+    """
+    Graph input for an initial search (the deadline starts now).
+
+    A first chat message becomes current_message, so construct_search_query
+    interprets it instead of using the profile-only rule table.
+    """
+    return {
+        "user_ids": user_ids,
+        "diet_labels": merged_prefs.diet_labels,
+        "excluded_ingredients": merged_prefs.excluded_ingredients,
+        "fridge_items": merged_prefs.fridge_items,
+        "custom_preferences": merged_prefs.custom_preferences,
+        "family_members_info": format_family_info(user_ids, message),
+        "all_recipe_uris": [],  # Agent will populate this
+        "selected_recipe_uris": [],
+        "search_params": {},
+        "prefetched": {},
+        "chat_history": [],
+        "chat_summary": "",
+        "current_message": message or None,
+        "action": "initial_search",
+        "agent_response": None,
+        "deadline": new_deadline(),
+    }
+
+
+def create_search_session(
+    user_ids: List[int], merged_prefs: MergedPreferences, result: dict
+) -> Tuple[str, List[EdamamRecipe], List[EdamamRecipe]]:
+    """
+    Create a session from an initial search result and start prefetching.
+
+    Returns (session_id, selected_recipes, all_recipes); raises a 404
+    HTTPException when nothing was selected.
+    """
+    selected_uris = result.get("selected_recipe_uris", [])
+    all_uris = result.get("all_recipe_uris", [])
+
+    if not selected_uris:
+        detail = (
+            "No recipes found matching the preferences." if not all_uris
+            else f"Found {len(all_uris)} recipes but couldn't select any."
+        )
+        raise HTTPException(status_code=404, detail=detail)
+
+    # Validated models come straight from the recipe store
+    selected_recipes = recipe_store.models(selected_uris)
+    all_recipes = recipe_store.models(all_uris)
+
+    session_id = session_service.create_session(
+        user_ids=user_ids,
+        all_recipes=all_recipes,
+        selected_recipes=selected_recipes,
+        merged_preferences=merged_prefs,
+        search_params=result.get("search_params", {}),
+    )
+    prefetch_service.schedule(session_id, result.get("search_params", {}))
+    return session_id, selected_recipes, all_recipes
@@ -0,0 +1,43 @@
+"""API endpoints for polling background jobs."""
+
+from fastapi import APIRouter, HTTPException, Query
+from app.config import settings
+from app.models.job import Job
+from app.services.job_service import JobQueueFull, job_service
+
+router = APIRouter()
+
+
+def submit_job(kind: str, factory) -> Job:
+    """Queue a job for a submit endpoint, turning a full queue into a 503."""
+    try:
+        return job_service.submit(kind, factory)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+
+@router.get("")
+async def get_jobs_status():
+    """Get worker count, queue depth and job counters."""
+    return job_service.status()
+
+
+@router.get("/{job_id}", response_model=Job)
+async def get_job(
+    job_id: str,
+    wait: float = Query(0, ge=0, description="Seconds to wait for the job to finish (long poll)"),
+):
+    """
+    Get a job's status, and its result once finished.
+
+    With `wait`, the request is held until the job finishes or `wait`
+    seconds (at most JOB_MAX_WAIT_SECONDS) pass. A succeeded job's `result`
+    is the body the synchronous endpoint would have returned; a failed job
+    carries that endpoint's `status_code` and `error` detail.
+    """
+    job = await job_service.wait(job_id, min(wait, settings.JOB_MAX_WAIT_SECONDS))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status == "queued":
+        return job.model_copy(update={"queue_position": job_service.queue_position(job_id)})
+    return job
@@ -0,0 +1,25 @@
+"""API endpoints exposing latency and token metrics."""
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.services.metrics import metrics
+
+router = APIRouter()
+
+
+@router.get("")
+async def get_metrics():
+    """
+    Get aggregated instrumentation.
+
+    Histograms (count, mean, p50/p95/p99, buckets) of span durations in ms
+    per graph node, LLM call, Edamam request and API step, counters for
+    outcomes, tokens and cache hits, and the most recent spans.
+    """
+    return metrics.snapshot()
+
+
+@router.get("/prometheus", response_class=PlainTextResponse)
+async def get_metrics_prometheus():
+    """Get the same histograms and counters in Prometheus text format."""
+    return metrics.render_prometheus()
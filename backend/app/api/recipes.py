@@ -1,15 +1,20 @@
 """API endpoints for recipe search and retrieval."""
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from app.models.job import Job
 from app.models.recipe import (
     RecipeSearchRequest,
     RecipeSearchResponse,
     AllRecipesResponse,
-    EdamamRecipe,
 )
 from app.services.user_service import user_service
 from app.services.edamam_service import edamam_service
 from app.services.session_service import session_service
+from app.services.prefetch_service import prefetch_service
+from app.services.checkpoint_service import checkpoint_service
+from app.api.cancellation import run_until_disconnect
+from app.api.initial_search import create_search_session, initial_state
+from app.api.jobs import submit_job
 from agent.agent import graph
 from app.config import settings
 
@@ -17,7 +22,7 @@ router = APIRouter()
 
 
 @router.post("/search", response_model=RecipeSearchResponse)
-async def search_recipes(request: RecipeSearchRequest):
+async def search_recipes(request: RecipeSearchRequest, http_request: Request):
     """
     Search for recipes using AI agent.
 
@@ -26,66 +31,17 @@ async def search_recipes(request: RecipeSearchRequest):
 
     Returns the selected recipes and a session ID for chat refinement.
     """
-    # Merge preferences from all users
     merged_prefs = user_service.merge_preferences(request.user_ids)
+    return await run_until_disconnect(http_request, _run_search(request, merged_prefs))
 
-    # Format family member preferences for agent prompt
-    family_info_parts = []
-    family_info_parts.append("You are helping plan meals for:")
-
-    for user_id in request.user_ids:
-        user = user_service.get_user(user_id)
-        if user:
-            # Format: "- Name (diet labels): custom preferences"
-            diet_str = ", ".join(user.dietLabels) if user.dietLabels else "no restrictions"
-            custom_str = ", ".join(user.customPreferences) if user.customPreferences else ""
-
-            if custom_str:
-                family_info_parts.append(f"- {user.name} ({diet_str}): \"{custom_str}\"")
-            else:
-                family_info_parts.append(f"- {user.name} ({diet_str})")
-
-    family_members_info = "\n".join(family_info_parts)
-
-    # Agent will search Edamam API - pass empty recipes list
-    initial_state = {
-        "user_ids": request.user_ids,
-        "diet_labels": merged_prefs.diet_labels,
-        "excluded_ingredients": merged_prefs.excluded_ingredients,
-        "fridge_items": merged_prefs.fridge_items,
-        "custom_preferences": merged_prefs.custom_preferences,
-        "family_members_info": family_members_info,
-        "all_recipes": [],  # Agent will populate this
-        "selected_recipes": [],
-        "chat_history": [],
-        "current_message": None,
-        "action": "initial_search",
-        "agent_response": None,
-    }
-
-    # Run the agent graph (agent searches and selects)
-    result = await graph.ainvoke(initial_state)
-
-    selected_recipes_dict = result.get("selected_recipes", [])
-    all_recipes_dict = result.get("all_recipes", [])
-
-    if not selected_recipes_dict:
-        raise HTTPException(
-            status_code=404,
-            detail="No recipes found matching the dietary preferences",
-        )
-
-    # Convert to Pydantic models
-    selected_recipes = [EdamamRecipe(**r) for r in selected_recipes_dict]
-    all_recipes = [EdamamRecipe(**r) for r in all_recipes_dict]
-
-    # Create session
-    session_id = session_service.create_session(
-        user_ids=request.user_ids,
-        merged_preferences=merged_prefs,
-        all_recipes=all_recipes,
-        selected_recipes=selected_recipes,
+
+async def _run_search(request: RecipeSearchRequest, merged_prefs) -> RecipeSearchResponse:
+    """Run the agent graph (agent searches and selects) and create the session."""
+    result = await graph.ainvoke(initial_state(request.user_ids, merged_prefs))
+    session_id, selected_recipes, all_recipes = create_search_session(
+        request.user_ids, merged_prefs, result
     )
+    await checkpoint_service.save(session_id, result)
 
     return RecipeSearchResponse(
         session_id=session_id,
@@ -95,6 +51,19 @@ async def search_recipes(request: RecipeSearchRequest):
     )
 
 
+@router.post("/search/jobs", response_model=Job, status_code=202)
+async def submit_search_job(request: RecipeSearchRequest):
+    """
+    Asynchronous variant of /search.
+
+    Returns a job immediately; the search runs on the background job pool
+    and GET /api/jobs/{job_id} returns the RecipeSearchResponse when done.
+    Returns 503 when the job queue is full.
+    """
+    merged_prefs = user_service.merge_preferences(request.user_ids)
+    return submit_job("recipe_search", lambda: _run_search(request, merged_prefs))
+
+
 @router.get("/all/{session_id}", response_model=AllRecipesResponse)
 async def get_all_recipes(session_id: str):
     """
@@ -103,16 +72,32 @@ async def get_all_recipes(session_id: str):
     Returns all 30 recipes that were found in the original search,
     along with the URIs of the recipes that were initially selected.
     """
-    if not session_service.session_exists(session_id):
-        raise HTTPException(status_code=404, detail="Session not found")
-
-    session = session_service.get_session(session_id)
+    session = await session_service.load_session(session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    # Get URIs of selected recipes
-    selected_uris = [r.uri for r in session.selected_recipes]
-
     return AllRecipesResponse(
-        recipes=session.all_recipes, selected_recipe_uris=selected_uris
+        recipes=session.all_recipes, selected_recipe_uris=session.selected_recipe_uris
     )
+
+
+@router.get("/edamam/status")
+async def get_edamam_status():
+    """
+    Get Edamam client health.
+
+    Returns circuit breaker state, rate limiter tokens, response cache
+    statistics, request/retry counters and refinement prefetch counters.
+    """
+    return {**edamam_service.status(), "prefetch": prefetch_service.status()}
+
+
+@router.get("/sessions/status")
+async def get_sessions_status():
+    """
+    Get search session storage state.
+
+    Returns active session count, estimated memory, the configured limits
+    and TTL/LRU eviction counters.
+    """
+    return session_service.status()
@@ -15,11 +15,56 @@ class Settings:
     # Edamam API Configuration
     EDAMAM_APP_ID: str = os.getenv("EDAMAM_APP_ID", "")
     EDAMAM_APP_KEY: str = os.getenv("EDAMAM_APP_KEY", "")
-    EDAMAM_BASE_URL: str = "https://api.edamam.com/api/recipes/v2"
+    EDAMAM_BASE_URL: str = os.getenv("EDAMAM_BASE_URL", "https://api.edamam.com/api/recipes/v2")
+    EDAMAM_TIMEOUT: float = float(os.getenv("EDAMAM_TIMEOUT", "10"))
+
+    # Edamam HTTP connection pool
+    EDAMAM_MAX_CONNECTIONS: int = 20
+    EDAMAM_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    EDAMAM_KEEPALIVE_EXPIRY: float = 120.0  # Seconds an idle connection is kept open
+    EDAMAM_HTTP2: bool = os.getenv("EDAMAM_HTTP2", "false").lower() == "true"  # Requires httpx[http2]
+    EDAMAM_WARMUP_CONNECTIONS: int = 2  # Connections pre-opened at startup
+
+    # Edamam rate limiting / resilience (developer plan: 10 hits per minute)
+    EDAMAM_RATE_LIMIT_PER_MINUTE: float = float(os.getenv("EDAMAM_RATE_LIMIT_PER_MINUTE", "10"))
+    EDAMAM_RATE_LIMIT_BURST: int = int(os.getenv("EDAMAM_RATE_LIMIT_BURST", "5"))
+    EDAMAM_RATE_LIMIT_MAX_WAIT: float = 10.0  # Max seconds to wait for a token
+    EDAMAM_MAX_RETRIES: int = 3  # Retries on 429 / 5xx / transport errors
+    EDAMAM_BACKOFF_BASE: float = 0.5  # Seconds, doubled per attempt (full jitter)
+    EDAMAM_BACKOFF_MAX: float = 8.0
+    EDAMAM_CIRCUIT_FAILURE_THRESHOLD: int = 5  # Consecutive failures before opening
+    EDAMAM_CIRCUIT_RESET_SECONDS: float = 30.0
+    EDAMAM_CACHE_TTL_SECONDS: float = 600.0  # Fresh cache lifetime; stale entries served while unhealthy
+    EDAMAM_CACHE_MAX_ENTRIES: int = 256
+
+    # LLM provider: "openai", or "fake" for the deterministic in-process model
+    # (app/services/fake_llm.py) used in offline runs and benchmarks
+    LLM_PROVIDER: str = os.getenv("LLM_PROVIDER", "openai").lower()
+    FAKE_LLM_SEED: int = int(os.getenv("FAKE_LLM_SEED", "0"))
+    FAKE_LLM_LATENCY_MS: float = float(os.getenv("FAKE_LLM_LATENCY_MS", "0"))
 
     # OpenAI API Configuration
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     OPENAI_MODEL: str = "gpt-4o-mini"
+    OPENAI_BASE_URL: str | None = os.getenv("OPENAI_BASE_URL") or None  # e.g. the fake_upstream server
+    LLM_TIMEOUT: float = float(os.getenv("LLM_TIMEOUT", "20"))  # Per-call timeout in agent nodes
+    LLM_MAX_CONNECTIONS: int = 20  # Shared OpenAI connection pool (see LLMRegistry)
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    LLM_KEEPALIVE_EXPIRY: float = 120.0
+    # Per-request deadline for all agent LLM calls and Edamam requests (see GraphState.deadline);
+    # with less than LLM_MIN_REMAINING_SECONDS left a node uses its local fallback
+    REQUEST_DEADLINE_SECONDS: float = float(os.getenv("REQUEST_DEADLINE_SECONDS", "8"))
+    LLM_MIN_REMAINING_SECONDS: float = 0.5
+    # Hedging: send a duplicate LLM request once the first exceeds the node's p95
+    LLM_HEDGE_ENABLED: bool = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+    LLM_HEDGE_DEFAULT_DELAY: float = 2.0  # Used until a node has LLM_HEDGE_MIN_SAMPLES calls
+    LLM_HEDGE_MIN_SAMPLES: int = 20
+    # Prompt token budget per agent node; recipe tables are trimmed to fit
+    PROMPT_TOKEN_BUDGETS: dict = {
+        "construct_search_query": 1600,
+        "select_diverse_recipes": 1800,
+        "handle_chat_refinement": 1500,
+    }
 
     # Application Configuration
     ENVIRONMENT: str = os.getenv("ENVIRONMENT", "development")
@@ -33,13 +78,98 @@ class Settings:
     MIN_RECIPES_SELECT: int = 5  # Min recipes agent should select
     MAX_RECIPES_SELECT: int = 10  # Max recipes agent should select
 
+    # Recipe selection: "local" (feature-based diversity) or "llm" (GPT picks indices)
+    SELECTION_STRATEGY: str = os.getenv("SELECTION_STRATEGY", "local")
+    SELECTION_DISCOVERY_SHARE: float = 0.3  # Share of random "discovery" picks
+    SELECTION_SEED: int | None = int(os.getenv("SELECTION_SEED")) if os.getenv("SELECTION_SEED") else None
+
+    # Build message-less search params with local rules instead of GPT
+    DETERMINISTIC_INITIAL_SEARCH: bool = os.getenv("DETERMINISTIC_INITIAL_SEARCH", "true").lower() == "true"
+
+    # Handle clear-cut chat refinements with the local intent classifier;
+    # messages scoring below the threshold are escalated to GPT
+    LOCAL_INTENT_ENABLED: bool = os.getenv("LOCAL_INTENT_ENABLED", "true").lower() == "true"
+    INTENT_CONFIDENCE_THRESHOLD: float = float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", "0.8"))
+
+    # Cache for GPT-constructed search params (construct_search_query)
+    SEARCH_QUERY_CACHE_TTL_SECONDS: float = 6 * 3600
+    SEARCH_QUERY_CACHE_MAX_ENTRIES: int = 1024
+    SEARCH_QUERY_CACHE_PERSIST: bool = os.getenv("SEARCH_QUERY_CACHE_PERSIST", "false").lower() == "true"
+    SEARCH_QUERY_CACHE_PATH: Path = DATABASE_DIR / "search_query_cache.json"
+
+    # Fan-out search: several diversified Edamam queries per search (uses more quota)
+    FANOUT_SEARCH_ENABLED: bool = os.getenv("FANOUT_SEARCH_ENABLED", "false").lower() == "true"
+    FANOUT_QUERIES: int = 4  # Queries per search, including the original one
+
+    # Speculative prefetch of likely refinement searches after a search
+    PREFETCH_ENABLED: bool = os.getenv("PREFETCH_ENABLED", "false").lower() == "true"
+    PREFETCH_MAX_VARIANTS: int = 3  # Variants fetched per session
+    PREFETCH_TOKEN_RESERVE: int = 2  # Rate limit tokens always left for user traffic
+
+    # In-memory sessions: evicted after SESSION_TTL_SECONDS idle, or least
+    # recently used first beyond SESSION_MAX_COUNT / SESSION_MAX_BYTES
+    # (approximate, serialized size). A background sweeper drops idle ones.
+    SESSION_TTL_SECONDS: float = float(os.getenv("SESSION_TTL_SECONDS", "3600"))
+    SESSION_MAX_COUNT: int = int(os.getenv("SESSION_MAX_COUNT", "1000"))
+    SESSION_MAX_BYTES: int = int(os.getenv("SESSION_MAX_BYTES", str(256 * 1024 * 1024)))
+    SESSION_SWEEP_INTERVAL_SECONDS: float = 60.0
+    # "memory" (one process) or "sqlite": sessions written through to a WAL
+    # database shared by all uvicorn workers on the host, surviving restarts
+    SESSION_BACKEND: str = os.getenv("SESSION_BACKEND", "memory")
+    SESSION_DB_PATH: Path = Path(os.getenv("SESSION_DB_PATH", str(DATABASE_DIR / "sessions.sqlite")))
+    SESSION_TOUCH_INTERVAL_SECONDS: float = 60.0  # Max rate of last-access writes per cached session
+    # A cached session confirmed against the store this recently is used
+    # without another version check (writes are compare-and-swap anyway)
+    SESSION_VERSION_CHECK_SECONDS: float = float(os.getenv("SESSION_VERSION_CHECK_SECONDS", "1.0"))
+
+    # Chat history per session: the last CHAT_HISTORY_WINDOW messages are kept
+    # raw (the refinement prompt uses the last 3); older user requests are
+    # folded into a summary of at most CHAT_SUMMARY_MAX_CHARS, and the
+    # messages themselves moved to the chat archive
+    CHAT_HISTORY_WINDOW: int = int(os.getenv("CHAT_HISTORY_WINDOW", "6"))
+    CHAT_SUMMARY_MAX_CHARS: int = 500
+    CHAT_ARCHIVE_ENABLED: bool = os.getenv("CHAT_ARCHIVE_ENABLED", "true").lower() == "true"
+    CHAT_ARCHIVE_DB_PATH: Path = DATABASE_DIR / "chat_archive.sqlite"
+
+    # Recipes referenced by URI from graph state (see RecipeStore)
+    RECIPE_STORE_MAX_ENTRIES: int = 10000
+
+    # Chat graph state per session (thread_id = session_id): "memory" or
+    # "sqlite" (survives restarts; requires the "sqlite" extra). With sqlite
+    # the recipe store is also persisted so restored sessions can resolve URIs.
+    # Defaults to sqlite with the sqlite session backend, so workers share it
+    CHECKPOINTER: str = os.getenv("CHECKPOINTER", "sqlite" if SESSION_BACKEND == "sqlite" else "memory")
+    CHECKPOINT_DB_PATH: Path = DATABASE_DIR / "checkpoints.sqlite"
+    RECIPE_STORE_DB_PATH: Path = DATABASE_DIR / "recipes.sqlite"
+
+    # Background jobs for initial searches (POST .../jobs): worker count caps
+    # concurrent graph runs; submissions beyond JOB_QUEUE_MAX waiting get a 503
+    JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", "2"))
+    JOB_QUEUE_MAX: int = int(os.getenv("JOB_QUEUE_MAX", "20"))
+    JOB_RESULT_TTL_SECONDS: float = 600.0  # Finished jobs are kept this long for polling
+    JOB_MAX_WAIT_SECONDS: float = 30.0  # Longest long-poll on GET /api/jobs/{job_id}
+    # "sqlite" shares job state between workers so any of them answers a poll
+    # (jobs still run on the worker that accepted them); follows SESSION_BACKEND
+    JOB_BACKEND: str = os.getenv("JOB_BACKEND", SESSION_BACKEND)
+    JOB_DB_PATH: Path = DATABASE_DIR / "jobs.sqlite"
+
     def validate(self) -> None:
         """Validate that required configuration is present."""
         if not self.EDAMAM_APP_ID:
             raise ValueError("EDAMAM_APP_ID is not set in environment")
         if not self.EDAMAM_APP_KEY:
             raise ValueError("EDAMAM_APP_KEY is not set in environment")
-        if not self.OPENAI_API_KEY:
+        if self.LLM_PROVIDER not in ("openai", "fake"):
+            raise ValueError(f"Unknown LLM_PROVIDER '{self.LLM_PROVIDER}' (expected 'openai' or 'fake')")
+        if self.SESSION_BACKEND not in ("memory", "sqlite"):
+            raise ValueError(f"Unknown SESSION_BACKEND '{self.SESSION_BACKEND}' (expected 'memory' or 'sqlite')")
+        if self.JOB_BACKEND not in ("memory", "sqlite"):
+            raise ValueError(f"Unknown JOB_BACKEND '{self.JOB_BACKEND}' (expected 'memory' or 'sqlite')")
+        if self.SESSION_BACKEND == "sqlite" and self.CHECKPOINTER != "sqlite":
+            raise ValueError("SESSION_BACKEND=sqlite needs CHECKPOINTER=sqlite to share chat state between workers")
+        if self.SESSION_BACKEND == "sqlite" and self.JOB_BACKEND != "sqlite":
+            raise ValueError("SESSION_BACKEND=sqlite needs JOB_BACKEND=sqlite so every worker can answer job polls")
+        if self.LLM_PROVIDER == "openai" and not self.OPENAI_API_KEY:
             raise ValueError("OPENAI_API_KEY is not set in environment")
         if not self.USERS_DB_PATH.exists():
             raise ValueError(f"Users database not found at {self.USERS_DB_PATH}")
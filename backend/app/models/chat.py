@@ -27,3 +27,10 @@ class ChatResponse(BaseModel):
     response: str
     action_taken: str  # "filtered", "re_searched", "no_change", "initial_search"
     session_id: str | None = None  # Included when new session is created
+
+
+class ChatHistoryResponse(BaseModel):
+    """Full chat history of a session."""
+
+    messages: List[ChatMessage]  # Archived messages followed by the recent window
+    summary: str  # Rolling summary of earlier requests, as given to the agent
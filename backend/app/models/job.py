@@ -0,0 +1,23 @@
+"""Pydantic models for background jobs."""
+
+from typing import Any, Literal, Optional
+from pydantic import BaseModel
+
+
+class Job(BaseModel):
+    """A background graph run submitted through a /jobs endpoint."""
+
+    job_id: str
+    kind: str  # "recipe_search" | "chat"
+    status: Literal["queued", "running", "succeeded", "failed"] = "queued"
+    created_at: float
+    queue_position: Optional[int] = None  # 1-based while queued
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[Any] = None  # Response body of the synchronous endpoint
+    error: Optional[str] = None
+    status_code: Optional[int] = None  # HTTP status the synchronous endpoint would have returned
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "failed")
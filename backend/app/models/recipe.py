@@ -1,7 +1,7 @@
 """Pydantic models for recipes from Edamam API."""
 
 from typing import List, Optional
-from pydantic import BaseModel, HttpUrl
+from pydantic import BaseModel, HttpUrl, PrivateAttr
 
 
 class EdamamRecipe(BaseModel):
@@ -21,6 +21,14 @@ class EdamamRecipe(BaseModel):
     dishType: List[str] = []
     healthLabels: List[str] = []
 
+    _json_size: Optional[int] = PrivateAttr(default=None)
+
+    def json_size(self) -> int:
+        """Serialized JSON size in bytes, computed once (recipes are not modified)."""
+        if self._json_size is None:
+            self._json_size = len(self.model_dump_json())
+        return self._json_size
+
 
 class RecipeSearchRequest(BaseModel):
     """Request model for recipe search."""
@@ -0,0 +1,94 @@
+"""In-memory TTL + LRU cache used in front of slow upstream calls."""
+
+import json
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Bounded LRU cache whose entries expire after `ttl` seconds.
+
+    Expired entries are kept (until evicted by the LRU bound) so callers can
+    still fall back to them with `get_stale` when the upstream is unhealthy.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return a fresh value for `key`, or None."""
+        entry = self._entries.get(key)
+        if entry is None or time.time() - entry[0] > self.ttl:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def get_stale(self, key: Hashable) -> Optional[Any]:
+        """Return a value for `key` regardless of its age, or None."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self.stale_hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = (time.time(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def save(self, path: Path) -> None:
+        """Persist string-keyed, JSON-serializable entries to `path`."""
+        entries = [
+            [key, stored_at, value]
+            for key, (stored_at, value) in self._entries.items()
+            if isinstance(key, str)
+        ]
+        path.write_text(json.dumps(entries))
+
+    def load(self, path: Path) -> int:
+        """Load unexpired entries saved with `save`; returns the number loaded."""
+        if not path.exists():
+            return 0
+        try:
+            entries = json.loads(path.read_text())
+        except (OSError, ValueError) as e:
+            print(f"[TTLCache] Could not load {path}: {e}")
+            return 0
+
+        now = time.time()
+        loaded = 0
+        for key, stored_at, value in entries:
+            if now - stored_at <= self.ttl:
+                self._entries[key] = (stored_at, value)
+                loaded += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return loaded
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and size."""
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_hits": self.stale_hits,
+        }
@@ -0,0 +1,68 @@
+"""Durable archive of chat messages that left a session's history window."""
+
+import sqlite3
+from pathlib import Path
+from typing import List, Optional
+
+from app.config import settings
+
+
+class ChatArchive:
+    """
+    Older chat messages per session, in SQLite (WAL mode, so worker
+    processes can share the file).
+
+    Written only when a turn pushes messages out of the session's window
+    and read only when the full history is requested, so per-turn work
+    stays proportional to the window. The database is opened on first use.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path
+        self._db: Optional[sqlite3.Connection] = None
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            path = self.path or settings.CHAT_ARCHIVE_DB_PATH
+            self._db = sqlite3.connect(str(path), timeout=5.0, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS chat_archive ("
+                "session_id TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL, "
+                "PRIMARY KEY (session_id, seq)) WITHOUT ROWID"
+            )
+            self._db.commit()
+        return self._db
+
+    def append(self, session_id: str, messages: List[dict]) -> None:
+        """Archive messages after the ones already stored for the session."""
+        db = self._conn()
+        with db:
+            (start,) = db.execute(
+                "SELECT COALESCE(MAX(seq) + 1, 0) FROM chat_archive WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            db.executemany(
+                "INSERT INTO chat_archive (session_id, seq, role, content) VALUES (?, ?, ?, ?)",
+                [(session_id, start + i, m["role"], m["content"]) for i, m in enumerate(messages)],
+            )
+
+    def load(self, session_id: str) -> List[dict]:
+        """Archived messages of a session, oldest first."""
+        rows = self._conn().execute(
+            "SELECT role, content FROM chat_archive WHERE session_id = ? ORDER BY seq", (session_id,)
+        ).fetchall()
+        return [{"role": role, "content": content} for role, content in rows]
+
+    def delete(self, session_id: str) -> None:
+        db = self._conn()
+        with db:
+            db.execute("DELETE FROM chat_archive WHERE session_id = ?", (session_id,))
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+# Global instance
+chat_archive = ChatArchive()
@@ -0,0 +1,94 @@
+"""Service holding per-session chat graph state in a LangGraph checkpointer."""
+
+from typing import Any, Dict, Optional
+
+from langgraph.checkpoint.memory import InMemorySaver
+
+from app.config import settings
+from app.services.recipe_store import recipe_store
+from agent.agent import compile_chat_graph
+
+# Per-turn inputs that are not part of a session's stored state
+TRANSIENT_KEYS = ("current_message", "agent_response", "deadline", "prefetched")
+
+
+class CheckpointService:
+    """
+    Chat graph compiled with a checkpointer, one thread per session.
+
+    A turn sends only the new message (plus per-turn inputs) and LangGraph
+    resumes from the session's stored state: preferences, formatted family
+    info, search params, recipe URIs and chat history. Each turn appends
+    checkpoints to the thread and never rewrites earlier ones; the thread
+    is deleted with the session when it expires (see main.py).
+
+    CHECKPOINTER="sqlite" stores threads in CHECKPOINT_DB_PATH (and recipes
+    in RECIPE_STORE_DB_PATH) so sessions survive restarts; it needs the
+    optional langgraph-checkpoint-sqlite package and falls back to memory.
+    """
+
+    def __init__(self):
+        self.saver = None
+        self._graph = None
+        self._conn = None
+
+    async def start(self) -> None:
+        """Create the checkpointer and compile the graph (FastAPI lifespan)."""
+        if settings.CHECKPOINTER == "sqlite":
+            try:
+                import aiosqlite
+                from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+            except ImportError as e:
+                print(f"[CheckpointService] SQLite checkpointer unavailable ({e}), using memory")
+            else:
+                self._conn = await aiosqlite.connect(str(settings.CHECKPOINT_DB_PATH))
+                self.saver = AsyncSqliteSaver(self._conn)
+                await self.saver.setup()
+                recipe_store.attach(settings.RECIPE_STORE_DB_PATH)
+                print(f"[CheckpointService] Using SQLite checkpoints at {settings.CHECKPOINT_DB_PATH}")
+        self._ensure_graph()
+
+    def _ensure_graph(self):
+        if self._graph is None:
+            if self.saver is None:
+                self.saver = InMemorySaver()
+            self._graph = compile_chat_graph(self.saver)
+        return self._graph
+
+    @property
+    def graph(self):
+        """The checkpointed chat graph (in-memory unless started with SQLite)."""
+        return self._ensure_graph()
+
+    async def aclose(self) -> None:
+        """Close the SQLite connection, if any, and drop the graph."""
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+            recipe_store.detach()
+        self.saver = None
+        self._graph = None
+
+    @staticmethod
+    def config(session_id: str) -> dict:
+        return {"configurable": {"thread_id": session_id}}
+
+    async def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Stored state of a session, or None if it has no checkpoint."""
+        snapshot = await self.graph.aget_state(self.config(session_id))
+        return snapshot.values or None
+
+    async def save(self, session_id: str, values: Dict[str, Any]) -> None:
+        """Append a checkpoint holding `values` to the session's thread."""
+        # Per-turn inputs are cleared rather than carried into the next turn's checkpoint
+        values = {**values, **dict.fromkeys(TRANSIENT_KEYS)}
+        # As if select_recipes produced it, so the next turn starts at handle_chat
+        await self.graph.aupdate_state(self.config(session_id), values, as_node="select_recipes")
+
+    async def delete(self, session_id: str) -> None:
+        self._ensure_graph()
+        await self.saver.adelete_thread(session_id)
+
+
+# Global instance
+checkpoint_service = CheckpointService()
@@ -1,9 +1,22 @@
 """Service for interacting with the Edamam Recipe API."""
 
+import asyncio
+import importlib.util
+import time
 import httpx
 from typing import List, Optional
 from app.models.recipe import EdamamRecipe
 from app.config import settings
+from app.services.cache import TTLCache
+from app.services.metrics import metrics
+from app.services.resilience import (
+    TokenBucket,
+    CircuitBreaker,
+    CircuitOpenError,
+    DeadlineExceeded,
+    RateLimitExceeded,
+    backoff_delay,
+)
 
 
 class EdamamService:
@@ -31,11 +44,79 @@ class EdamamService:
         self.base_url = settings.EDAMAM_BASE_URL
         self.app_id = settings.EDAMAM_APP_ID
         self.app_key = settings.EDAMAM_APP_KEY
-        self.client = httpx.AsyncClient(timeout=30.0)
+        # Created in the FastAPI lifespan via start(); lazily otherwise
+        self.client: Optional[httpx.AsyncClient] = None
+
+        # Resilience: client-side quota, retries, circuit breaker and cache
+        self.rate_limiter = TokenBucket(
+            rate=settings.EDAMAM_RATE_LIMIT_PER_MINUTE / 60.0,
+            capacity=settings.EDAMAM_RATE_LIMIT_BURST,
+            max_wait=settings.EDAMAM_RATE_LIMIT_MAX_WAIT,
+        )
+        self.circuit_breaker = CircuitBreaker(
+            failure_threshold=settings.EDAMAM_CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout=settings.EDAMAM_CIRCUIT_RESET_SECONDS,
+        )
+        self.cache = TTLCache(
+            max_entries=settings.EDAMAM_CACHE_MAX_ENTRIES,
+            ttl=settings.EDAMAM_CACHE_TTL_SECONDS,
+        )
+        self.max_retries = settings.EDAMAM_MAX_RETRIES
+        self.backoff_base = settings.EDAMAM_BACKOFF_BASE
+        self.backoff_max = settings.EDAMAM_BACKOFF_MAX
+        self.stats = {"requests": 0, "retries": 0, "failures": 0, "stale_served": 0, "deadline_exceeded": 0}
+
+    def _build_client(self) -> httpx.AsyncClient:
+        """Build the pooled HTTP client (HTTP/2 only if `h2` is installed)."""
+        http2 = settings.EDAMAM_HTTP2
+        if http2 and importlib.util.find_spec("h2") is None:
+            print("[EdamamService] EDAMAM_HTTP2 set but 'h2' is not installed, using HTTP/1.1")
+            http2 = False
+
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.EDAMAM_TIMEOUT, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=settings.EDAMAM_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.EDAMAM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.EDAMAM_KEEPALIVE_EXPIRY,
+            ),
+            http2=http2,
+        )
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Return the HTTP client, creating it if start() was never called."""
+        if self.client is None:
+            self.client = self._build_client()
+        return self.client
+
+    async def start(self):
+        """Create the HTTP client (called from the FastAPI lifespan)."""
+        self._get_client()
+
+    async def warmup(self, connections: Optional[int] = None):
+        """
+        Pre-open pooled connections to the Edamam host.
+
+        Issues concurrent HEAD requests against the host root so DNS, TCP and
+        TLS setup are paid at startup instead of by the first user request.
+        Does not touch the recipe endpoint, so no quota is consumed.
+        """
+        connections = connections or settings.EDAMAM_WARMUP_CONNECTIONS
+        client = self._get_client()
+        origin = httpx.URL(self.base_url).copy_with(path="/", query=None)
+
+        results = await asyncio.gather(
+            *(client.head(origin) for _ in range(connections)),
+            return_exceptions=True,
+        )
+        opened = sum(1 for r in results if not isinstance(r, Exception))
+        print(f"[EdamamService] Warmup opened {opened}/{connections} connections to {origin.host}")
 
     async def close(self):
         """Close the HTTP client."""
-        await self.client.aclose()
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
 
     async def search_recipes(
         self,
@@ -49,6 +130,8 @@ class EdamamService:
         ingr: Optional[str] = None,
         time: Optional[str] = None,
         max_results: int = 30,
+        token_reserve: Optional[float] = None,
+        deadline: Optional[float] = None,
     ) -> List[EdamamRecipe]:
         """
         Search for recipes using Edamam API.
@@ -64,6 +147,13 @@ class EdamamService:
             ingr: Ingredient count filter (e.g., "5-8", "10+")
             time: Time range in minutes (e.g., "30", "20-40")
             max_results: Maximum number of results to return
+            token_reserve: Marks a low-priority request: it never waits for a
+                rate limit token and only takes one if this many remain
+                afterwards, raising RateLimitExceeded otherwise
+            deadline: Request deadline (epoch seconds, see GraphState); rate
+                limit waits, requests and retries stop there and
+                DeadlineExceeded is raised (a stale cache entry is served
+                instead if there is one)
 
         Returns:
             List of EdamamRecipe objects
@@ -125,45 +215,169 @@ class EdamamService:
         if time:
             params.append(("time", time))
 
-        try:
+        # Cache key excludes credentials so rotating keys keeps the cache valid
+        cache_key = tuple(p for p in params if p[0] not in ("app_id", "app_key"))
+        with metrics.span("edamam.search") as span:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                print(f"[EdamamService] Cache hit ({len(cached)} recipes)")
+                span.set(cache="hit", recipes=len(cached))
+                metrics.increment("edamam_cache", result="hit")
+                return list(cached)
+            metrics.increment("edamam_cache", result="miss")
+
             print(f"[EdamamService] Search params: {params}")
-            response = await self.client.get(self.base_url, params=params)
-            print(f"[EdamamService] Response status: {response.status_code}")
-            response.raise_for_status()
+            try:
+                data = await self._get_with_retry(params, token_reserve, deadline)
+            except Exception as e:
+                stale = self.cache.get_stale(cache_key)
+                if stale is not None:
+                    self.stats["stale_served"] += 1
+                    print(f"[EdamamService] Upstream unavailable ({e}), serving stale cache")
+                    span.set(cache="stale", recipes=len(stale))
+                    metrics.increment("edamam_cache", result="stale")
+                    return list(stale)
+                raise
 
-            data = response.json()
             print(f"[EdamamService] Found {len(data.get('hits', []))} recipes")
-            recipes = []
-
-            # Parse Edamam response
-            for hit in data.get("hits", []):
-                recipe_data = hit.get("recipe", {})
-                try:
-                    recipe = EdamamRecipe(
-                        uri=recipe_data.get("uri", ""),
-                        label=recipe_data.get("label", ""),
-                        image=recipe_data.get("image", ""),
-                        source=recipe_data.get("source", ""),
-                        url=recipe_data.get("url", ""),
-                        yield_servings=recipe_data.get("yield", 4),
-                        ingredientLines=recipe_data.get("ingredientLines", []),
-                        calories=recipe_data.get("calories", 0),
-                        totalTime=recipe_data.get("totalTime", 0),
-                        cuisineType=recipe_data.get("cuisineType", []),
-                        mealType=recipe_data.get("mealType", []),
-                        dishType=recipe_data.get("dishType", []),
-                        healthLabels=recipe_data.get("healthLabels", []),
-                    )
-                    recipes.append(recipe)
-                except Exception:
-                    continue
-
-            return recipes
-
-        except httpx.HTTPStatusError:
-            raise
-        except Exception:
-            raise
+            with metrics.span("edamam.parse"):
+                recipes = self._parse_recipes(data)
+            span.set(cache="miss", recipes=len(recipes))
+            self.cache.set(cache_key, recipes)
+            return list(recipes)
+
+    async def _get_with_retry(
+        self, params: list, token_reserve: Optional[float] = None, deadline: Optional[float] = None
+    ) -> dict:
+        """
+        Perform the Edamam GET under the rate limiter and circuit breaker.
+
+        Retries 429, 5xx and transport errors with jittered exponential
+        backoff. Other 4xx responses are raised immediately. With
+        `token_reserve` every attempt takes a spare token without waiting
+        (TokenBucket.try_acquire), so background work never delays users.
+        With `deadline` (epoch seconds) the rate limit wait and each request
+        are bounded by the time left, and no retry is made that could not
+        finish before it; running out raises DeadlineExceeded without
+        counting against the circuit breaker.
+        """
+        attempt = 0
+        while True:
+            remaining = None if deadline is None else deadline - time.time()
+            if remaining is not None and remaining <= 0:
+                raise DeadlineExceeded("Request deadline passed before Edamam answered")
+            # An open circuit fails fast without spending a rate limit token
+            if not self.circuit_breaker.allow():
+                raise CircuitOpenError("Edamam circuit breaker is open")
+            try:
+                if token_reserve is not None:
+                    if not self.rate_limiter.try_acquire(token_reserve):
+                        raise RateLimitExceeded("No spare rate limit token for a low-priority request")
+                else:
+                    wait_start = time.perf_counter()
+                    await self.rate_limiter.acquire(max_wait=remaining)
+                    metrics.observe("edamam_rate_limit_wait_ms", (time.perf_counter() - wait_start) * 1000)
+            except BaseException:
+                # No request was sent: free a half-open trial for the next caller
+                self.circuit_breaker.release()
+                raise
+            self.stats["requests"] += 1
+
+            retry_after = None
+            response = None
+            try:
+                with metrics.span("edamam.request") as span:
+                    span.set(attempt=attempt)
+                    try:
+                        response = await asyncio.wait_for(
+                            self._get_client().get(self.base_url, params=params),
+                            timeout=None if deadline is None else deadline - time.time(),
+                        )
+                    except httpx.TransportError as e:
+                        error = e
+                        span.outcome = "error"
+                        span.set(error=type(e).__name__)
+                    else:
+                        span.set(status=response.status_code)
+                        if response.status_code == 429 or response.status_code >= 500:
+                            span.outcome = "error"
+            except TimeoutError as e:
+                # Out of request budget, which says nothing about the upstream
+                self.circuit_breaker.release()
+                self.stats["deadline_exceeded"] += 1
+                raise DeadlineExceeded("Request deadline passed while waiting for Edamam") from e
+            except Exception:
+                self.circuit_breaker.record_failure()
+                self.stats["failures"] += 1
+                raise
+            except BaseException:
+                # Cancelled: free a half-open trial without judging the upstream
+                self.circuit_breaker.release()
+                raise
+            if response is not None:
+                print(f"[EdamamService] Response status: {response.status_code}")
+                if response.status_code != 429 and response.status_code < 500:
+                    # Success or a client error (bad credentials, bad params):
+                    # either way the upstream itself is healthy
+                    self.circuit_breaker.record_success()
+                    response.raise_for_status()
+                    return response.json()
+
+                retry_after = response.headers.get("Retry-After")
+                error = httpx.HTTPStatusError(
+                    f"Edamam returned {response.status_code}",
+                    request=response.request,
+                    response=response,
+                )
+
+            self.circuit_breaker.record_failure()
+            self.stats["failures"] += 1
+            if attempt >= self.max_retries:
+                raise error
+
+            delay = backoff_delay(attempt, self.backoff_base, self.backoff_max, retry_after)
+            if deadline is not None and time.time() + delay >= deadline:
+                print(f"[EdamamService] {error.__class__.__name__}, no time left to retry before the deadline")
+                raise error
+            attempt += 1
+            self.stats["retries"] += 1
+            print(f"[EdamamService] {error.__class__.__name__}, retry {attempt} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    def _parse_recipes(self, data: dict) -> List[EdamamRecipe]:
+        """Parse an Edamam v2 response body into EdamamRecipe objects."""
+        recipes = []
+        for hit in data.get("hits", []):
+            recipe_data = hit.get("recipe", {})
+            try:
+                recipe = EdamamRecipe(
+                    uri=recipe_data.get("uri", ""),
+                    label=recipe_data.get("label", ""),
+                    image=recipe_data.get("image", ""),
+                    source=recipe_data.get("source", ""),
+                    url=recipe_data.get("url", ""),
+                    yield_servings=recipe_data.get("yield", 4),
+                    ingredientLines=recipe_data.get("ingredientLines", []),
+                    calories=recipe_data.get("calories", 0),
+                    totalTime=recipe_data.get("totalTime", 0),
+                    cuisineType=recipe_data.get("cuisineType", []),
+                    mealType=recipe_data.get("mealType", []),
+                    dishType=recipe_data.get("dishType", []),
+                    healthLabels=recipe_data.get("healthLabels", []),
+                )
+                recipes.append(recipe)
+            except Exception:
+                continue
+        return recipes
+
+    def status(self) -> dict:
+        """Return rate limiter, circuit breaker and cache state."""
+        return {
+            "circuit_breaker": self.circuit_breaker.status(),
+            "rate_limiter": self.rate_limiter.status(),
+            "cache": self.cache.stats(),
+            "stats": dict(self.stats),
+        }
 
 
 # Global instance
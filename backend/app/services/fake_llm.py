@@ -0,0 +1,126 @@
+"""Deterministic in-process chat model for offline runs and benchmarks."""
+
+import asyncio
+import json
+import time
+import uuid
+from typing import Any, AsyncIterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, convert_to_openai_messages
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from fake_upstream.synthetic import synthetic_chat_content
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model answering with the same synthetic content as `fake_upstream`,
+    without any HTTP.
+
+    Replies are recognised from the system prompt (search query, selection,
+    intent, ingredient parsing), so they parse into the agent's schemas, and
+    are a pure function of (seed, prompt). Bound tools are answered with a
+    call to the first tool, like OpenAI function calling, so
+    `with_structured_output(..., method="function_calling")` works unchanged.
+    """
+
+    model_name: str = "fake"
+    temperature: float = 0.0
+    seed: int = 0
+    latency_ms: float = 0.0  # Constant delay before the reply (first chunk when streaming)
+    chunk_size: int = 16  # Characters per streamed chunk
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-synthetic"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model_name": self.model_name, "temperature": self.temperature, "seed": self.seed}
+
+    def bind_tools(self, tools, *, tool_choice=None, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _reply(self, messages: List[BaseMessage], tools: Optional[list]) -> tuple:
+        """(content, tool name or None, usage) for a prompt."""
+        content = synthetic_chat_content(convert_to_openai_messages(messages), seed=self.seed)
+        tool_name = tools[0]["function"]["name"] if tools else None
+        # Rough chars/4 estimate, so token logging has something to report
+        input_tokens = sum(len(str(m.content)) for m in messages) // 4
+        output_tokens = len(content) // 4
+        usage = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+        return content, tool_name, usage
+
+    def _message(self, messages: List[BaseMessage], tools: Optional[list]) -> AIMessage:
+        content, tool_name, usage = self._reply(messages, tools)
+        response_metadata = {"model_name": self.model_name, "finish_reason": "tool_calls" if tool_name else "stop"}
+        if tool_name:
+            return AIMessage(
+                content="",
+                tool_calls=[{"name": tool_name, "args": json.loads(content), "id": f"call_{uuid.uuid4().hex[:12]}"}],
+                usage_metadata=usage,
+                response_metadata=response_metadata,
+            )
+        return AIMessage(content=content, usage_metadata=usage, response_metadata=response_metadata)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000)
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, kwargs.get("tools")))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if self.latency_ms > 0:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, kwargs.get("tools")))])
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        """Stream the reply in `chunk_size` pieces (tool call argument deltas when tools are bound)."""
+        content, tool_name, usage = self._reply(messages, kwargs.get("tools"))
+        if self.latency_ms > 0:
+            await asyncio.sleep(self.latency_ms / 1000)
+
+        call_id = f"call_{uuid.uuid4().hex[:12]}"
+        pieces = [content[i:i + self.chunk_size] for i in range(0, len(content), self.chunk_size)] or [""]
+        for i, piece in enumerate(pieces):
+            if tool_name:
+                chunk = AIMessageChunk(content="", tool_call_chunks=[{
+                    "name": tool_name if i == 0 else None,
+                    "args": piece,
+                    "id": call_id if i == 0 else None,
+                    "index": 0,
+                }])
+            else:
+                chunk = AIMessageChunk(content=piece)
+            yield ChatGenerationChunk(message=chunk)
+
+        yield ChatGenerationChunk(message=AIMessageChunk(
+            content="",
+            usage_metadata=usage,
+            response_metadata={"model_name": self.model_name, "finish_reason": "tool_calls" if tool_name else "stop"},
+            chunk_position="last",
+        ))
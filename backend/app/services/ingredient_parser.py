@@ -1,17 +1,14 @@
 """Service for parsing ingredient strings using GPT-4."""
 
-import os
 import json
 from typing import Optional, Dict
-from openai import OpenAI
+from langchain_core.messages import HumanMessage, SystemMessage
+from app.services.llm_registry import llm_registry
 
 
 class IngredientParser:
     """Parse ingredient strings into structured data using GPT-4."""
 
-    def __init__(self):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
     def parse_ingredient(self, ingredient_line: str) -> Optional[Dict]:
         """
         Parse an ingredient line into structured data.
@@ -21,24 +18,18 @@ class IngredientParser:
             or None if parsing fails
         """
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": """You are an ingredient parser. Parse the ingredient line into JSON with these fields:
+            llm = llm_registry.get(temperature=0.3)
+            response = llm.invoke([
+                SystemMessage(content="""You are an ingredient parser. Parse the ingredient line into JSON with these fields:
 - name: the ingredient name (lowercase)
 - quantity: numeric quantity (use 1.0 if not specified)
 - unit: unit of measurement (e.g., "cup", "tbsp", "g", "piece")
 
-Return ONLY valid JSON, no other text.""",
-                    },
-                    {"role": "user", "content": ingredient_line},
-                ],
-                temperature=0.3,
-            )
+Return ONLY valid JSON, no other text."""),
+                HumanMessage(content=ingredient_line),
+            ])
 
-            result_text = response.choices[0].message.content.strip()
+            result_text = response.content.strip()
 
             # Remove markdown code blocks if present
             if result_text.startswith("```json"):
@@ -0,0 +1,224 @@
+"""Service running initial searches as background jobs on a bounded worker pool."""
+
+import asyncio
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from app.config import settings
+from app.models.job import Job
+from app.services.job_store import JobStore, SqliteJobStore
+from app.services.metrics import metrics
+
+JobFactory = Callable[[], Awaitable[Any]]
+STORE_POLL_SECONDS = 0.25  # Long-poll interval for jobs owned by another worker
+STORE_PRUNE_INTERVAL_SECONDS = 60.0
+
+
+class JobQueueFull(Exception):
+    """Raised by submit() when JOB_QUEUE_MAX jobs are already waiting."""
+
+
+class JobService:
+    """
+    Bounded executor for graph runs that outlive their HTTP request.
+
+    Submitted jobs wait in a queue of at most JOB_QUEUE_MAX entries and are
+    run by JOB_WORKERS worker tasks, so a burst of searches queues up (or is
+    rejected) instead of starting unbounded concurrent graph runs. Clients
+    poll get() or long-poll wait() for the result; finished jobs are kept
+    for JOB_RESULT_TTL_SECONDS.
+
+    The job factory is only called when a worker picks the job up, so work
+    such as the request deadline starts then rather than at submission.
+
+    With JOB_BACKEND="sqlite" every status change is also written to a
+    JobStore shared by all worker processes. A job runs on the process that
+    accepted it, but a poll can land on any of them.
+    """
+
+    def __init__(self):
+        self.jobs: Dict[str, Job] = {}
+        self._done_events: Dict[str, asyncio.Event] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._running = 0
+        self.store: Optional[JobStore] = None
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"  # This process, in the store
+        self._store_pruned_at = 0.0
+        self.stats = {"submitted": 0, "rejected": 0, "succeeded": 0, "failed": 0}
+
+    def start(self) -> None:
+        """
+        Open the configured store and start the worker tasks (FastAPI
+        lifespan; workers are also started lazily on submit).
+        """
+        if settings.JOB_BACKEND == "sqlite" and self.store is None:
+            self.store = SqliteJobStore(settings.JOB_DB_PATH)
+        loop = asyncio.get_running_loop()
+        if self._workers and self._loop is loop:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=settings.JOB_QUEUE_MAX)
+        self._workers = [
+            asyncio.create_task(self._worker(i)) for i in range(settings.JOB_WORKERS)
+        ]
+
+    async def shutdown(self) -> None:
+        """Cancel the workers and any running job, fail queued jobs and close the store."""
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        for job in self.jobs.values():
+            if job.status == "queued":
+                job.status, job.status_code, job.error = "failed", 503, "Server shutting down"
+                job.finished_at = time.time()
+                self._save(job)
+        self._queue = None
+        self._running = 0
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+    def submit(self, kind: str, factory: JobFactory) -> Job:
+        """Queue `factory()` to run in the background and return its job."""
+        self.start()
+        self._prune()
+
+        job = Job(job_id=str(uuid.uuid4()), kind=kind, created_at=time.time())
+        try:
+            self._queue.put_nowait((job, factory))
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            metrics.increment("jobs_rejected", kind=kind)
+            raise JobQueueFull(f"{settings.JOB_QUEUE_MAX} jobs already queued")
+
+        self.jobs[job.job_id] = job
+        self._done_events[job.job_id] = asyncio.Event()
+        self._save(job)
+        self.stats["submitted"] += 1
+        metrics.increment("jobs_submitted", kind=kind)
+        self._update_gauges()
+        print(f"[JobService] Queued {kind} job {job.job_id} (depth {self._queue.qsize()})")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """A job of this process, or of another one when the store is shared."""
+        self._prune()
+        job = self.jobs.get(job_id)
+        if job is None and self.store is not None:
+            job = self.store.load(job_id)
+        return job
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Job]:
+        """Return the job once it finishes or `timeout` seconds pass."""
+        job = self.get(job_id)
+        if job is None or job.done or timeout <= 0:
+            return job
+        event = self._done_events.get(job_id)
+        if event is None:
+            # Owned by another worker: poll the store
+            deadline = time.monotonic() + timeout
+            while not job.done and time.monotonic() < deadline:
+                await asyncio.sleep(min(STORE_POLL_SECONDS, max(0.0, deadline - time.monotonic())))
+                job = self.store.load(job_id) or job
+            return job
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.jobs.get(job_id)
+
+    def queue_position(self, job_id: str) -> Optional[int]:
+        """1-based position of a queued job, or None once it has started."""
+        if job_id not in self.jobs:
+            return self.store.queue_position(job_id) if self.store is not None else None
+        # The queue is FIFO and jobs are kept in submission order
+        position = 0
+        for job in self.jobs.values():
+            if job.status == "queued":
+                position += 1
+            if job.job_id == job_id:
+                return position if job.status == "queued" else None
+        return None
+
+    def _save(self, job: Job) -> None:
+        if self.store is not None:
+            self.store.save(job, self.owner)
+
+    async def _worker(self, worker_id: int) -> None:
+        while True:
+            job, factory = await self._queue.get()
+            try:
+                await self._run(job, factory)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job, factory: JobFactory) -> None:
+        job.status = "running"
+        job.started_at = time.time()
+        self._save(job)
+        self._running += 1
+        self._update_gauges()
+        metrics.observe("jobs.queue_wait_ms", (job.started_at - job.created_at) * 1000, kind=job.kind)
+
+        try:
+            with metrics.span("job.run", kind=job.kind):
+                result = await factory()
+            job.result = result.model_dump(mode="json") if hasattr(result, "model_dump") else result
+            job.status, job.status_code = "succeeded", 200
+        except HTTPException as e:
+            job.status, job.status_code, job.error = "failed", e.status_code, str(e.detail)
+        except asyncio.CancelledError:
+            job.status, job.status_code, job.error = "failed", 503, "Server shutting down"
+            raise
+        except Exception as e:
+            print(f"[JobService] {job.kind} job {job.job_id} failed: {e}")
+            job.status, job.status_code, job.error = "failed", 500, str(e)
+        finally:
+            job.finished_at = time.time()
+            self._save(job)
+            self._running -= 1
+            self.stats[job.status] += 1
+            self._update_gauges()
+            event = self._done_events.get(job.job_id)
+            if event is not None:
+                event.set()
+
+    def _prune(self) -> None:
+        cutoff = time.time() - settings.JOB_RESULT_TTL_SECONDS
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job.done and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+            self._done_events.pop(job_id, None)
+        if self.store is not None and time.time() - self._store_pruned_at > STORE_PRUNE_INTERVAL_SECONDS:
+            self.store.prune(cutoff)
+            self._store_pruned_at = time.time()
+
+    def _update_gauges(self) -> None:
+        metrics.set_gauge("jobs_queue_depth", self._queue.qsize() if self._queue else 0)
+        metrics.set_gauge("jobs_running", self._running)
+
+    def status(self) -> dict:
+        """Return worker/queue sizes and job counters."""
+        return {
+            "workers": len(self._workers),
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "queue_max": settings.JOB_QUEUE_MAX,
+            "running": self._running,
+            "retained": len(self.jobs),
+            "store": type(self.store).__name__ if self.store is not None else None,
+            **self.stats,
+        }
+
+
+# Global instance
+job_service = JobService()
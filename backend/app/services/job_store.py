@@ -0,0 +1,82 @@
+"""Durable job state shared by worker processes."""
+
+import sqlite3
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Optional
+
+from app.models.job import Job
+
+
+class JobStore(ABC):
+    """
+    Job state behind JobService, so any worker can answer a poll.
+
+    A job still runs on the worker that accepted it (`owner`); that worker
+    saves the job on every status change and other workers only read it.
+    """
+
+    @abstractmethod
+    def save(self, job: Job, owner: str) -> None:
+        """Insert or replace a job."""
+
+    @abstractmethod
+    def load(self, job_id: str) -> Optional[Job]:
+        """Return a job, or None if it is not stored."""
+
+    @abstractmethod
+    def queue_position(self, job_id: str) -> Optional[int]:
+        """1-based position of a queued job in its owner's queue, or None."""
+
+    @abstractmethod
+    def prune(self, cutoff: float) -> int:
+        """Delete jobs finished before `cutoff` and return how many."""
+
+    def close(self) -> None:
+        pass
+
+
+class SqliteJobStore(JobStore):
+    """JobStore in a SQLite database in WAL mode (see SqliteSessionStore)."""
+
+    def __init__(self, path: Path, timeout: float = 5.0):
+        self.path = path
+        self._db = sqlite3.connect(str(path), timeout=timeout, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_id TEXT PRIMARY KEY, owner TEXT NOT NULL, status TEXT NOT NULL, "
+            "created_at REAL NOT NULL, finished_at REAL, data TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_queued ON jobs (owner, status, created_at)")
+        self._db.commit()
+        print(f"[SqliteJobStore] Storing jobs in {path}")
+
+    def save(self, job: Job, owner: str) -> None:
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO jobs (job_id, owner, status, created_at, finished_at, data) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job.job_id, owner, job.status, job.created_at, job.finished_at, job.model_dump_json()),
+            )
+
+    def load(self, job_id: str) -> Optional[Job]:
+        row = self._db.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return None if row is None else Job.model_validate_json(row[0])
+
+    def queue_position(self, job_id: str) -> Optional[int]:
+        row = self._db.execute(
+            "SELECT COUNT(*) FROM jobs AS job JOIN jobs AS ahead "
+            "ON ahead.owner = job.owner AND ahead.status = 'queued' AND ahead.created_at <= job.created_at "
+            "WHERE job.job_id = ? AND job.status = 'queued'",
+            (job_id,),
+        ).fetchone()
+        return row[0] or None
+
+    def prune(self, cutoff: float) -> int:
+        with self._db:
+            return self._db.execute("DELETE FROM jobs WHERE finished_at < ?", (cutoff,)).rowcount
+
+    def close(self) -> None:
+        self._db.close()
@@ -0,0 +1,91 @@
+"""Registry of shared, pooled LLM clients."""
+
+from typing import Dict, Optional, Tuple
+
+import httpx
+from langchain_core.language_models import BaseChatModel
+from langchain_openai import ChatOpenAI
+
+from app.config import settings
+from app.services.fake_llm import FakeChatModel
+
+
+class LLMRegistry:
+    """
+    Holds one ChatOpenAI instance per (model, temperature) profile.
+
+    All instances share one sync and one async httpx connection pool, so
+    agent nodes and the ingredient parser reuse warm TLS connections instead
+    of building a client (and pool) per call.
+
+    With LLM_PROVIDER=fake every profile is a FakeChatModel instead, so the
+    agent runs without an OpenAI key or network.
+    """
+
+    # Profiles used by the agent nodes and ingredient parser, pre-created on start
+    DEFAULT_TEMPERATURES = (0.3, 0.7)
+
+    def __init__(self):
+        self._models: Dict[Tuple[str, float], BaseChatModel] = {}
+        self._http_client: Optional[httpx.Client] = None
+        self._http_async_client: Optional[httpx.AsyncClient] = None
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=settings.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+        )
+
+    def _ensure_http_clients(self) -> None:
+        if self._http_client is None:
+            self._http_client = httpx.Client(limits=self._limits(), timeout=settings.LLM_TIMEOUT)
+        if self._http_async_client is None:
+            self._http_async_client = httpx.AsyncClient(limits=self._limits(), timeout=settings.LLM_TIMEOUT)
+
+    def start(self) -> None:
+        """Create the connection pools and default profiles (FastAPI lifespan)."""
+        self._ensure_http_clients()
+        if settings.LLM_PROVIDER == "openai" and not settings.OPENAI_API_KEY:
+            return
+        for temperature in self.DEFAULT_TEMPERATURES:
+            self.get(temperature)
+
+    def get(self, temperature: float, model: Optional[str] = None) -> BaseChatModel:
+        """Return the shared client for a (model, temperature) profile."""
+        key = (model or settings.OPENAI_MODEL, temperature)
+        llm = self._models.get(key)
+        if llm is None and settings.LLM_PROVIDER == "fake":
+            llm = FakeChatModel(
+                model_name=key[0],
+                temperature=temperature,
+                seed=settings.FAKE_LLM_SEED,
+                latency_ms=settings.FAKE_LLM_LATENCY_MS,
+            )
+            self._models[key] = llm
+        elif llm is None:
+            self._ensure_http_clients()
+            llm = ChatOpenAI(
+                model=key[0],
+                temperature=temperature,
+                base_url=settings.OPENAI_BASE_URL,
+                http_client=self._http_client,
+                http_async_client=self._http_async_client,
+                stream_usage=True,  # Token usage is logged for streamed calls too
+            )
+            self._models[key] = llm
+        return llm
+
+    async def aclose(self) -> None:
+        """Close the connection pools and drop all profiles."""
+        self._models.clear()
+        if self._http_async_client is not None:
+            await self._http_async_client.aclose()
+            self._http_async_client = None
+        if self._http_client is not None:
+            self._http_client.close()
+            self._http_client = None
+
+
+# Global instance
+llm_registry = LLMRegistry()
@@ -0,0 +1,226 @@
+"""In-process instrumentation: timed spans aggregated into histograms and counters."""
+
+import asyncio
+import contextvars
+import functools
+import re
+import time
+import uuid
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is +Inf
+DEFAULT_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+LabelKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class Histogram:
+    """Cumulative bucket counts plus a bounded window of recent values for percentiles."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS_MS, window: int = 1024):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self._recent: deque = deque(maxlen=window)
+
+    def observe(self, value: float) -> None:
+        self.bucket_counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self._recent.append(value)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Percentile (0-100) over the recent window."""
+        if not self._recent:
+            return None
+        values = sorted(self._recent)
+        return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+    def snapshot(self) -> dict:
+        def rounded(value):
+            return None if value is None else round(value, 2)
+
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 2),
+            "mean": rounded(self.sum / self.count if self.count else None),
+            "min": rounded(self.min),
+            "max": rounded(self.max),
+            "p50": rounded(self.percentile(50)),
+            "p95": rounded(self.percentile(95)),
+            "p99": rounded(self.percentile(99)),
+            "buckets": {
+                **{f"le_{b}": n for b, n in zip(self.buckets, self.bucket_counts)},
+                "le_inf": self.bucket_counts[-1],
+            },
+        }
+
+
+class Span:
+    """One timed operation. Labels define its histogram; attributes are extra detail."""
+
+    def __init__(self, name: str, labels: Dict[str, Any], parent: Optional["Span"]):
+        self.name = name
+        self.labels = labels
+        self.attributes: Dict[str, Any] = {}
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:8]
+        self.parent_id = parent.span_id if parent else None
+        self.started_at = time.time()
+        self.duration_ms: Optional[float] = None
+        self.outcome = "ok"
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "started_at": self.started_at,
+            "duration_ms": None if self.duration_ms is None else round(self.duration_ms, 2),
+            "outcome": self.outcome,
+            "labels": self.labels,
+            "attributes": self.attributes,
+        }
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+class MetricsService:
+    """
+    Collects spans around graph nodes, LLM calls and Edamam requests.
+
+    Every finished span observes `<name>_duration_ms` (labelled by its
+    labels) and increments `<name>_total` by outcome (ok/error/cancelled).
+    Spans nest through a context variable, so an LLM call inside a graph
+    node inside an HTTP request shares that request's trace_id.
+    """
+
+    def __init__(self, max_recent_spans: int = 200):
+        self.histograms: Dict[LabelKey, Histogram] = {}
+        self.counters: Dict[LabelKey, float] = {}
+        self.gauges: Dict[LabelKey, float] = {}
+        self.recent_spans: deque = deque(maxlen=max_recent_spans)
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, Any]) -> LabelKey:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        key = self._key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def percentile(self, name: str, q: float, min_count: int = 1, **labels: Any) -> Optional[float]:
+        """Recent percentile of histogram `name`, or None with fewer than `min_count` samples."""
+        histogram = self.histograms.get(self._key(name, labels))
+        if histogram is None or histogram.count < min_count:
+            return None
+        return histogram.percentile(q)
+
+    def increment(self, name: str, value: float = 1, **labels: Any) -> None:
+        key = self._key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        self.gauges[self._key(name, labels)] = value
+
+    @contextmanager
+    def span(self, name: str, **labels: Any) -> Iterator[Span]:
+        """Time the enclosed block; usable in sync and async code."""
+        span = Span(name, labels, _current_span.get())
+        token = _current_span.set(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        except asyncio.CancelledError:
+            span.outcome = "cancelled"
+            raise
+        except BaseException as e:
+            span.outcome = "error"
+            span.set(error=type(e).__name__)
+            raise
+        finally:
+            span.duration_ms = (time.perf_counter() - start) * 1000
+            _current_span.reset(token)
+            self.observe(f"{name}_duration_ms", span.duration_ms, **span.labels)
+            self.increment(f"{name}_total", **span.labels, outcome=span.outcome)
+            self.recent_spans.append(span.to_dict())
+
+    def timed(self, name: str, **labels: Any):
+        """Decorator running an async function inside `span(name, **labels)`."""
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.span(name, **labels):
+                    return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self) -> dict:
+        """JSON-friendly view of all histograms, counters, gauges and recent spans."""
+        def render(key: LabelKey) -> str:
+            name, labels = key
+            if not labels:
+                return name
+            return name + "{" + ",".join(f"{k}={v}" for k, v in labels) + "}"
+
+        return {
+            "histograms": {render(k): h.snapshot() for k, h in sorted(self.histograms.items())},
+            "counters": {render(k): v for k, v in sorted(self.counters.items())},
+            "gauges": {render(k): v for k, v in sorted(self.gauges.items())},
+            "recent_spans": list(self.recent_spans),
+        }
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition of histograms, counters and gauges."""
+        def metric_name(name: str) -> str:
+            return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+        def label_text(labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+            pairs = [*labels, *extra]
+            if not pairs:
+                return ""
+            escaped = (v.replace("\\", "\\\\").replace('"', '\\"') for _, v in pairs)
+            return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+        lines = []
+        for (name, labels), value in sorted(self.counters.items()):
+            lines.append(f"{metric_name(name)}{label_text(labels)} {value:g}")
+        for (name, labels), value in sorted(self.gauges.items()):
+            lines.append(f"{metric_name(name)}{label_text(labels)} {value:g}")
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            base = metric_name(name)
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.bucket_counts):
+                cumulative += count
+                lines.append(f"{base}_bucket{label_text(labels, (('le', f'{bound:g}'),))} {cumulative}")
+            lines.append(f"{base}_bucket{label_text(labels, (('le', '+Inf'),))} {histogram.count}")
+            lines.append(f"{base}_sum{label_text(labels)} {histogram.sum:.3f}")
+            lines.append(f"{base}_count{label_text(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        self.histograms.clear()
+        self.counters.clear()
+        self.gauges.clear()
+        self.recent_spans.clear()
+
+
+# Global metrics instance
+metrics = MetricsService()
@@ -0,0 +1,107 @@
+"""Service for speculatively prefetching likely refinement searches."""
+
+import asyncio
+from typing import Any, Dict, List
+
+from app.config import settings
+from app.services.edamam_service import edamam_service
+from app.services.resilience import CircuitBreaker, RateLimitExceeded
+from app.services.session_service import session_service
+from agent.utils.search import build_prefetch_variants, search_params_key
+
+
+class PrefetchService:
+    """
+    Background prefetcher for refinement searches.
+
+    After a search, a few low-priority variants of its parameters are fetched
+    one at a time and stored in `session.prefetched`, so a matching re-search
+    in the chat graph can skip Edamam. Prefetch requests take a rate limit
+    token only if PREFETCH_TOKEN_RESERVE remain afterwards (checked and taken
+    atomically by the limiter) and stop while the circuit is not closed, so
+    they never compete with user-initiated searches. Off by default
+    (PREFETCH_ENABLED), since it spends quota on searches that may never be
+    asked for.
+    """
+
+    def __init__(self):
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self._semaphore = asyncio.Semaphore(1)  # One prefetch request at a time
+        self.stats = {"scheduled": 0, "fetched": 0, "skipped": 0, "failed": 0, "cancelled": 0}
+
+    def schedule(self, session_id: str, search_params: Dict[str, Any]) -> None:
+        """Start prefetching refinements of `search_params` for a session."""
+        if not settings.PREFETCH_ENABLED or not search_params:
+            return
+
+        self.cancel(session_id)
+        variants = build_prefetch_variants(search_params, settings.PREFETCH_MAX_VARIANTS)
+        if not variants:
+            return
+
+        task = asyncio.create_task(self._run(session_id, variants))
+        self.tasks[session_id] = task
+        self.stats["scheduled"] += 1
+
+        def _forget(done: asyncio.Task) -> None:
+            if self.tasks.get(session_id) is done:
+                del self.tasks[session_id]
+
+        task.add_done_callback(_forget)
+
+    def cancel(self, session_id: str) -> None:
+        """Cancel any in-flight prefetch for a session."""
+        task = self.tasks.pop(session_id, None)
+        if task and not task.done():
+            task.cancel()
+            self.stats["cancelled"] += 1
+
+    async def shutdown(self) -> None:
+        """Cancel all prefetches (called from the FastAPI lifespan)."""
+        tasks = list(self.tasks.values())
+        for session_id in list(self.tasks):
+            self.cancel(session_id)
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, session_id: str, variants: List[Dict[str, Any]]) -> None:
+        for variant in variants:
+            session = await session_service.load_session(session_id)
+            if session is None:
+                return
+
+            key = search_params_key(variant)
+            if key in session.prefetched:
+                continue
+
+            async with self._semaphore:
+                # Never the half-open trial request: that one belongs to user traffic
+                if edamam_service.circuit_breaker.state != CircuitBreaker.CLOSED:
+                    self.stats["skipped"] += len(variants) - variants.index(variant)
+                    print(f"[PrefetchService] Edamam circuit breaker not closed, stopping for {session_id}")
+                    return
+                try:
+                    recipes = await edamam_service.search_recipes(
+                        **variant,
+                        max_results=settings.MAX_RECIPES_FETCH,
+                        token_reserve=settings.PREFETCH_TOKEN_RESERVE,
+                    )
+                except RateLimitExceeded:
+                    self.stats["skipped"] += len(variants) - variants.index(variant)
+                    print(f"[PrefetchService] No spare Edamam rate limit budget, stopping for {session_id}")
+                    return
+                except Exception as e:
+                    self.stats["failed"] += 1
+                    print(f"[PrefetchService] Prefetch failed for {key}: {e}")
+                    continue
+
+            session_service.add_prefetched(session_id, key, recipes)
+            self.stats["fetched"] += 1
+            print(f"[PrefetchService] Prefetched {len(recipes)} recipes for {key}")
+
+    def status(self) -> dict:
+        """Return prefetch counters and in-flight task count."""
+        return {"in_flight": len(self.tasks), **self.stats}
+
+
+# Global instance
+prefetch_service = PrefetchService()
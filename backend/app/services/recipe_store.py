@@ -0,0 +1,187 @@
+"""Shared in-process store of recipes referenced by URI from graph state."""
+
+import json
+import sqlite3
+import weakref
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterable, List, Optional, Union
+
+from app.config import settings
+from app.models.recipe import EdamamRecipe
+
+
+class _StoredRecipe:
+    __slots__ = ("model", "view")
+
+    def __init__(self, model: Optional[EdamamRecipe], view: Optional[dict]):
+        self.model = model
+        self.view = view
+
+
+class RecipeStore:
+    """
+    Recipes by URI, so graph state can carry URI lists instead of recipe dicts.
+
+    Each recipe is held once, as the validated EdamamRecipe and/or a plain
+    dict view. The missing form is built on first use and cached, so a chat
+    turn neither dumps every session recipe to dicts nor re-validates them
+    afterwards. Views are shared between callers and must not be mutated.
+
+    Sessions own their EdamamRecipe lists and add recipes once, when they
+    enter the session. The store is a bounded working set
+    (RECIPE_STORE_MAX_ENTRIES, least recently used evicted first) that keeps
+    a weak reference to each evicted model, so a recipe a session still
+    holds keeps resolving by URI without being re-added every turn.
+
+    With attach(), new recipes are also written to a SQLite table and
+    misses are read back from it, so URIs in checkpointed graph state stay
+    resolvable after eviction or a restart.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries or settings.RECIPE_STORE_MAX_ENTRIES
+        self._recipes: "OrderedDict[str, _StoredRecipe]" = OrderedDict()
+        self._evicted: "weakref.WeakValueDictionary[str, EdamamRecipe]" = weakref.WeakValueDictionary()
+        self._db: Optional[sqlite3.Connection] = None
+        self.stats = {
+            "added": 0, "views_built": 0, "models_built": 0, "evicted": 0, "revived": 0, "loaded": 0, "missing": 0,
+        }
+
+    def add(self, recipes: Iterable[Union[EdamamRecipe, dict]]) -> List[str]:
+        """Store recipes (models or dicts with a "uri") and return their URIs."""
+        uris = []
+        new: List[Union[EdamamRecipe, dict]] = []
+        for recipe in recipes:
+            is_model = isinstance(recipe, EdamamRecipe)
+            uri = recipe.uri if is_model else recipe["uri"]
+            stored = self._recipes.get(uri)
+            if stored is None:
+                self._recipes[uri] = _StoredRecipe(recipe, None) if is_model else _StoredRecipe(None, recipe)
+                self.stats["added"] += 1
+                new.append(recipe)
+            else:
+                self._recipes.move_to_end(uri)
+                if is_model and stored.model is not recipe:
+                    # A fresher copy from Edamam replaces both forms
+                    stored.model, stored.view = recipe, None
+            uris.append(uri)
+        if new and self._db is not None:
+            self._persist(new)
+        self._evict()
+        return uris
+
+    def _get(self, uri: str) -> Optional[_StoredRecipe]:
+        stored = self._recipes.get(uri)
+        if stored is None:
+            stored = self._revive(uri)
+        if stored is None and self._db is not None:
+            stored = self._load(uri)
+        if stored is None:
+            self.stats["missing"] += 1
+            print(f"[RecipeStore] Recipe no longer stored: {uri}")
+            return None
+        self._recipes.move_to_end(uri)
+        return stored
+
+    def view(self, uri: str) -> Optional[dict]:
+        """Read-only dict form of a recipe (model_dump computed once)."""
+        stored = self._get(uri)
+        if stored is None:
+            return None
+        if stored.view is None:
+            stored.view = stored.model.model_dump()
+            self.stats["views_built"] += 1
+        return stored.view
+
+    def model(self, uri: str) -> Optional[EdamamRecipe]:
+        """Validated EdamamRecipe form of a recipe (validated at most once)."""
+        stored = self._get(uri)
+        if stored is None:
+            return None
+        if stored.model is None:
+            stored.model = EdamamRecipe(**stored.view)
+            self.stats["models_built"] += 1
+        return stored.model
+
+    def views(self, uris: Iterable[str]) -> List[dict]:
+        """Views for `uris`, skipping recipes that are no longer stored."""
+        return [view for view in map(self.view, uris) if view is not None]
+
+    def models(self, uris: Iterable[str]) -> List[EdamamRecipe]:
+        """Models for `uris`, skipping recipes that are no longer stored."""
+        return [model for model in map(self.model, uris) if model is not None]
+
+    def attach(self, path: Path) -> None:
+        """Persist recipes to the SQLite database at `path` (read-through on misses)."""
+        if self._db is not None:
+            return
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS recipes (uri TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        self._db.commit()
+        print(f"[RecipeStore] Persisting recipes to {path}")
+
+    def detach(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _persist(self, recipes: List[Union[EdamamRecipe, dict]]) -> None:
+        rows = [
+            (r.uri, r.model_dump_json()) if isinstance(r, EdamamRecipe) else (r["uri"], json.dumps(r))
+            for r in recipes
+        ]
+        self._db.executemany("INSERT OR REPLACE INTO recipes (uri, data) VALUES (?, ?)", rows)
+        self._db.commit()
+
+    def _load(self, uri: str) -> Optional[_StoredRecipe]:
+        row = self._db.execute("SELECT data FROM recipes WHERE uri = ?", (uri,)).fetchone()
+        if row is None:
+            return None
+        stored = self._recipes[uri] = _StoredRecipe(None, json.loads(row[0]))
+        self.stats["loaded"] += 1
+        self._evict()
+        return stored
+
+    def __contains__(self, uri: str) -> bool:
+        return uri in self._recipes
+
+    def __len__(self) -> int:
+        return len(self._recipes)
+
+    def _revive(self, uri: str) -> Optional[_StoredRecipe]:
+        """Re-insert an evicted model that is still referenced elsewhere (e.g. by a session)."""
+        model = self._evicted.pop(uri, None)
+        if model is None:
+            return None
+        stored = self._recipes[uri] = _StoredRecipe(model, None)
+        self.stats["revived"] += 1
+        self._evict()
+        return stored
+
+    def _evict(self) -> None:
+        while len(self._recipes) > self.max_entries:
+            uri, stored = self._recipes.popitem(last=False)
+            if stored.model is not None:
+                self._evicted[uri] = stored.model
+            self.stats["evicted"] += 1
+
+    def clear(self) -> None:
+        """Evict every entry (models still referenced elsewhere stay resolvable)."""
+        for uri, stored in self._recipes.items():
+            if stored.model is not None:
+                self._evicted[uri] = stored.model
+        self._recipes.clear()
+
+    def status(self) -> dict:
+        return {
+            "size": len(self._recipes),
+            "max_entries": self.max_entries,
+            "persistent": self._db is not None,
+            **self.stats,
+        }
+
+
+# Global instance
+recipe_store = RecipeStore()
@@ -0,0 +1,176 @@
+"""Client-side rate limiting, retry backoff and circuit breaking for upstream APIs."""
+
+import asyncio
+import random
+import time
+from typing import Optional
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a rate limit token cannot be acquired in time."""
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the circuit breaker is open."""
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised instead of calling an upstream when the request deadline is too close."""
+
+
+class TokenBucket:
+    """
+    Async token bucket limiter.
+
+    Tokens refill continuously at `rate` per second up to `capacity`.
+    Callers wait for a token, but never longer than `max_wait` seconds.
+    """
+
+    def __init__(self, rate: float, capacity: float, max_wait: float = 10.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_wait = max_wait
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def available(self) -> float:
+        """Return the number of tokens currently in the bucket."""
+        self._refill()
+        return self.tokens
+
+    def try_acquire(self, reserve: float = 0.0) -> bool:
+        """
+        Take a token without waiting.
+
+        Args:
+            reserve: Tokens that must remain in the bucket afterwards, so
+                low-priority callers never starve regular traffic.
+        """
+        self._refill()
+        if self.tokens >= 1 + reserve:
+            self.tokens -= 1
+            return True
+        return False
+
+    async def acquire(self, max_wait: Optional[float] = None) -> None:
+        """
+        Wait for a token, raising RateLimitExceeded if none is available
+        within `max_wait` seconds (at most the bucket's own `max_wait`).
+        """
+        limit = self.max_wait if max_wait is None else min(max_wait, self.max_wait)
+        async with self._lock:
+            self._refill()
+            if self.tokens < 1:
+                wait = (1 - self.tokens) / self.rate
+                if wait > limit:
+                    raise RateLimitExceeded(
+                        f"Rate limit token not available within {limit:.2f}s"
+                    )
+                await asyncio.sleep(wait)
+                self._refill()
+            self.tokens -= 1
+
+    def status(self) -> dict:
+        """Return a snapshot of the bucket state."""
+        self._refill()
+        return {
+            "rate_per_second": self.rate,
+            "capacity": self.capacity,
+            "available_tokens": round(self.tokens, 2),
+        }
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    closed -> open after `failure_threshold` consecutive failures.
+    open -> half_open once `reset_timeout` seconds have passed; a single
+    trial call is then let through and closes or re-opens the circuit.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.total_failures = 0
+        self.total_rejections = 0
+        self._trial_in_flight = False
+
+    def allow(self) -> bool:
+        """Return True if a call may proceed."""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            else:
+                self.total_rejections += 1
+                return False
+
+        if self.state == self.HALF_OPEN:
+            if self._trial_in_flight:
+                self.total_rejections += 1
+                return False
+            self._trial_in_flight = True
+
+        return True
+
+    def release(self) -> None:
+        """End an allowed call that has no outcome (cancelled before the upstream answered)."""
+        self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self.total_failures += 1
+        self._trial_in_flight = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def status(self) -> dict:
+        """Return a snapshot of the breaker state."""
+        retry_in = None
+        if self.state == self.OPEN and self.opened_at is not None:
+            retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "total_failures": self.total_failures,
+            "total_rejections": self.total_rejections,
+            "retry_in_seconds": round(retry_in, 2) if retry_in is not None else None,
+        }
+
+
+def backoff_delay(
+    attempt: int, base: float, cap: float, retry_after: Optional[str] = None
+) -> float:
+    """
+    Compute a full-jitter exponential backoff delay.
+
+    A numeric Retry-After header from the upstream takes precedence
+    (still capped at `cap`).
+    """
+    if retry_after:
+        try:
+            return min(cap, max(0.0, float(retry_after)))
+        except ValueError:
+            pass
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
@@ -1,32 +1,143 @@
 """Service for managing user sessions."""
 
+import asyncio
+import json
+import time
 import uuid
+import zlib
+from collections import OrderedDict
 from datetime import datetime
-from typing import Dict, List, Optional
-from pydantic import BaseModel
+from itertools import chain
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from pydantic import BaseModel, PrivateAttr
 
+from app.config import settings
+from app.services.metrics import metrics
+from app.services.chat_archive import chat_archive
+from app.services.recipe_store import recipe_store
+from app.services.session_store import SessionStore, SqliteSessionStore
 from app.models.recipe import EdamamRecipe
 from app.models.user import MergedPreferences
 from app.models.chat import ChatMessage
+from agent.utils.history import extend_summary
+
+SAVE_ATTEMPTS = 5  # Compare-and-swap attempts before a write is given up
 
 
 class Session(BaseModel):
-    """Session model for storing search results and chat history."""
+    """
+    Session model for storing search results and chat history.
+
+    Recipes are indexed by URI, and the selected URIs kept as a list and a
+    set. The indexes are rebuilt whenever `all_recipes` or
+    `selected_recipes` is assigned, so replace those lists rather than
+    mutating them in place.
+    """
 
     session_id: str
     user_ids: List[int]
     merged_preferences: MergedPreferences
     all_recipes: List[EdamamRecipe]
     selected_recipes: List[EdamamRecipe]
-    chat_history: List[ChatMessage] = []
+    chat_history: List[ChatMessage] = []  # Last CHAT_HISTORY_WINDOW messages
+    chat_summary: str = ""  # Earlier user requests; the messages are in the chat archive
+    search_params: Dict[str, Any] = {}  # Edamam params behind all_recipes
+    prefetched: Dict[str, List[EdamamRecipe]] = {}  # search_params_key -> prefetched recipes
     created_at: str
 
+    _recipes_by_uri: Dict[str, EdamamRecipe] = PrivateAttr(default_factory=dict)
+    _all_uris: List[str] = PrivateAttr(default_factory=list)
+    _selected_uris: List[str] = PrivateAttr(default_factory=list)
+    _selected_uri_set: Set[str] = PrivateAttr(default_factory=set)
+
+    def model_post_init(self, context: Any) -> None:
+        self._index_all()
+        self._index_selected()
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        super().__setattr__(name, value)
+        if name == "all_recipes":
+            self._index_all()
+        elif name == "selected_recipes":
+            self._index_selected()
+
+    def _index_all(self) -> None:
+        self._all_uris = [r.uri for r in self.all_recipes]
+        # Search results first; selected recipes outside them stay reachable
+        self._recipes_by_uri = dict(zip(self._all_uris, self.all_recipes))
+        for recipe in self.selected_recipes:
+            self._recipes_by_uri.setdefault(recipe.uri, recipe)
+
+    def _index_selected(self) -> None:
+        self._selected_uris = [r.uri for r in self.selected_recipes]
+        self._selected_uri_set = set(self._selected_uris)
+        for recipe in self.selected_recipes:
+            self._recipes_by_uri.setdefault(recipe.uri, recipe)
+
+    def get_recipe(self, uri: str) -> Optional[EdamamRecipe]:
+        """Recipe with `uri` from the search results or selection, or None."""
+        return self._recipes_by_uri.get(uri)
+
+    def is_selected(self, uri: str) -> bool:
+        return uri in self._selected_uri_set
+
+    @property
+    def all_recipe_uris(self) -> List[str]:
+        """URIs of `all_recipes`, in order (do not mutate)."""
+        return self._all_uris
+
+    @property
+    def selected_recipe_uris(self) -> List[str]:
+        """URIs of `selected_recipes`, in order (do not mutate)."""
+        return self._selected_uris
+
 
 class SessionService:
-    """Service for managing sessions in memory."""
+    """
+    Service for managing sessions, cached in memory.
+
+    Sessions are kept in least-recently-used order with their last access
+    time and an approximate size: the compact JSON each write serializes
+    anyway, plus the recipes' own JSON size (computed once per recipe).
+    Beyond SESSION_MAX_COUNT sessions or SESSION_MAX_BYTES the least
+    recently used ones are evicted whenever a session is inserted or grows,
+    down to none if a single session is over the byte cap; sessions idle for
+    longer than SESSION_TTL_SECONDS are dropped by a background sweeper (see
+    start()).
+
+    With SESSION_BACKEND="sqlite" the cache is backed by a SessionStore that
+    all worker processes share: every write goes through to the store in
+    compact form (recipes as recipe-store URIs, zlib-compressed JSON), and
+    reads check the stored version so a copy cached by one worker is
+    reloaded after another worker changed it. A copy confirmed within
+    SESSION_VERSION_CHECK_SECONDS is used without asking the store again,
+    and load_session() runs the check in a worker thread for request
+    handlers. Writes go through
+    update_session(), which saves only if the stored version is still the
+    one this worker read and otherwise re-applies the change to the newer
+    copy, so concurrent turns and prefetches in different workers do not
+    overwrite each other. Evicting then only drops the
+    cached copy. With the default "memory" backend the cache is the only
+    copy, so a session evicted for any reason is gone and is handed to the
+    sweeper's cleanup like an expired one.
+    """
 
     def __init__(self):
-        self.sessions: Dict[str, Session] = {}
+        self.sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.last_access: Dict[str, float] = {}
+        self.sizes: Dict[str, int] = {}
+        self.total_bytes = 0
+        self.store: Optional[SessionStore] = None
+        self.versions: Dict[str, int] = {}  # Store version of each cached session
+        self.stored_access: Dict[str, float] = {}  # Last access recorded in the store
+        self.checked_at: Dict[str, float] = {}  # Monotonic time each cached copy last matched the store
+        self._sweeper: Optional[asyncio.Task] = None
+        self._gone: List[str] = []  # Evicted by the caps without a store, awaiting cleanup
+        self.stats = {
+            "created": 0, "loaded": 0, "expired": 0,
+            "evicted_ttl": 0, "evicted_count": 0, "evicted_bytes": 0, "evicted_deleted": 0,
+            "save_conflicts": 0,
+        }
 
     def create_session(
         self,
@@ -34,6 +145,7 @@ class SessionService:
         merged_preferences: MergedPreferences,
         all_recipes: List[EdamamRecipe],
         selected_recipes: List[EdamamRecipe],
+        search_params: Optional[Dict[str, Any]] = None,
     ) -> str:
         """Create a new session and return the session ID."""
         session_id = str(uuid.uuid4())
@@ -45,41 +157,416 @@ class SessionService:
             all_recipes=all_recipes,
             selected_recipes=selected_recipes,
             chat_history=[],
+            search_params=search_params or {},
             created_at=datetime.now().isoformat(),
         )
 
-        self.sessions[session_id] = session
+        self.add_session(session)
+        self.stats["created"] += 1
         return session_id
 
+    def add_session(self, session: Session) -> None:
+        """Store an existing session (e.g. one restored from its checkpoint)."""
+        self._register(session.all_recipes, session.selected_recipes, *session.prefetched.values())
+        data = self._serialize(session)
+        self._persist(session, data)
+        self._cache(session, data)
+
     def get_session(self, session_id: str) -> Optional[Session]:
-        """Get a session by ID."""
-        return self.sessions.get(session_id)
+        """Get a session by ID (marks it as recently used)."""
+        session = self.sessions.get(session_id)
+        if self.store is not None and not self._is_current(session_id):
+            session = self._read_through(session_id, session, self._fetch(session_id))
+        if session_id in self.sessions:
+            self._touch(session_id)
+        return session
+
+    async def load_session(self, session_id: str) -> Optional[Session]:
+        """get_session for request handlers: any store read runs in a worker thread."""
+        session = self.sessions.get(session_id)
+        if self.store is not None and not self._is_current(session_id):
+            fetched = await asyncio.to_thread(self._fetch, session_id)
+            session = self._read_through(session_id, self.sessions.get(session_id), fetched)
+        if session_id in self.sessions:
+            self._touch(session_id)
+        return session
 
     def session_exists(self, session_id: str) -> bool:
         """Check if a session exists."""
-        return session_id in self.sessions
+        if self.store is None:
+            return session_id in self.sessions
+        return self.get_session(session_id) is not None
+
+    def _is_current(self, session_id: str) -> bool:
+        """True if the cached copy matched the store within SESSION_VERSION_CHECK_SECONDS."""
+        checked_at = self.checked_at.get(session_id)
+        return (
+            session_id in self.sessions and checked_at is not None
+            and time.monotonic() - checked_at < settings.SESSION_VERSION_CHECK_SECONDS
+        )
+
+    def _fetch(self, session_id: str) -> Optional[Tuple[int, Optional[bytes]]]:
+        """
+        Store reads behind _read_through (safe to run in a worker thread):
+        None if the session is not stored, else (version, data), with data
+        None when the cached copy already is at that version.
+        """
+        version = self.store.version(session_id)
+        if version is None:
+            return None
+        if session_id in self.sessions and self.versions.get(session_id) == version:
+            return version, None
+        loaded = self.store.load(session_id)
+        if loaded is None:
+            return None
+        data, version = loaded
+        return version, data
+
+    def _read_through(
+        self, session_id: str, cached: Optional[Session], fetched: Optional[Tuple[int, Optional[bytes]]]
+    ) -> Optional[Session]:
+        """The cached session if it matches the fetched version, else the stored one."""
+        if fetched is None:
+            if cached is not None:
+                # Expired or deleted by another worker
+                self._evict(session_id, "deleted")
+            return None
+        version, stored = fetched
+        # Also covers a write by this worker while the store was read
+        if cached is not None and self.versions.get(session_id, -1) >= version:
+            self.checked_at[session_id] = time.monotonic()
+            return cached
+        if stored is None:
+            # The cached copy was dropped while the store was read
+            return self._read_through(session_id, cached, self._fetch(session_id))
+
+        data = zlib.decompress(stored)
+        session = self._restore(data)
+        self.versions[session_id] = version
+        self.checked_at[session_id] = time.monotonic()
+        self._cache(session, data)
+        self.stats["loaded"] += 1
+        return session
+
+    def _cache(self, session: Session, data: bytes) -> None:
+        """Insert a session given its serialized form (see _serialize)."""
+        self.sessions[session.session_id] = session
+        self._touch(session.session_id)
+        self._resize(session, data)
+
+    def _touch(self, session_id: str) -> None:
+        now = time.time()
+        self.sessions.move_to_end(session_id)
+        self.last_access[session_id] = now
+        # Idle expiry in the store sees accesses from every worker, at most one write per interval
+        if self.store is not None and now - self.stored_access.get(session_id, 0) > settings.SESSION_TOUCH_INTERVAL_SECONDS:
+            self.store.touch(session_id, now)
+            self.stored_access[session_id] = now
+
+    def _resize(self, session: Session, data: bytes) -> None:
+        """Refresh a cached session's size estimate from its serialized form, then apply the caps."""
+        recipes = {r.uri: r for r in chain(session.all_recipes, session.selected_recipes, *session.prefetched.values())}
+        size = len(data) + sum(r.json_size() for r in recipes.values())
+        self.total_bytes += size - self.sizes.get(session.session_id, 0)
+        self.sizes[session.session_id] = size
+        self._enforce_limits()
+
+    def _changed(self, session: Session) -> bool:
+        """Record a write: serialize once, write through to the store and refresh the size estimate."""
+        data = self._serialize(session)
+        if not self._persist(session, data):
+            return False
+        if session.session_id in self.sessions:
+            self._resize(session, data)
+        return True
+
+    def _persist(self, session: Session, data: bytes) -> bool:
+        """
+        Save a session to the store; False if another worker saved a newer
+        version (or deleted it) since this worker read it.
+        """
+        if self.store is None:
+            return True
+        now = time.time()
+        session_id = session.session_id
+        version = self.store.save(
+            session_id, zlib.compress(data), now, expected_version=self.versions.get(session_id)
+        )
+        if version is None:
+            return False
+        self.versions[session_id] = version
+        self.checked_at[session_id] = time.monotonic()
+        self.stored_access[session_id] = now
+        return True
+
+    def update_session(self, session_id: str, change: Callable[[Session], None]) -> Optional[Session]:
+        """
+        Apply `change` to a session and write it through; returns the
+        updated session, or None if it does not exist.
+
+        With a store, a write that lost the race against another worker is
+        retried: the newer stored copy is loaded and `change` applied to it
+        again, so `change` must only modify the session it is given.
+        Recipes it puts in the session must already be in the recipe store
+        (see _register).
+        """
+        for _ in range(SAVE_ATTEMPTS):
+            session = self.get_session(session_id)
+            if session is None:
+                return None
+            change(session)
+            if self._changed(session):
+                return session
+            self.stats["save_conflicts"] += 1
+            metrics.increment("session_save_conflicts")
+            # Reload on the next read
+            self.versions.pop(session_id, None)
+            self.checked_at.pop(session_id, None)
+        print(f"[SessionService] Gave up saving session {session_id} after {SAVE_ATTEMPTS} conflicting writes")
+        return None
+
+    @staticmethod
+    def _register(*recipe_lists: List[EdamamRecipe]) -> None:
+        """
+        Add recipes entering a session to the recipe store, once: graph
+        state and the stored session form refer to them by URI (and with a
+        store, other workers resolve them from its SQLite table).
+        """
+        recipe_store.add(chain(*recipe_lists))
+
+    @staticmethod
+    def _serialize(session: Session) -> bytes:
+        """Compact JSON form (recipes as recipe-store URIs); stored zlib-compressed."""
+        payload = session.model_dump(mode="json", exclude={"all_recipes", "selected_recipes", "prefetched"})
+        payload["all_recipe_uris"] = session.all_recipe_uris
+        payload["selected_recipe_uris"] = session.selected_recipe_uris
+        payload["prefetched_uris"] = {key: [r.uri for r in recipes] for key, recipes in session.prefetched.items()}
+        return json.dumps(payload, separators=(",", ":")).encode()
+
+    @staticmethod
+    def _restore(data: bytes) -> Session:
+        payload = json.loads(data)
+        all_uris = payload.pop("all_recipe_uris")
+        selected_uris = payload.pop("selected_recipe_uris")
+        prefetched_uris = payload.pop("prefetched_uris")
+        return Session(
+            **payload,
+            all_recipes=recipe_store.models(all_uris),
+            selected_recipes=recipe_store.models(selected_uris),
+            prefetched={key: recipe_store.models(uris) for key, uris in prefetched_uris.items()},
+        )
+
+    def _evict(self, session_id: str, reason: str) -> None:
+        """Drop a session from the cache (and from memory, without a store)."""
+        self.sessions.pop(session_id, None)
+        self.last_access.pop(session_id, None)
+        self.versions.pop(session_id, None)
+        self.checked_at.pop(session_id, None)
+        self.stored_access.pop(session_id, None)
+        self.total_bytes -= self.sizes.pop(session_id, 0)
+        self.stats[f"evicted_{reason}"] += 1
+        metrics.increment("sessions_evicted", reason=reason)
+        if self.store is None and reason in ("count", "bytes"):
+            self._gone.append(session_id)
+        print(f"[SessionService] Evicted session {session_id} ({reason})")
+
+    def _enforce_limits(self) -> None:
+        """Evict least recently used sessions beyond the count and byte caps."""
+        while self.sessions:
+            if len(self.sessions) > settings.SESSION_MAX_COUNT:
+                reason = "count"
+            elif self.total_bytes > settings.SESSION_MAX_BYTES:
+                reason = "bytes"
+            else:
+                break
+            session_id = next(iter(self.sessions))
+            if len(self.sessions) == 1:
+                print(
+                    f"[SessionService] Session {session_id} alone is {self.sizes.get(session_id, 0)} bytes, "
+                    f"over SESSION_MAX_BYTES ({settings.SESSION_MAX_BYTES})"
+                )
+            self._evict(session_id, reason)
+        self._update_gauges()
+
+    def expire_idle(self, now: Optional[float] = None) -> List[str]:
+        """
+        Evict sessions idle for longer than SESSION_TTL_SECONDS and return
+        the IDs of sessions that are gone for good.
+
+        With a store, idle sessions only leave this worker's cache; the
+        stored copy expires by its last access in any worker. Without one,
+        sessions evicted by the count and byte caps since the last call are
+        returned as well.
+        """
+        cutoff = (now or time.time()) - settings.SESSION_TTL_SECONDS
+        expired = []
+        # LRU order: the first session accessed after the cutoff ends the scan
+        for session_id in self.sessions:
+            if self.last_access[session_id] > cutoff:
+                break
+            expired.append(session_id)
+        for session_id in expired:
+            self._evict(session_id, "ttl")
+
+        if self.store is not None:
+            expired = self.store.expire(cutoff)
+            for session_id in expired:
+                if session_id in self.sessions:
+                    self._evict(session_id, "ttl")
+        self.stats["expired"] += len(expired)
+        metrics.increment("sessions_expired", len(expired))
+        self._update_gauges()
+        gone, self._gone = self._gone, []
+        return expired + gone
+
+    def attach(self, store: SessionStore) -> None:
+        """Back the cache with `store`."""
+        self.store = store
+
+    def detach(self) -> None:
+        """Close the store; the cache becomes the only copy again."""
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+        self.versions.clear()
+        self.checked_at.clear()
+        self.stored_access.clear()
+
+    def start(self, on_expired: Optional[Callable[[str], Awaitable[None]]] = None) -> None:
+        """
+        Open the configured store and start the idle-session sweeper
+        (FastAPI lifespan).
+
+        `on_expired` is awaited for every session that is gone for good
+        (see expire_idle), e.g. to drop its checkpoint as well.
+        """
+        if settings.SESSION_BACKEND == "sqlite" and self.store is None:
+            self.attach(SqliteSessionStore(settings.SESSION_DB_PATH))
+            # Stored sessions reference recipes by URI, shared by all workers
+            recipe_store.attach(settings.RECIPE_STORE_DB_PATH)
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep(on_expired))
+
+    async def shutdown(self) -> None:
+        """Stop the sweeper and close the store."""
+        sweeper, self._sweeper = self._sweeper, None
+        if sweeper is not None:
+            sweeper.cancel()
+            await asyncio.gather(sweeper, return_exceptions=True)
+        if self.store is not None:
+            self.detach()
+            recipe_store.detach()
+
+    async def _sweep(self, on_expired: Optional[Callable[[str], Awaitable[None]]]) -> None:
+        while True:
+            await asyncio.sleep(settings.SESSION_SWEEP_INTERVAL_SECONDS)
+            for session_id in self.expire_idle():
+                if on_expired is None:
+                    continue
+                try:
+                    await on_expired(session_id)
+                except Exception as e:
+                    print(f"[SessionService] Cleanup of expired session {session_id} failed: {e}")
+
+    def _update_gauges(self) -> None:
+        metrics.set_gauge("sessions_active", len(self.sessions))
+        metrics.set_gauge("sessions_memory_bytes", self.total_bytes)
 
     def update_chat_history(
-        self, session_id: str, user_message: str, assistant_response: str
-    ) -> None:
-        """Add messages to chat history."""
-        session = self.get_session(session_id)
-        if session:
+        self,
+        session_id: str,
+        user_message: str,
+        assistant_response: str,
+        change: Optional[Callable[[Session], None]] = None,
+    ) -> Optional[Session]:
+        """
+        Add messages to chat history (bounded, see _compact_history) and
+        return the updated session, or None if it does not exist.
+
+        `change` (see update_session) is applied in the same write, so a
+        turn's other updates cost no extra save.
+        """
+        dropped: List[dict] = []
+
+        def add_turn(session: Session) -> None:
+            if change is not None:
+                change(session)
             session.chat_history.append(
                 ChatMessage(role="user", content=user_message)
             )
             session.chat_history.append(
                 ChatMessage(role="assistant", content=assistant_response)
             )
+            dropped[:] = self._compact_history(session)
+
+        # Archived only once the write succeeded, so a retried write archives once
+        session = self.update_session(session_id, add_turn)
+        if session is not None and dropped:
+            self._archive(session_id, dropped)
+        return session
+
+    def _compact_history(self, session: Session) -> List[dict]:
+        """Move messages beyond CHAT_HISTORY_WINDOW into the summary; return the moved messages."""
+        window = settings.CHAT_HISTORY_WINDOW
+        if len(session.chat_history) <= window:
+            return []
+        dropped = [m.model_dump() for m in session.chat_history[:-window]]
+        session.chat_history = session.chat_history[-window:]
+        session.chat_summary = extend_summary(session.chat_summary, dropped, settings.CHAT_SUMMARY_MAX_CHARS)
+        return dropped
+
+    def _archive(self, session_id: str, dropped: List[dict]) -> None:
+        """Append messages that left the window to the chat archive."""
+        if settings.CHAT_ARCHIVE_ENABLED:
+            try:
+                chat_archive.append(session_id, dropped)
+            except Exception as e:
+                print(f"[SessionService] Could not archive chat messages for {session_id}: {e}")
+        metrics.increment("chat_messages_archived", len(dropped))
+
+    def get_chat_history(self, session_id: str) -> Optional[List[ChatMessage]]:
+        """Full chat history of a session: archived messages, then the window."""
+        session = self.get_session(session_id)
+        if session is None:
+            return None
+        archived = chat_archive.load(session_id) if settings.CHAT_ARCHIVE_ENABLED else []
+        return [ChatMessage(**m) for m in archived] + list(session.chat_history)
 
     def update_selected_recipes(
         self, session_id: str, new_recipes: List[EdamamRecipe]
     ) -> None:
         """Update the selected recipes for a session."""
-        session = self.get_session(session_id)
-        if session:
+        self._register(new_recipes)
+
+        def select(session: Session) -> None:
             session.selected_recipes = new_recipes
 
+        self.update_session(session_id, select)
+
+    def add_prefetched(
+        self, session_id: str, key: str, recipes: List[EdamamRecipe]
+    ) -> None:
+        """Store prefetched recipes for a refinement search of a session."""
+        self._register(recipes)
+
+        def store(session: Session) -> None:
+            session.prefetched[key] = recipes
+
+        self.update_session(session_id, store)
+
+    def status(self) -> dict:
+        """Return session counts, estimated memory and eviction counters."""
+        return {
+            "active": len(self.sessions),
+            "max_count": settings.SESSION_MAX_COUNT,
+            "estimated_bytes": self.total_bytes,
+            "max_bytes": settings.SESSION_MAX_BYTES,
+            "ttl_seconds": settings.SESSION_TTL_SECONDS,
+            "store": type(self.store).__name__ if self.store is not None else None,
+            "stored": self.store.count() if self.store is not None else len(self.sessions),
+            **self.stats,
+        }
+
     def get_all_recipes(self, session_id: str) -> Optional[List[EdamamRecipe]]:
         """Get all recipes from a session."""
         session = self.get_session(session_id)
@@ -0,0 +1,142 @@
+"""Durable session storage shared by worker processes."""
+
+import sqlite3
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+
+class SessionStore(ABC):
+    """
+    Storage behind SessionService's in-process cache.
+
+    Values are opaque serialized sessions. Every save bumps the session's
+    version, so a worker can cheaply check whether its cached copy is still
+    current before using it, and saves are compare-and-swap on that
+    version so one worker never overwrites another's newer write.
+    `accessed_at` (epoch seconds) drives idle expiry across all workers.
+    """
+
+    @abstractmethod
+    def load(self, session_id: str) -> Optional[Tuple[bytes, int]]:
+        """Return (data, version), or None if the session is not stored."""
+
+    @abstractmethod
+    def version(self, session_id: str) -> Optional[int]:
+        """Return the stored version, or None if the session is not stored."""
+
+    @abstractmethod
+    def save(
+        self, session_id: str, data: bytes, accessed_at: float, expected_version: Optional[int] = None
+    ) -> Optional[int]:
+        """
+        Store a session and return its new version.
+
+        With `expected_version` the session is only replaced if it is still
+        stored at that version; None is returned otherwise (another worker
+        saved or deleted it first). Without it the session is inserted or
+        replaced unconditionally.
+        """
+
+    @abstractmethod
+    def touch(self, session_id: str, accessed_at: float) -> None:
+        """Record an access without rewriting the session."""
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None:
+        """Remove a session if it is stored."""
+
+    @abstractmethod
+    def expire(self, cutoff: float) -> List[str]:
+        """Delete sessions last accessed before `cutoff` and return their IDs."""
+
+    @abstractmethod
+    def count(self) -> int:
+        """Number of stored sessions."""
+
+    def close(self) -> None:
+        pass
+
+
+class SqliteSessionStore(SessionStore):
+    """
+    SessionStore in a SQLite database in WAL mode.
+
+    WAL lets readers in every worker process proceed while one writes;
+    writers wait up to `timeout` seconds for each other. Each process opens
+    its own connections, so all workers on a host can share one file.
+    load() and version() use a separate read connection, so they can run
+    in worker threads without seeing another thread's open write.
+    """
+
+    def __init__(self, path: Path, timeout: float = 5.0):
+        self.path = path
+        self._db = sqlite3.connect(str(path), timeout=timeout, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")  # Durable across process crashes in WAL mode
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, data BLOB NOT NULL, "
+            "version INTEGER NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_accessed_at ON sessions (accessed_at)")
+        self._db.commit()
+        self._reader = sqlite3.connect(str(path), timeout=timeout, check_same_thread=False)
+        print(f"[SqliteSessionStore] Storing sessions in {path}")
+
+    def load(self, session_id: str) -> Optional[Tuple[bytes, int]]:
+        row = self._reader.execute(
+            "SELECT data, version FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return None if row is None else (row[0], row[1])
+
+    def version(self, session_id: str) -> Optional[int]:
+        row = self._reader.execute(
+            "SELECT version FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def save(
+        self, session_id: str, data: bytes, accessed_at: float, expected_version: Optional[int] = None
+    ) -> Optional[int]:
+        with self._db:
+            if expected_version is None:
+                row = self._db.execute(
+                    "INSERT INTO sessions (session_id, data, version, accessed_at) VALUES (?, ?, 1, ?) "
+                    "ON CONFLICT (session_id) DO UPDATE SET data = excluded.data, "
+                    "version = sessions.version + 1, accessed_at = excluded.accessed_at "
+                    "RETURNING version",
+                    (session_id, data, accessed_at),
+                ).fetchone()
+            else:
+                row = self._db.execute(
+                    "UPDATE sessions SET data = ?, version = version + 1, accessed_at = MAX(accessed_at, ?) "
+                    "WHERE session_id = ? AND version = ? RETURNING version",
+                    (data, accessed_at, session_id, expected_version),
+                ).fetchone()
+        return None if row is None else row[0]
+
+    def touch(self, session_id: str, accessed_at: float) -> None:
+        with self._db:
+            self._db.execute(
+                "UPDATE sessions SET accessed_at = MAX(accessed_at, ?) WHERE session_id = ?",
+                (accessed_at, session_id),
+            )
+
+    def delete(self, session_id: str) -> None:
+        with self._db:
+            self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def expire(self, cutoff: float) -> List[str]:
+        with self._db:
+            rows = self._db.execute(
+                "DELETE FROM sessions WHERE accessed_at < ? RETURNING session_id", (cutoff,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def count(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def close(self) -> None:
+        self._reader.close()
+        self._db.close()
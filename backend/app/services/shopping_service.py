@@ -110,13 +110,7 @@ class ShoppingService:
         if not session:
             raise ValueError("Session not found")
 
-        # Find recipe in session
-        recipe = None
-        for r in session.all_recipes:
-            if r.uri == recipe_uri:
-                recipe = r
-                break
-
+        recipe = session.get_recipe(recipe_uri)
         if not recipe:
             raise ValueError("Recipe not found in session")
 
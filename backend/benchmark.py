@@ -0,0 +1,163 @@
+"""
+Benchmark the agent graphs end to end without network access.
+
+Runs `graph` (initial search) and `chat_graph` (refinement turns) with the
+fake LLM provider and the fake_upstream Edamam app mounted in-process, then
+splits each invocation's wall time into time inside LLM calls, time inside
+Edamam requests and the rest: framework overhead (state copying, pydantic
+validation, JSON, graph scheduling).
+
+    uv run python benchmark.py --runs 50
+    uv run python benchmark.py --runs 20 --llm-latency-ms 800 --edamam-latency-ms 300
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from typing import Dict, List
+
+
+CHAT_MESSAGES = [
+    "Can you make it vegetarian?",
+    "Is the first recipe kid friendly?",
+    "Show me something with chicken instead",
+    "Only recipes under 30 minutes",
+]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark graph and chat_graph with fake upstreams")
+    parser.add_argument("--runs", type=int, default=20, help="Measured invocations per graph")
+    parser.add_argument("--warmup", type=int, default=2, help="Unmeasured invocations per graph")
+    parser.add_argument("--turns", type=int, default=len(CHAT_MESSAGES), help="Chat turns per chat_graph run")
+    parser.add_argument("--user-ids", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0)
+    parser.add_argument("--edamam-latency-ms", type=float, default=0.0)
+    parser.add_argument("--edamam-cache", action="store_true", help="Keep the Edamam response cache between runs")
+    return parser.parse_args()
+
+
+def configure(args: argparse.Namespace) -> None:
+    """Point settings at the fake upstreams (Settings is read at import time)."""
+    os.environ["LLM_PROVIDER"] = "fake"
+    os.environ["FAKE_LLM_SEED"] = str(args.seed)
+    os.environ["FAKE_LLM_LATENCY_MS"] = str(args.llm_latency_ms)
+    os.environ["FAKE_SEED"] = str(args.seed)
+    os.environ["FAKE_EDAMAM_LATENCY_MS"] = str(args.edamam_latency_ms)
+    os.environ["FAKE_EDAMAM_LATENCY_SIGMA"] = "0"
+    os.environ["EDAMAM_APP_ID"] = os.environ["EDAMAM_APP_KEY"] = "benchmark"
+    # The client-side quota would otherwise dominate every run
+    os.environ["EDAMAM_RATE_LIMIT_PER_MINUTE"] = "1000000"
+    os.environ["EDAMAM_RATE_LIMIT_BURST"] = "1000000"
+
+
+def span_total_ms(name: str) -> float:
+    """Total time recorded by spans called `name`, across all labels."""
+    from app.services.metrics import metrics
+
+    return sum(h.sum for (metric, _), h in metrics.histograms.items() if metric == f"{name}_duration_ms")
+
+
+def node_p50s() -> Dict[str, float]:
+    from app.services.metrics import metrics
+
+    return {
+        dict(labels).get("node", "?"): h.percentile(50)
+        for (metric, labels), h in metrics.histograms.items()
+        if metric == "graph.node_duration_ms"
+    }
+
+
+def report(name: str, wall_ms: List[float]) -> None:
+    """Print latency percentiles and the LLM / Edamam / overhead split per invocation."""
+    runs = len(wall_ms)
+    ordered = sorted(wall_ms)
+    llm_ms = span_total_ms("llm.call") / runs
+    edamam_ms = span_total_ms("edamam.request") / runs
+    mean_ms = statistics.fmean(wall_ms)
+
+    print(f"\n{name} ({runs} runs)")
+    print(f"  wall      p50 {ordered[runs // 2]:8.2f} ms   p95 {ordered[min(runs - 1, int(runs * 0.95))]:8.2f} ms"
+          f"   mean {mean_ms:8.2f} ms")
+    print(f"  llm       {llm_ms:8.2f} ms/run")
+    print(f"  edamam    {edamam_ms:8.2f} ms/run")
+    # Parallel searches overlap, so this understates overhead when Edamam latency is set
+    print(f"  overhead  {mean_ms - llm_ms - edamam_ms:8.2f} ms/run")
+    for node, p50 in sorted(node_p50s().items()):
+        print(f"  node {node:<16} p50 {p50:8.2f} ms")
+
+
+async def run(args: argparse.Namespace) -> None:
+    import httpx
+    from fake_upstream import create_app
+    from agent.agent import graph, chat_graph
+    from agent.utils.llm import new_deadline
+    from app.api.initial_search import initial_state
+    from app.config import settings
+    from app.services.edamam_service import edamam_service
+    from app.services.metrics import metrics
+    from app.services.user_service import user_service
+
+    edamam_service.base_url = "http://fake-upstream/api/recipes/v2"
+    edamam_service.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app()))
+    merged_prefs = user_service.merge_preferences(args.user_ids)
+
+    async def initial_search() -> dict:
+        if not args.edamam_cache:
+            edamam_service.cache.clear()
+        return await graph.ainvoke(initial_state(args.user_ids, merged_prefs))
+
+    async def chat(state: dict, message: str) -> dict:
+        if not args.edamam_cache:
+            edamam_service.cache.clear()
+        result = await chat_graph.ainvoke({
+            **state,
+            "current_message": message,
+            "action": "refine",
+            "agent_response": None,
+            "deadline": new_deadline(),
+        })
+        history = result.get("chat_history", []) + [
+            {"role": "user", "content": message},
+            {"role": "assistant", "content": result.get("agent_response") or ""},
+        ]
+        # Sessions keep a bounded window (the summary is left out here)
+        return {**result, "chat_history": history[-settings.CHAT_HISTORY_WINDOW:]}
+
+    try:
+        wall_ms = []
+        for i in range(args.warmup + args.runs):
+            if i == args.warmup:
+                metrics.reset()
+            start = time.perf_counter()
+            base_state = await initial_search()
+            if i >= args.warmup:
+                wall_ms.append((time.perf_counter() - start) * 1000)
+        report("graph", wall_ms)
+
+        wall_ms = []
+        for i in range(args.warmup + args.runs):
+            if i == args.warmup:
+                metrics.reset()
+            state = base_state
+            for message in CHAT_MESSAGES[:args.turns]:
+                start = time.perf_counter()
+                state = await chat(state, message)
+                if i >= args.warmup:
+                    wall_ms.append((time.perf_counter() - start) * 1000)
+        report("chat_graph", wall_ms)
+    finally:
+        await edamam_service.close()
+
+
+def main():
+    args = parse_args()
+    configure(args)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+"""Local stand-ins for Edamam and OpenAI used for offline load testing."""
+
+from fake_upstream.server import create_app, FakeUpstreamConfig
+
+__all__ = ["create_app", "FakeUpstreamConfig"]
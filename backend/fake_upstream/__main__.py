@@ -0,0 +1,41 @@
+"""Run the fake upstream server: `uv run python -m fake_upstream --port 8001`."""
+
+import argparse
+import os
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Edamam/OpenAI upstream server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--seed", type=int, help="Overrides FAKE_SEED")
+    parser.add_argument("--edamam-latency-ms", type=float, help="Overrides FAKE_EDAMAM_LATENCY_MS")
+    parser.add_argument("--openai-latency-ms", type=float, help="Overrides FAKE_OPENAI_LATENCY_MS")
+    parser.add_argument("--edamam-error-rate", type=float, help="Overrides FAKE_EDAMAM_ERROR_RATE")
+    parser.add_argument("--openai-error-rate", type=float, help="Overrides FAKE_OPENAI_ERROR_RATE")
+    parser.add_argument("--recordings", help="Overrides FAKE_EDAMAM_RECORDINGS_DIR")
+    args = parser.parse_args()
+
+    overrides = {
+        "FAKE_SEED": args.seed,
+        "FAKE_EDAMAM_LATENCY_MS": args.edamam_latency_ms,
+        "FAKE_OPENAI_LATENCY_MS": args.openai_latency_ms,
+        "FAKE_EDAMAM_ERROR_RATE": args.edamam_error_rate,
+        "FAKE_OPENAI_ERROR_RATE": args.openai_error_rate,
+        "FAKE_EDAMAM_RECORDINGS_DIR": args.recordings,
+    }
+    for key, value in overrides.items():
+        if value is not None:
+            os.environ[key] = str(value)
+
+    import uvicorn
+    from fake_upstream import create_app
+
+    print(f"Point the backend at it with:")
+    print(f"  EDAMAM_BASE_URL=http://{args.host}:{args.port}/api/recipes/v2")
+    print(f"  OPENAI_BASE_URL=http://{args.host}:{args.port}/v1")
+    uvicorn.run(create_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
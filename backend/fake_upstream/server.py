@@ -0,0 +1,196 @@
+"""FastAPI stand-in for the Edamam v2 and OpenAI chat completions APIs."""
+
+import asyncio
+import json
+import math
+import os
+import random
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from fake_upstream.synthetic import synthetic_edamam_response, synthetic_chat_content
+
+
+class UpstreamProfile:
+    """Latency distribution and error rate for one fake upstream."""
+
+    def __init__(self, median_ms: float, sigma: float, error_rate: float, error_statuses: List[int]):
+        self.median_ms = median_ms
+        self.sigma = sigma  # Log-normal shape; 0 gives a constant latency
+        self.error_rate = error_rate
+        self.error_statuses = error_statuses
+
+    def latency(self, rng: random.Random) -> float:
+        """Sample a latency in seconds."""
+        if self.median_ms <= 0:
+            return 0.0
+        return rng.lognormvariate(math.log(self.median_ms), self.sigma) / 1000.0
+
+    def error_status(self, rng: random.Random) -> Optional[int]:
+        """Return an error status to inject, or None."""
+        if rng.random() < self.error_rate:
+            return rng.choice(self.error_statuses)
+        return None
+
+
+class FakeUpstreamConfig:
+    """Fake upstream configuration, read from FAKE_* environment variables."""
+
+    def __init__(self):
+        self.seed = int(os.getenv("FAKE_SEED", "0"))
+        self.edamam = UpstreamProfile(
+            median_ms=float(os.getenv("FAKE_EDAMAM_LATENCY_MS", "300")),
+            sigma=float(os.getenv("FAKE_EDAMAM_LATENCY_SIGMA", "0.4")),
+            error_rate=float(os.getenv("FAKE_EDAMAM_ERROR_RATE", "0")),
+            error_statuses=[429, 503],
+        )
+        self.openai = UpstreamProfile(
+            median_ms=float(os.getenv("FAKE_OPENAI_LATENCY_MS", "1200")),
+            sigma=float(os.getenv("FAKE_OPENAI_LATENCY_SIGMA", "0.5")),
+            error_rate=float(os.getenv("FAKE_OPENAI_ERROR_RATE", "0")),
+            error_statuses=[429, 500],
+        )
+        recordings = os.getenv("FAKE_EDAMAM_RECORDINGS_DIR")
+        self.recordings_dir: Optional[Path] = Path(recordings) if recordings else None
+
+
+def load_recordings(directory: Optional[Path]) -> Dict[str, dict]:
+    """
+    Load recorded Edamam responses.
+
+    Each `<name>.json` file is a raw Edamam v2 response body; it is served
+    for searches whose `q` equals `<name>`.
+    """
+    if not directory or not directory.is_dir():
+        return {}
+    return {path.stem.lower(): json.loads(path.read_text()) for path in sorted(directory.glob("*.json"))}
+
+
+def create_app(config: Optional[FakeUpstreamConfig] = None) -> FastAPI:
+    """Create the fake upstream app."""
+    config = config or FakeUpstreamConfig()
+    recordings = load_recordings(config.recordings_dir)
+    rng = random.Random(config.seed)
+    app = FastAPI(title="Fake Edamam/OpenAI upstream")
+    app.state.config = config
+    app.state.stats = {"edamam_requests": 0, "openai_requests": 0, "injected_errors": 0}
+
+    async def _delay_or_error(profile: UpstreamProfile) -> Optional[JSONResponse]:
+        await asyncio.sleep(profile.latency(rng))
+        status = profile.error_status(rng)
+        if status is not None:
+            app.state.stats["injected_errors"] += 1
+            return JSONResponse(
+                status_code=status,
+                content={"error": {"message": f"Injected error {status}"}},
+                headers={"Retry-After": "1"} if status == 429 else None,
+            )
+        return None
+
+    @app.get("/api/recipes/v2")
+    async def edamam_search(request: Request):
+        """Edamam Recipe Search v2 stand-in."""
+        app.state.stats["edamam_requests"] += 1
+        error = await _delay_or_error(config.edamam)
+        if error:
+            return error
+
+        params: Dict[str, List[str]] = {}
+        for key, value in request.query_params.multi_items():
+            params.setdefault(key, []).append(value)
+
+        query = (params.get("q") or [""])[0].lower()
+        if query in recordings:
+            return recordings[query]
+        return synthetic_edamam_response(params)
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        """OpenAI chat completions stand-in (non-streaming and SSE streaming)."""
+        app.state.stats["openai_requests"] += 1
+        body = await request.json()
+        error = await _delay_or_error(config.openai)
+        if error:
+            return error
+
+        messages = body.get("messages", [])
+        content = synthetic_chat_content(messages, seed=config.seed)
+        model = body.get("model", "gpt-4o-mini")
+        # Structured output via function calling: answer with a call to the first tool
+        tools = body.get("tools") or []
+        tool_name = tools[0]["function"]["name"] if tools else None
+        call_id = f"call_fake_{uuid.uuid4().hex[:12]}"
+        finish_reason = "tool_calls" if tool_name else "stop"
+        completion_id = f"chatcmpl-fake-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // 4
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(content) // 4 + 1,
+            "total_tokens": prompt_tokens + len(content) // 4 + 1,
+        }
+
+        if not body.get("stream"):
+            message = {"role": "assistant", "content": content}
+            if tool_name:
+                message = {"role": "assistant", "content": None, "tool_calls": [{
+                    "id": call_id,
+                    "type": "function",
+                    "function": {"name": tool_name, "arguments": content},
+                }]}
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                "usage": usage,
+            }
+
+        async def events():
+            def chunk(choices: list, **extra) -> str:
+                payload = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": choices,
+                    **extra,
+                }
+                return f"data: {json.dumps(payload)}\n\n"
+
+            def delta(content_delta: dict, finish_reason=None) -> list:
+                return [{"index": 0, "delta": content_delta, "finish_reason": finish_reason}]
+
+            def tool_delta(arguments: str, **function) -> dict:
+                call = {"index": 0, "function": {"arguments": arguments, **function}}
+                if function:
+                    call.update(id=call_id, type="function")
+                return {"tool_calls": [call]}
+
+            if tool_name:
+                yield chunk(delta({"role": "assistant", "content": None, **tool_delta("", name=tool_name)}))
+            else:
+                yield chunk(delta({"role": "assistant", "content": ""}))
+            for start in range(0, len(content), 16):
+                piece = content[start:start + 16]
+                yield chunk(delta(tool_delta(piece) if tool_name else {"content": piece}))
+                await asyncio.sleep(0)
+            yield chunk(delta({}, finish_reason=finish_reason))
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield chunk([], usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def stats():
+        """Request and injected error counters."""
+        return app.state.stats
+
+    return app
@@ -0,0 +1,177 @@
+"""Synthetic Edamam recipes and chat completion content for offline runs."""
+
+import ast
+import hashlib
+import json
+import random
+import re
+from typing import Dict, List, Optional
+
+
+CUISINES = [
+    "american", "asian", "british", "chinese", "french", "greek", "indian",
+    "italian", "japanese", "mediterranean", "mexican", "middle eastern", "nordic",
+]
+DISH_TYPES = ["main course", "soup", "salad", "starter", "side dish", "bread", "desserts"]
+MEAL_TYPES = ["lunch/dinner", "breakfast", "snack", "teatime"]
+PROTEINS = ["Chicken", "Beef", "Salmon", "Cod", "Tofu", "Lentil", "Pork", "Chickpea", "Shrimp", "Egg"]
+STYLES = ["Stew", "Curry", "Pasta", "Salad", "Tacos", "Soup", "Bake", "Stir-Fry", "Bowl", "Skewers"]
+HEALTH_LABELS = [
+    "vegetarian", "vegan", "gluten-free", "dairy-free", "peanut-free",
+    "tree-nut-free", "egg-free", "fish-free", "shellfish-free", "pork-free",
+]
+INGREDIENTS = [
+    "2 cups rice", "1 onion, chopped", "3 cloves garlic", "400 g tomatoes",
+    "1 tbsp olive oil", "200 ml coconut milk", "1 tsp cumin", "500 g potatoes",
+    "1 lemon", "100 g spinach", "2 carrots", "1 bell pepper",
+]
+
+
+def seeded_rng(*parts) -> random.Random:
+    """Return a Random seeded from the given values (stable across runs)."""
+    digest = hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+    return random.Random(int(digest[:16], 16))
+
+
+def _max_minutes(time_filter: Optional[str]) -> Optional[int]:
+    """Upper bound of an Edamam time filter ("30", "20-40", "60+")."""
+    if not time_filter or time_filter.endswith("+"):
+        return None
+    try:
+        return int(time_filter.split("-")[-1])
+    except ValueError:
+        return None
+
+
+def synthetic_recipe(index: int, params: Dict[str, List[str]], rng: random.Random) -> dict:
+    """Build one Edamam v2 recipe honouring the requested filters."""
+    query = (params.get("q") or ["recipe"])[0]
+    cuisine = params.get("cuisineType") or [rng.choice(CUISINES)]
+    dish = params.get("dishType") or [rng.choice(DISH_TYPES)]
+    meal = params.get("mealType") or [rng.choice(MEAL_TYPES)]
+    health = sorted(set(params.get("health", [])) | set(rng.sample(HEALTH_LABELS, 3)))
+
+    protein = rng.choice(PROTEINS)
+    label = f"{cuisine[0].title()} {protein} {rng.choice(STYLES)}"
+    if query != "recipe":
+        label = f"{label} with {query.title()}"
+
+    max_time = _max_minutes((params.get("time") or [None])[0])
+    total_time = rng.choice([10, 15, 20, 25, 30, 45, 60, 90, 120])
+    if max_time is not None:
+        total_time = min(total_time, max_time)
+
+    recipe_id = hashlib.md5(f"{label}-{index}".encode()).hexdigest()
+    return {
+        "uri": f"http://www.edamam.com/ontologies/edamam.owl#recipe_{recipe_id}",
+        "label": label,
+        "image": f"https://fake-edamam.local/img/{recipe_id}.jpg",
+        "source": "Fake Kitchen",
+        "url": f"https://fake-edamam.local/recipes/{recipe_id}",
+        "yield": rng.choice([2, 4, 6]),
+        "ingredientLines": rng.sample(INGREDIENTS, rng.randint(4, 8)),
+        "calories": round(rng.uniform(300, 3200), 1),
+        "totalTime": float(total_time),
+        "cuisineType": cuisine,
+        "mealType": meal,
+        "dishType": dish,
+        "healthLabels": health,
+    }
+
+
+def synthetic_edamam_response(params: Dict[str, List[str]]) -> dict:
+    """Build an Edamam v2 search response for the given query params."""
+    key_params = {k: v for k, v in params.items() if k not in ("app_id", "app_key")}
+    rng = seeded_rng(key_params)
+    count = min(int((params.get("to") or ["20"])[0]), 100)
+    hits = [{"recipe": synthetic_recipe(i, params, rng)} for i in range(count)]
+    return {"from": 1, "to": count, "count": count * 10, "hits": hits}
+
+
+def _literal_after(prompt: str, marker: str) -> list:
+    """Parse a Python list literal that follows `marker` on the same line."""
+    match = re.search(re.escape(marker) + r"\s*(\[.*?\])", prompt)
+    if not match:
+        return []
+    try:
+        return list(ast.literal_eval(match.group(1)))
+    except (ValueError, SyntaxError):
+        return []
+
+
+def _search_params_content(user_prompt: str) -> dict:
+    request = re.search(r'User\'s request: "(.*?)"', user_prompt)
+    query = " ".join(request.group(1).lower().split()[:3]) if request else None
+    return {
+        "query": query or "recipe",
+        "health_labels": _literal_after(user_prompt, "Health labels:"),
+        "excluded": _literal_after(user_prompt, "Excluded ingredients:"),
+        "cuisine_type": None,
+        "meal_type": ["dinner"],
+        "dish_type": None,
+        "diet": None,
+        "ingr": None,
+        "time": "30" if request and "quick" in request.group(1).lower() else None,
+    }
+
+
+def _selection_content(user_prompt: str, rng: random.Random) -> list:
+    match = re.search(r"Here are (\d+) recipes", user_prompt)
+    total = int(match.group(1)) if match else 9
+    return sorted(rng.sample(range(total), min(9, total)))
+
+
+def _intent_content(user_prompt: str) -> dict:
+    match = re.search(r'User message: "(.*?)"', user_prompt, re.DOTALL)
+    message = match.group(1).lower() if match else ""
+    if message.rstrip().endswith("?"):
+        return {"intent": "question", "response": "Good question! All of these fit your family."}
+    if message.startswith(("show", "only", "which")):
+        cuisines = [c for c in CUISINES if c in message]
+        recipe_filter = {"cuisines": cuisines} if cuisines else {"max_time": 45}
+        return {"intent": "filter", "response": "Here are the matching recipes.", "filter": recipe_filter}
+    words = [w for w in re.findall(r"[a-z]+", message) if w not in ("no", "not", "without", "i", "don", "t", "like")]
+    params = re.search(r"Current Edamam search parameters: (\{.*\})", user_prompt)
+    search_params = json.loads(params.group(1)) if params else {"query": "recipe"}
+    search_params["excluded"] = search_params.get("excluded", []) + words[:1]
+    return {
+        "intent": "change_recipes",
+        "response": "Let me find some different recipes for you.",
+        "search_params": search_params,
+    }
+
+
+def _ingredient_content(line: str) -> dict:
+    match = re.match(r"\s*([\d.,/]+)?\s*(?:(cups?|tbsp|tsp|g|kg|ml|l|cloves?)\b)?\s*(.*)", line)
+    quantity = 1.0
+    if match and match.group(1):
+        try:
+            quantity = float(match.group(1).replace(",", "."))
+        except ValueError:
+            pass
+    unit = match.group(2) if match and match.group(2) else "piece"
+    name = (match.group(3) if match else line).split(",")[0].strip().lower() or line.lower()
+    return {"name": name, "quantity": quantity, "unit": unit}
+
+
+def synthetic_chat_content(messages: List[dict], seed: int = 0) -> str:
+    """
+    Produce a schema-valid reply for the prompts used by the agent.
+
+    The prompt kind is recognised from the system message, so replies stay
+    parseable by construct_search_query, select_diverse_recipes,
+    handle_chat_refinement and IngredientParser.
+    """
+    system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+    user = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+    rng = seeded_rng(seed, system[:200], user)
+
+    if "constructing recipe search queries" in system:
+        return json.dumps(_search_params_content(user))
+    if "Select at least 9 recipes" in system:
+        return json.dumps(_selection_content(user, rng))
+    if "detect their intent" in system:
+        return json.dumps(_intent_content(user))
+    if "ingredient parser" in system:
+        return json.dumps(_ingredient_content(user))
+    return "OK"
@@ -1,11 +1,32 @@
 """FastAPI application entry point."""
 
+import asyncio
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from app.api import users, recipes, agent
 from app.api import shopping
+from app.api import metrics as metrics_api
+from app.api import jobs
 from app.config import settings
+from app.services.edamam_service import edamam_service
+from app.services.prefetch_service import prefetch_service
+from app.services.job_service import job_service
+from app.services.checkpoint_service import checkpoint_service
+from app.services.session_service import session_service
+from app.services.chat_archive import chat_archive
+from app.services.llm_registry import llm_registry
+from app.services.metrics import metrics
+from agent.utils.nodes import search_query_cache
+from agent.utils.prompts import load_encoding
+
+
+async def _drop_expired_session(session_id: str) -> None:
+    """Release what an idle session still holds outside SessionService."""
+    prefetch_service.cancel(session_id)
+    await checkpoint_service.delete(session_id)
+    if settings.CHAT_ARCHIVE_ENABLED:
+        chat_archive.delete(session_id)
 
 
 @asynccontextmanager
@@ -19,10 +40,36 @@ async def lifespan(_app: FastAPI):
         print(f"✗ Configuration error: {e}")
         print("Please check your .env file and database setup")
 
+    llm_registry.start()
+    if settings.SEARCH_QUERY_CACHE_PERSIST:
+        loaded = search_query_cache.load(settings.SEARCH_QUERY_CACHE_PATH)
+        print(f"✓ Loaded {loaded} cached search queries")
+    await edamam_service.start()
+    try:
+        await asyncio.wait_for(edamam_service.warmup(), timeout=5.0)
+    except asyncio.TimeoutError:
+        print("✗ Edamam warmup timed out, continuing with a cold pool")
+    try:
+        # tiktoken may download its BPE file; token counts are estimated until then
+        await asyncio.wait_for(asyncio.to_thread(load_encoding), timeout=5.0)
+    except asyncio.TimeoutError:
+        print("✗ tiktoken encoding still loading, estimating token counts meanwhile")
+    await checkpoint_service.start()
+    job_service.start()
+    session_service.start(on_expired=_drop_expired_session)
+
     yield
 
-    # Shutdown (if needed in future)
-    pass
+    # Shutdown
+    if settings.SEARCH_QUERY_CACHE_PERSIST:
+        search_query_cache.save(settings.SEARCH_QUERY_CACHE_PATH)
+    await job_service.shutdown()
+    await prefetch_service.shutdown()
+    await session_service.shutdown()
+    chat_archive.close()
+    await checkpoint_service.aclose()
+    await edamam_service.close()
+    await llm_registry.aclose()
 
 
 # Create FastAPI app
@@ -42,11 +89,35 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+def _route_template(request: Request) -> str:
+    """Path with parameter values replaced by their names (/api/users/{user_id})."""
+    if request.scope.get("route") is None:
+        return "unmatched"
+    names = {str(value): name for name, value in request.path_params.items()}
+    return "/".join(
+        f"{{{names[segment]}}}" if segment in names else segment
+        for segment in request.url.path.split("/")
+    )
+
+
+@app.middleware("http")
+async def record_request_span(request: Request, call_next):
+    """Time each request; for streaming responses this measures time to first byte."""
+    with metrics.span("http.request", method=request.method) as span:
+        response = await call_next(request)
+        span.labels["route"] = _route_template(request)
+        span.set(status=response.status_code)
+    return response
+
+
 # Include API routers
 app.include_router(users.router, prefix="/api/users", tags=["users"])
 app.include_router(recipes.router, prefix="/api/recipes", tags=["recipes"])
 app.include_router(agent.router, prefix="/api/agent", tags=["agent"])
 app.include_router(shopping.router, prefix="/api/shopping", tags=["shopping"])
+app.include_router(metrics_api.router, prefix="/api/metrics", tags=["metrics"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["jobs"])
 
 
 @app.get("/")
@@ -1,7 +1,8 @@
 """Test script to validate backend functionality."""
 
 import sys
-sys.path.insert(0, '/Users/afras/Documents/Programmering/rema-blue-plate/backend')
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent))
 
 
 def test_imports():
@@ -152,6 +153,1586 @@ def test_agent_graphs():
         return False
 
 
+def test_edamam_resilience():
+    """Test Edamam retry, circuit breaker and stale cache against a stand-in upstream."""
+    print("Testing Edamam resilience...")
+    try:
+        import asyncio
+        import httpx
+        from app.services.edamam_service import EdamamService
+
+        hit = {
+            "recipe": {
+                "uri": "http://www.edamam.com/ontologies/edamam.owl#recipe_test",
+                "label": "Test Recipe",
+                "image": "https://example.com/image.jpg",
+                "source": "Test Source",
+                "url": "https://example.com",
+                "ingredientLines": ["ingredient 1"],
+                "calories": 500.0,
+                "totalTime": 30.0,
+            }
+        }
+        responses = []
+
+        def handler(request):
+            status = responses.pop(0) if responses else 503
+            if status == 200:
+                return httpx.Response(200, json={"hits": [hit]})
+            return httpx.Response(status, headers={"Retry-After": "0"})
+
+        async def run():
+            service = EdamamService()
+            service.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            service.backoff_base = 0.0
+            service.rate_limiter.capacity = service.rate_limiter.tokens = 100
+
+            # Retries through throttling
+            responses.extend([429, 500, 200])
+            recipes = await service.search_recipes(query="test")
+            assert len(recipes) == 1, "Expected recipe after retries"
+            assert service.stats["retries"] == 2, f"Expected 2 retries, got {service.stats}"
+            print("  ✓ Retries 429/5xx with backoff")
+
+            # Upstream down: breaker opens, stale entry is served
+            service.cache.ttl = 0
+            recipes = await service.search_recipes(query="test")
+            assert len(recipes) == 1, "Expected stale recipe"
+            assert service.stats["stale_served"] == 1, "Stale cache not used"
+            for _ in range(2):
+                await service.search_recipes(query="test")
+            assert service.circuit_breaker.state == "open", "Circuit breaker should be open"
+            print("  ✓ Circuit breaker opens and serves stale cache")
+
+            status = service.status()
+            assert status["circuit_breaker"]["state"] == "open"
+            print(f"  ✓ Status: {status['stats']}")
+
+        async def hanging(request):
+            await asyncio.sleep(10)
+
+        def broken(request):
+            raise httpx.TooManyRedirects("redirect loop", request=request)
+
+        async def run_trials():
+            import time
+            service = EdamamService()
+            breaker = service.circuit_breaker
+            breaker.state, breaker.opened_at = breaker.OPEN, time.monotonic() - breaker.reset_timeout
+
+            # Cancelled half-open trial frees the slot
+            service.client = httpx.AsyncClient(transport=httpx.MockTransport(hanging))
+            task = asyncio.create_task(service._get_with_retry([]))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            assert breaker.state == breaker.HALF_OPEN and not breaker._trial_in_flight, breaker.status()
+
+            # Unexpected client error counts as the trial's failure
+            service.client = httpx.AsyncClient(transport=httpx.MockTransport(broken))
+            try:
+                await service._get_with_retry([])
+                raise AssertionError("Expected TooManyRedirects")
+            except httpx.TooManyRedirects:
+                pass
+            assert breaker.state == breaker.OPEN and not breaker._trial_in_flight, breaker.status()
+            print("  ✓ Cancelled or crashing half-open trials never lock the breaker")
+
+            # Open circuit fails fast and leaves the rate limit budget alone
+            from app.services.resilience import CircuitOpenError, RateLimitExceeded
+            service.rate_limiter.tokens = 0.5
+            started = time.perf_counter()
+            try:
+                await service._get_with_retry([])
+                raise AssertionError("Expected CircuitOpenError")
+            except CircuitOpenError:
+                pass
+            assert time.perf_counter() - started < 0.1, "Open circuit waited for a token"
+            assert service.rate_limiter.tokens >= 0.5, "Open circuit spent a token"
+
+            # A half-open trial that cannot get a token frees the slot
+            breaker.opened_at = time.monotonic() - breaker.reset_timeout
+            service.rate_limiter.tokens = 0
+            try:
+                await service._get_with_retry([], token_reserve=0)
+                raise AssertionError("Expected RateLimitExceeded")
+            except RateLimitExceeded:
+                pass
+            assert breaker.state == breaker.HALF_OPEN and not breaker._trial_in_flight, breaker.status()
+            print("  ✓ Open circuit fails fast before touching the rate limiter")
+
+            # The request deadline bounds the request itself and the retries
+            from app.services.resilience import DeadlineExceeded
+            service = EdamamService()
+            service.client = httpx.AsyncClient(transport=httpx.MockTransport(hanging))
+            started = time.perf_counter()
+            try:
+                await service._get_with_retry([], deadline=time.time() + 0.1)
+                raise AssertionError("Expected DeadlineExceeded")
+            except DeadlineExceeded:
+                pass
+            assert time.perf_counter() - started < 0.5, "Request outlived the deadline"
+            assert service.circuit_breaker.consecutive_failures == 0, "Deadline counted as an upstream failure"
+
+            def throttled(request):
+                return httpx.Response(503, headers={"Retry-After": "3"})
+
+            service.client = httpx.AsyncClient(transport=httpx.MockTransport(throttled))
+            service.backoff_max = 10
+            started = time.perf_counter()
+            try:
+                await service._get_with_retry([], deadline=time.time() + 1)
+                raise AssertionError("Expected HTTPStatusError")
+            except httpx.HTTPStatusError:
+                pass
+            assert time.perf_counter() - started < 0.5 and service.stats["retries"] == 0, service.stats
+            print("  ✓ Edamam requests and retries stop at the request deadline")
+
+        asyncio.run(run())
+        asyncio.run(run_trials())
+
+        print("✅ Edamam resilience tests passed!\n")
+        return True
+    except Exception as e:
+        print(f"❌ Edamam resilience error: {e}\n")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_fanout_merge():
+    """Test merging and deduplication of fan-out search results."""
+    print("Testing fan-out merge...")
+    try:
+        from agent.utils.search import build_fanout_variants, merge_recipe_results
+        from app.services.recipe_store import recipe_store
+
+        variants = build_fanout_variants({"query": "pasta"}, num_queries=4)
+        assert len(variants) == 4, f"Expected 4 variants, got {len(variants)}"
+        assert variants[0] == {"query": "pasta"}, "First variant should be the original"
+        assert len({v["cuisine_type"][0] for v in variants[1:]}) == 3, "Cuisines should differ"
+        print("  ✓ Build diversified variants")
+
+        first = recipe_store.add([{"uri": "a", "label": "Pasta Carbonara"}, {"uri": "b", "label": "Lasagne"}])
+        second = recipe_store.add([{"uri": "a", "label": "Pasta Carbonara"}, {"uri": "c", "label": "pasta  carbonara!"},
+                                   {"uri": "d", "label": "Ramen"}])
+        merged = merge_recipe_results([first, second], max_results=10)
+        assert merged == ["a", "b", "d"], f"Unexpected merge: {merged}"
+        assert len(merge_recipe_results([first, second], max_results=2)) == 2, "Cap not applied"
+        print("  ✓ Merge dedupes by URI and normalized label")
+
+        print("✅ Fan-out merge tests passed!\n")
+        return True
+    except Exception as e:
+        print(f"❌ Fan-out merge error: {e}\n")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_prefetch():
+    """Test speculative prefetch of refinement searches into a session."""
+    print("Testing refinement prefetch...")
+    try:
+        import asyncio
+        import httpx
+        import time
+        from app.services.edamam_service import edamam_service
+        from app.services.prefetch_service import prefetch_service
+        from app.services.session_service import session_service
+        from app.models.user import MergedPreferences
+        from agent.utils import nodes
+        from agent.utils.search import search_params_key
+        from app.services.recipe_store import recipe_store
+        from app.config import settings
+
+        def handler(request):
+            hit = {
+                "recipe": {
+                    "uri": f"recipe_{request.url.params.get('time')}_{request.url.params.get('cuisineType')}",
+                    "label": "Prefetched Recipe",
+                    "image": "https://example.com/image.jpg",
+                    "source": "Test Source",
+                    "url": "https://example.com",
+                    "ingredientLines": ["ingredient 1"],
+                    "calories": 400.0,
+                    "totalTime": 20.0,
+                }
+            }
+            return httpx.Response(200, json={"hits": [hit]})
+
+        async def run():
+            edamam_service.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            edamam_service.rate_limiter.capacity = edamam_service.rate_limiter.tokens = 100
+
+            prefs = MergedPreferences(
+                user_ids=[1], diet_labels=[], excluded_ingredients=[],
+                fridge_items=[], custom_preferences=[],
+            )
+            search_params = {"query": "recipe", "health_labels": ["gluten-free"]}
+            session_id = session_service.create_session(
+                user_ids=[1], merged_preferences=prefs, all_recipes=[],
+                selected_recipes=[], search_params=search_params,
+            )
+            prefetch_service.schedule(session_id, search_params)
+            await prefetch_service.tasks[session_id]
+
+            session = session_service.get_session(session_id)
+            assert len(session.prefetched) == 3, f"Expected 3 variants, got {list(session.prefetched)}"
+            quicker = search_params_key({"health_labels": ["Gluten-Free"], "query": "recipe", "time": "30"})
+            assert quicker in session.prefetched, "Quicker variant not prefetched"
+            print(f"  ✓ Prefetched variants: {len(session.prefetched)}")
+
+            # A local "quicker" turn searches exactly the prefetched variant
+            state = await nodes.handle_chat_refinement({
+                "current_message": "quicker please", "search_params": search_params,
+                "all_recipe_uris": [], "selected_recipe_uris": [],
+            })
+            assert state["action"] == "re_search" and search_params_key(state["search_params"]) == quicker
+            state["prefetched"] = {key: recipe_store.add(r) for key, r in session.prefetched.items()}
+            requests_before = edamam_service.stats["requests"]
+            state = await nodes.select_diverse_recipes(state)
+            assert edamam_service.stats["requests"] == requests_before, "Prefetched results not used"
+            assert state["all_recipe_uris"] == state["prefetched"][quicker]
+            print("  ✓ A \"quicker\" turn consumes the prefetched search")
+
+            # Without tokens above the reserve, prefetch skips instead of waiting
+            edamam_service.cache.clear()
+            edamam_service.rate_limiter.tokens = settings.PREFETCH_TOKEN_RESERVE
+            skipped_before = prefetch_service.stats["skipped"]
+            prefetch_service.schedule(session_id, {"query": "soup"})
+            await asyncio.wait_for(prefetch_service.tasks[session_id], timeout=1.0)
+            assert prefetch_service.stats["skipped"] > skipped_before, "Prefetch did not skip"
+            assert edamam_service.rate_limiter.tokens >= settings.PREFETCH_TOKEN_RESERVE, "Reserve was spent"
+            print("  ✓ Prefetch leaves the rate limit reserve to user searches")
+
+            # An open circuit stops prefetching before any request is attempted
+            breaker = edamam_service.circuit_breaker
+            edamam_service.rate_limiter.tokens = 100
+            breaker.state, breaker.opened_at = breaker.OPEN, time.monotonic()
+            requests_before, skipped_before = edamam_service.stats["requests"], prefetch_service.stats["skipped"]
+            try:
+                prefetch_service.schedule(session_id, {"query": "stew"})
+                await prefetch_service.tasks[session_id]
+            finally:
+                breaker.record_success()
+            assert prefetch_service.stats["skipped"] > skipped_before, "Prefetch ran with an open circuit"
+            assert edamam_service.stats["requests"] == requests_before
+            assert breaker.total_rejections == 0, "Prefetch should not ask an open breaker"
+            print("  ✓ Prefetch stops while the circuit breaker is not closed")
+
+            await edamam_service.close()
+
+        enabled = settings.PREFETCH_ENABLED
+        settings.PREFETCH_ENABLED = True
+        try:
+            asyncio.run(run())
+        finally:
+            settings.PREFETCH_ENABLED = enabled
+
+        print("✅ Refinement prefetch tests passed!\n")
+        return True
+    except Exception as e:
+        print(f"❌ Refinement prefetch error: {e}\n")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_fake_upstream():
+    """Test the fake Edamam/OpenAI upstream used for offline benchmarks."""
+    print("Testing fake upstream...")
+    try:
+        import json
+        import os
+        from fastapi.testclient import TestClient
+        from fake_upstream import create_app, FakeUpstreamConfig
+        from app.services.edamam_service import EdamamService
+
+        os.environ["FAKE_EDAMAM_LATENCY_MS"] = "0"
+        os.environ["FAKE_OPENAI_LATENCY_MS"] = "0"
+        client = TestClient(create_app(FakeUpstreamConfig()))
+
+        response = client.get("/api/recipes/v2", params=[("q", "pasta"), ("to", "30"), ("cuisineType", "italian")])
+        assert response.status_code == 200, f"Edamam stand-in returned {response.status_code}"
+        recipes = EdamamService()._parse_recipes(response.json())
+        assert len(recipes) == 30, f"Expected 30 parseable recipes, got {len(recipes)}"
+        assert all(r.cuisineType == ["italian"] for r in recipes), "cuisineType filter not honoured"
+        print(f"  ✓ Edamam stand-in: {len(recipes)} recipes")
+
+        response = client.post("/v1/chat/completions", json={
+            "model": "gpt-4o-mini",
+            "messages": [
+                {"role": "system", "content": "You are an ingredient parser."},
+                {"role": "user", "content": "2 cups rice"},
+            ],
+        })
+        parsed = json.loads(response.json()["choices"][0]["message"]["content"])
+        assert parsed == {"name": "rice", "quantity": 2.0, "unit": "cups"}, f"Unexpected parse: {parsed}"
+        print("  ✓ OpenAI stand-in: chat completion")
+
+        print("✅ Fake upstream tests passed!\n")
+        return True
+    except Exception as e:
+        print(f"❌ Fake upstream error: {e}\n")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_async_llm_calls():
+    """Test that concurrent agent nodes overlap their LLM calls."""
+    print("Testing non-blocking LLM calls...")
+    try:
+        import asyncio
+        import time
+        from langchain_core.messages import AIMessage
+        import agent.utils.nodes as nodes
+
+        class SlowLLM:
+            """Stand-in LLM: 0.2s per call, blocking if invoked synchronously."""
+
+            def invoke(self, messages):
+                time.sleep(0.2)
+                return AIMessage(content='{"query": "recipe"}')
+
+            async def ainvoke(self, messages):
+                await asyncio.sleep(0.2)
+                return AIMessage(content='{"query": "recipe"}')
+
+        async def run():
+            calls = [
+                nodes.construct_search_query("family", ["vegan"], [], [], f"request {i}")
+                for i in range(5)
+            ]
+            start = time.perf_counter()
+            results = await asyncio.gather(*calls)
+            return results, time.perf_counter() - start
+
+        nodes.llm_registry.get = lambda *args, **kwargs: SlowLLM()
+        try:
+            results, elapsed = asyncio.run(run())
+        finally:
+            del nodes.llm_registry.get
+
+        assert all(r == {"query": "recipe"} for r in results), f"Unexpected results: {results}"
+        assert elapsed < 0.5, f"5 concurrent calls took {elapsed:.2f}s, expected ~0.2s"
+        print(f"  ✓ 5 concurrent construct_search_query calls in {elapsed:.2f}s")
+
+        print("✅ Non-blocking LLM tests passed!\n")
+        return True
+    except Exception as e:
+        print(f"❌ Non-blocking LLM error: {e}\n")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_search_query_cache():
+    """Test that repeat searches reuse cached search params instead of calling GPT."""
+    print("Testing search query cache...")
+    try:
+        import asyncio
+        import tempfile
+        from pathlib import Path
+        from langchain_core.messages import AIMessage
+        import agent.utils.nodes as nodes
+
+        calls = []
+
+        class CountingLLM:
+            async def ainvoke(self, messages):
+                calls.append(messages)
+                return AIMessage(content='{"query": "recipe", "health_labels": ["vegan"]}')
+
+        async def run():
+            first = await nodes.construct_search_query("family", ["vegan", "dairy-free"], [], ["nøtter"], "Quick  dinner")
+            first["health_labels"].append("mutated")
+            second = await nodes.construct_search_query("family", ["dairy-free", "Vegan"], [], ["nøtter"], "quick dinner")
+            # A first message's request only appears in the family info
+            await nodes.construct_search_query(
+                'family\n\nUser\'s request: "fish tacos"', ["vegan", "dairy-free"], [], ["nøtter"], "quick dinner"
+            )
+            return first, second
+
+        nodes.search_query_cache.clear()
+        hits_before = nodes.search_query_cache.hits
+        nodes.llm_registry.get = lambda *args, **kwargs: CountingLLM()
+        try:
+            first, second = asyncio.run(run())
+        finally:
+            del nodes.llm_registry.get
+
+        assert len(calls) == 2, f"Expected 2 LLM calls, got {len(calls)}"
+        assert nodes.search_query_cache.hits == hits_before + 1, "Cache hit not counted"
+        assert second == {"query": "recipe", "health_labels": ["vegan"]}, f"Cached value was mutated: {second}"
+        print("  ✓ Second identical search skipped the LLM; a different request did not")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "cache.json"
+            nodes.search_query_cache.save(path)
+            nodes.search_query_cache.clear()
+            assert nodes.search_query_cache.load(path) == 2, "Persisted entries not loaded"
+        print("  ✓ Cache persists and reloads")
+
+        print("✅ Search query cache tests passed!\n")
+        return True
+    except Exception as e:
+        print(f"❌ Search query cache error: {e}\n")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_deterministic_search_params():
+    """Test rule-based search params and the allergen/dislike lexicon."""
+    print("Testing deterministic search params...")
+    try:
+        from agent.utils.lexicon import extract_excluded_ingredients
+        from agent.utils.params import build_search_params
+
+        cases = {
+            "er allergisk mot nøtter": ["nuts"],
+            "allergic to peanuts": ["peanuts"],
+            "doesn't like broccoli": ["broccoli"],
+            "Laktoseintolerant": ["milk"],
+            "garlic": ["garlic"],
+            "I love garlic": [],
+            "vil ha sunn mat hver dag": [],
+        }
+        for preference, expected in cases.items():
+            result = extract_excluded_ingredients(preference)
+            assert result == expected, f"{preference!r}: expected {expected}, got {result}"
+        print(f"  ✓ Lexicon extraction ({len(cases)} cases)")
+
+        params = build_search_params(
+            ["vegetarian", "high-protein"], [], ["brussels sprouts", "er allergisk mot nøtter"]
+        )
+        assert params == {
+            "query": "recipe",
+            "health_labels": ["vegetarian"],
+            "diet": ["high-protein"],
+            "excluded": ["brussels sprouts", "nuts"],
+        }, f"Unexpected params: {params}"
+        print(f"  ✓ Build params: {params}")
+
+        import asyncio
+        from langchain_core.messages import AIMessage
+        import agent.utils.nodes as nodes
+        from app.api.initial_search import initial_state
+        from app.models.user import MergedPreferences
+
+        class FishLLM:
+            async def ainvoke(self, messages):
+                return AIMessage(content='{"query": "fish tacos", "time": "1-30"}')
+
+        async def query_for(message):
+            state = initial_state([1], MergedPreferences(
+                user_ids=[1], diet_labels=["vegan"], excluded_ingredients=[], fridge_items=[], custom_preferences=[]
+            ), message)
+            return await nodes.construct_search_query(
+                family_info=state["family_members_info"],
+                diet_labels=state["diet_labels"],
+                excluded_ingredients=state["excluded_ingredients"],
+                custom_preferences=state["custom_preferences"],
+                user_message=state["current_message"],
+            )
+
+        nodes.search_query_cache.clear()
+        nodes.llm_registry.get = lambda *args, **kwargs: FishLLM()
+        try:
+            without_message = asyncio.run(query_for(None))
+            with_message = asyncio.run(query_for("quick fish tacos for dinner"))
+        finally:
+            del nodes.llm_registry.get
+            nodes.search_query_cache.clear()
+        assert without_message["query"] == "recipe", f"Unexpected params: {without_message}"
+        assert with_message == {"query": "fish tacos", "time": "1-30"}, f"First message ignored: {with_message}"
+        print("  ✓ A first chat message drives the initial query")
+
+        print("✅ Deterministic search params tests passed!\n")
+        return True
+    except Exception as e:
+        print(f"❌ Deterministic search params error: {e}\n")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_diversity_selection():
+    """Test the local diversity selector."""
+    print("Testing local diversity selection...")
+    try:
+        import time
+        from agent.utils.diversity import select_diverse
+
+        cuisines = ["italian", "mexican", "indian", "nordic", "french", "japanese"]
+        # 24 near-identical italian pastas plus one recipe per other cuisine
+        recipes = [
+            {"label": f"Pasta Carbonara {i}", "cuisineType": ["italian"], "dishType": ["main course"],
+             "mealType": ["lunch/dinner"], "totalTime": 30, "calories": 2400, "yield_servings": 4}
+            for i in range(24)
+        ] + [
+            {"label": f"{cuisine.title()} Special", "cuisineType": [cuisine], "dishType": ["soup"],
+             "mealType": ["lunch/dinner"], "totalTime": 15 * (i + 1), "calories": 1200, "yield_servings": 4}
+            for i, cuisine in enumerate(cuisines[1:])
+        ]
+
+        start = time.perf_counter()
+        first = select_diverse(recipes, k=9, discovery_share=0.3, seed=42)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        second = select_diverse(recipes, k=9, discovery_share=0.3, seed=42)
+
+        assert len(first) == 9 and len(set(first)) == 9, f"Expected 9 unique picks, got {first}"
+        assert first == second, "Selection should be deterministic under a seed"
+        smart_cuisines = {recipes[i]["cuisineType"][0] for i in first[:6]}
+        assert smart_cuisines == set(cuisines), f"Smart picks should cover all cuisines: {smart_cuisines}"
+        print(f"  ✓ Covers {len(smart_cuisines)} cuisines, deterministic, {elapsed_ms:.2f}ms")
+
+        assert select_diverse(recipes[:5], k=9) == [0, 1, 2, 3, 4], "Should return all when fewer than k"
+        print("  ✓ Returns all recipes when fewer than k")
+
+        print("✅ Local diversity selection tests passed!\n")
+        return True
+    except Exception as e:
+        print(f"❌ Local diversity selection error: {e}\n")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_local_intent():
+    """Test the local intent classifier fast path in chat refinement."""
+    print("Testing local intent classifier...")
+    try:
+        import asyncio
+        from agent.utils import nodes
+        from agent.utils.intent import classify_intent
+
+        cases = {
+            "no fish": ("change_recipes", {"excluded": ["fish"]}),
+            "ikke fisk takk": ("change_recipes", {"excluded": ["fish"]}),
+            "show only italian": ("filter", {"cuisines": ["italian"]}),
+            "vis bare vegetariske": ("filter", {"health_labels": ["vegetarian"]}),
+            "more protein": ("change_recipes", {"diet": ["high-protein"]}),
+            "under 20 minutes please": ("change_recipes", {"max_time": 20}),
+        }
+        for message, (intent, entities) in cases.items():
+            result = classify_intent(message)
+            assert result.intent == intent and result.confidence >= 0.8, f"{message!r}: {result}"
+            for key, value in entities.items():
+                assert getattr(result, key) == value, f"{message!r}: {key}={getattr(result, key)}"
+        for message in ["how do I cook this?", "I want something my grandmother would make"]:
+            assert classify_intent(message).confidence < 0.8, f"{message!r} should escalate"
+        print(f"  ✓ Classified {len(cases)} clear-cut messages, escalated ambiguous ones")
+
+        negated = [
+            "no italian", "not italian", "ikke italiensk", "skip mexican",
+            "no vegetarian please", "I don't want vegan", "no quick meals", "no italian, more chicken",
+        ]
+        for message in negated:
+            result = classify_intent(message)
+            assert result.confidence < 0.8, f"{message!r} should escalate: {result}"
+            assert not (result.cuisines or result.health_labels or result.max_time), f"{message!r}: {result}"
+        print(f"  ✓ Escalated {len(negated)} negated cuisines, labels and time limits")
+
+        def no_llm(*args, **kwargs):
+            raise AssertionError("LLM should not be called")
+
+        recipes = nodes.recipe_store.add([
+            {"uri": "intent#lasagna", "label": "Lasagna", "cuisineType": ["italian"], "healthLabels": [], "totalTime": 60},
+            {"uri": "intent#tacos", "label": "Tacos", "cuisineType": ["mexican"], "healthLabels": [], "totalTime": 20},
+        ])
+        nodes.llm_registry.get = no_llm
+        try:
+            state = asyncio.run(nodes.handle_chat_refinement({
+                "current_message": "show only italian", "selected_recipe_uris": recipes,
+            }))
+            assert state["action"] == "filter" and state["selected_recipe_uris"] == ["intent#lasagna"]
+
+            state = asyncio.run(nodes.handle_chat_refinement({
+                "current_message": "no fish", "selected_recipe_uris": recipes,
+                "search_params": {"query": "recipe", "excluded": ["nuts"]}, "excluded_ingredients": ["nuts"],
+            }))
+            assert state["action"] == "re_search"
+            assert state["search_params"] == {"query": "recipe", "excluded": ["nuts", "fish"]}, state["search_params"]
+            assert state["excluded_ingredients"] == ["nuts", "fish"]
+        finally:
+            del nodes.llm_registry.get
+        print("  ✓ Filter and re-search handled without GPT")
+
+        print("✅ Local intent classifier tests passed!\n")
+        return True
+    except Exception as e:
+        print(f"❌ Local intent classifier error: {e}\n")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_recipe_filter():
+    """Test structured filter evaluation over all session recipes."""
+    print("Testing structured recipe filter...")
+    try:
+        import asyncio
+        from agent.utils import nodes
+        from agent.utils.filters import RecipeFilter
+        from agent.utils.schemas import RefinementDecision
+
+        recipes = [
+            {"uri": "filter#lasagna", "label": "Lasagna", "cuisineType": ["italian"], "healthLabels": ["Vegetarian"],
+             "totalTime": 60, "calories": 2400, "yield_servings": 4, "ingredientLines": ["pasta", "cheese"]},
+            {"uri": "filter#risotto", "label": "Risotto", "cuisineType": ["italian"], "healthLabels": ["Gluten-Free"],
+             "totalTime": 30, "calories": 1600, "yield_servings": 4, "ingredientLines": ["rice", "salmon"]},
+            {"uri": "filter#tacos", "label": "Tacos", "cuisineType": ["mexican"], "healthLabels": ["Vegetarian"],
+             "totalTime": 20, "calories": 1200, "yield_servings": 4, "ingredientLines": ["beans"]},
+        ]
+        assert RecipeFilter(cuisines=["Italian"]).apply(recipes) == [0, 1]
+        assert RecipeFilter(cuisines=["italian"], max_time=30).apply(recipes) == [1]
+        assert RecipeFilter(health_labels=["vegetarian"], max_calories=550).apply(recipes) == [2]
+        assert RecipeFilter(excluded_ingredients=["salmon"]).apply(recipes) == [0, 2]
+        assert RecipeFilter().is_empty() and RecipeFilter().apply(recipes) == [0, 1, 2]
+        print("  ✓ Predicates: cuisine, time, calories per serving, health labels, ingredients")
+
+        class FilterLLM:
+            def with_structured_output(self, schema, **kwargs):
+                return self
+
+            async def ainvoke(self, messages):
+                return RefinementDecision(
+                    intent="filter", response="Italian it is!", filter=RecipeFilter(cuisines=["italian"])
+                )
+
+        uris = nodes.recipe_store.add(recipes)
+        nodes.llm_registry.get = lambda *args, **kwargs: FilterLLM()
+        try:
+            # Only Tacos is selected; the filter still finds both italian recipes
+            state = asyncio.run(nodes.handle_chat_refinement({
+                "current_message": "could you narrow it down to the italian dishes my kids like",
+                "all_recipe_uris": uris, "selected_recipe_uris": uris[2:],
+            }))
+        finally:
+            del nodes.llm_registry.get
+        assert state["action"] == "filter", state["action"]
+        assert state["selected_recipe_uris"] == ["filter#lasagna", "filter#risotto"]
+        print("  ✓ GPT filter predicate evaluated over all recipes")
+
+        print("✅ Structured recipe filter tests passed!\n")
+        return True
+    except Exception as e:
+        print(f"❌ Structured recipe filter error: {e}\n")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_single_call_refinement():
+    """Test that a GPT re-search costs one LLM round trip."""
+    print("Testing single-call refinement...")
+    try:
+        import asyncio
+        import os
+        import httpx
+        from langchain_openai import ChatOpenAI
+        from agent.agent import chat_graph
+        from agent.utils import nodes
+        from fake_upstream import create_app, FakeUpstreamConfig
+
+        os.environ["FAKE_OPENAI_LATENCY_MS"] = "0"
+        upstream = create_app(FakeUpstreamConfig())
+        llm = ChatOpenAI(
+            model="gpt-4o-mini",
+            api_key="fake",
+            base_url="http://fake-upstream/v1",
+            http_async_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=upstream)),
+        )
+        searches = []
+
+        class RecordingSearch:
+            async def ainvoke(self, params):
+                searches.append(params)
+                return []
+
+        async def no_construct(**kwargs):
+            raise AssertionError("construct_search_query should not be called")
+
+        original_search = nodes.search_edamam_recipes
+        original_construct = nodes.construct_search_query
+        nodes.llm_registry.get = lambda *args, **kwargs: llm
+        nodes.search_edamam_recipes = RecordingSearch()
+        nodes.construct_search_query = no_construct
+        try:
+            state = asyncio.run(chat_graph.ainvoke({
+                "current_message": "anything my grandmother would recognise, she is old fashioned",
+                "all_recipe_uris": [], "selected_recipe_uris": [], "prefetched": {},
+                "search_params": {"query": "recipe", "excluded": ["nuts"]},
+                "excluded_ingredients": ["nuts"], "chat_history": [],
+            }))
+        finally:
+            del nodes.llm_registry.get
+            nodes.search_edamam_recipes = original_search
+            nodes.construct_search_query = original_construct
+
+        assert state["action"] == "re_search", state["action"]
+        assert upstream.state.stats["openai_requests"] == 1, upstream.state.stats
+        assert len(searches) == 1 and searches[0]["excluded"][0] == "nuts", searches
+        print(f"  ✓ One LLM call, search reused its params: {searches[0]}")
+
+        print("✅ Single-call refinement tests passed!\n")
+        return True
+    except Exception as e:
+        print(f"❌ Single-call refinement error: {e}\n")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_chat_stream():
+    """Test the SSE chat endpoint."""
+    print("Testing chat streaming...")
+    try:
+        import json
+        import os
+        import httpx
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+        from langchain_openai import ChatOpenAI
+        from agent.utils import nodes
+        from app.api.agent import router
+        from app.models.user import MergedPreferences
+        from app.services.edamam_service import EdamamService
+        from app.services.session_service import session_service
+        from fake_upstream import create_app, FakeUpstreamConfig
+        from fake_upstream.synthetic import synthetic_edamam_response
+
+        os.environ["FAKE_OPENAI_LATENCY_MS"] = "0"
+        upstream = create_app(FakeUpstreamConfig())
+        llm = ChatOpenAI(
+            model="gpt-4o-mini",
+            api_key="fake",
+            base_url="http://fake-upstream/v1",
+            http_async_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=upstream)),
+        )
+        recipes = EdamamService()._parse_recipes(synthetic_edamam_response({"q": ["recipe"], "to": ["12"]}))
+        session_id = session_service.create_session(
+            user_ids=[1],
+            merged_preferences=MergedPreferences(
+                user_ids=[1], diet_labels=[], excluded_ingredients=[], fridge_items=[], custom_preferences=[]
+            ),
+            all_recipes=recipes,
+            selected_recipes=recipes[:9],
+        )
+
+        api = FastAPI()
+        api.include_router(router, prefix="/api/agent")
+        nodes.llm_registry.get = lambda *args, **kwargs: llm
+        try:
+            with TestClient(api) as client:
+                response = client.post("/api/agent/chat/stream", json={
+                    "session_id": session_id, "message": "why did you pick these?",
+                })
+        finally:
+            del nodes.llm_registry.get
+
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [
+            (block.split("\n")[0][len("event: "):], json.loads(block.split("\n")[1][len("data: "):]))
+            for block in response.text.strip().split("\n\n")
+        ]
+        names = [name for name, _ in events]
+        assert names[0] == "status" and names[-1] == "result", names
+        assert "intent" in names and "token" in names, names
+        text = "".join(data["text"] for name, data in events if name == "token")
+        assert text == events[-1][1]["response"], f"Tokens {text!r} != response"
+        print(f"  ✓ Events: {names}")
+
+        print("✅ Chat streaming tests passed!\n")
+        return True
+    except Exception as e:
+        print(f"❌ Chat streaming error: {e}\n")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_prompt_encoding():
+    """Test the compact recipe table and token budget trimming."""
+    print("Testing prompt encoding...")
+    try:
+        import json
+        from agent.utils.prompts import count_tokens, encode_recipes, fit_recipes, recipe_row
+        from app.services.edamam_service import EdamamService
+        from fake_upstream.synthetic import synthetic_edamam_response
+
+        recipe = {"label": "Chicken | Curry", "cuisineType": ["Indian"], "dishType": ["main course"],
+                  "mealType": ["lunch/dinner"], "totalTime": 44.6, "calories": 2083.4, "yield_servings": 4}
+        assert recipe_row(3, recipe) == "3|Chicken / Curry|indian|main course|lunch/dinner|45|520"
+
+        recipes = [
+            r.model_dump() for r in
+            EdamamService()._parse_recipes(synthetic_edamam_response({"q": ["recipe"], "to": ["30"]}))
+        ]
+        verbose = json.dumps([
+            {"index": i, "name": r["label"], "cuisine": r["cuisineType"], "dish_type": r["dishType"],
+             "meal_type": r["mealType"], "cooking_time": r["totalTime"], "calories": r["calories"]}
+            for i, r in enumerate(recipes)
+        ], indent=2)
+        compact = encode_recipes(recipes)
+        assert count_tokens(compact) * 2 < count_tokens(verbose), "Table should be far smaller than JSON"
+        print(f"  ✓ 30 recipes: ~{count_tokens(verbose)} -> ~{count_tokens(compact)} tokens")
+
+        table, included = fit_recipes(recipes, budget=200, used=50)
+        assert 0 < included < 30 and count_tokens(table) <= 150, f"{included} rows, {count_tokens(table)} tokens"
+        assert table.splitlines()[-1].startswith(f"{included - 1}|"), "Rows should keep their indices"
+        print(f"  ✓ Budget of 150 tokens keeps {included} rows")
+
+        import threading
+        import time
+        from agent.utils import prompts
+
+        hang = threading.Event()
+
+        def slow_load():
+            hang.wait(5)  # A download that hangs
+            return False
+
+        saved = prompts._encoding, prompts._load_started_at, prompts.load_encoding
+        prompts._encoding, prompts._load_started_at, prompts.load_encoding = None, None, slow_load
+        try:
+            start = time.perf_counter()
+            estimate = prompts.count_tokens("a" * 400)
+            elapsed = time.perf_counter() - start
+        finally:
+            hang.set()
+            prompts._encoding, prompts._load_started_at, prompts.load_encoding = saved
+        assert estimate == 101 and elapsed < 0.5, f"count_tokens blocked for {elapsed:.2f}s"
+        print("  ✓ Token counting estimates instead of waiting for the encoding")
+
+        print("✅ Prompt encoding tests passed!\n")
+        return True
+    except Exception as e:
+        print(f"❌ Prompt encoding error: {e}\n")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_metrics():
+    """Test span aggregation into histograms and counters."""
+    print("Testing metrics...")
+    try:
+        import asyncio
+        from app.services.metrics import MetricsService
+
+        metrics = MetricsService()
+
+        @metrics.timed("graph.node", node="select_recipes")
+        async def node():
+            with metrics.span("llm.call", node="select_diverse_recipes") as span:
+                await asyncio.sleep(0.01)
+                span.set(prompt_tokens=120)
+
+        asyncio.run(node())
+        try:
+            with metrics.span("edamam.request"):
+                raise TimeoutError("upstream")
+        except TimeoutError:
+            pass
+
+        parent, child = metrics.recent_spans[1], metrics.recent_spans[0]
+        assert child["trace_id"] == parent["trace_id"] and child["parent_id"] == parent["span_id"]
+        assert child["attributes"] == {"prompt_tokens": 120}
+        assert parent["duration_ms"] >= child["duration_ms"] >= 10
+        print("  ✓ Nested spans share a trace")
+
+        snapshot = metrics.snapshot()
+        node_histogram = snapshot["histograms"]["graph.node_duration_ms{node=select_recipes}"]
+        assert node_histogram["count"] == 1 and node_histogram["p50"] >= 10
+        assert snapshot["counters"]["edamam.request_total{outcome=error}"] == 1
+        prometheus = metrics.render_prometheus()
+        assert 'graph_node_duration_ms_bucket{node="select_recipes",le="+Inf"} 1' in prometheus
+        assert 'edamam_request_total{outcome="error"} 1' in prometheus
+        print(f"  ✓ Histograms and counters: {sorted(snapshot['counters'])}")
+
+        print("✅ Metrics tests passed!\n")
+        return True
+    except Exception as e:
+        print(f"❌ Metrics error: {e}\n")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_llm_deadline():
+    """Test deadline-aware LLM calls, hedging and the local fallback."""
+    print("Testing LLM deadlines...")
+    try:
+        import asyncio
+        import time
+        from langchain_core.messages import AIMessage, HumanMessage
+        from app.config import settings
+        from app.services.llm_registry import llm_registry
+        from agent.utils import nodes
+        from agent.utils.llm import DeadlineExceeded, ainvoke_llm
+
+        class StubLLM:
+            """Answers after the given delays, one per call."""
+            def __init__(self, *delays):
+                self.delays = list(delays)
+                self.calls = 0
+
+            def with_structured_output(self, *args, **kwargs):
+                return self
+
+            async def ainvoke(self, messages):
+                delay = self.delays[min(self.calls, len(self.delays) - 1)]
+                self.calls += 1
+                await asyncio.sleep(delay)
+                return AIMessage(content=f"after {delay}")
+
+        messages = [HumanMessage(content="hi")]
+
+        llm = StubLLM(0)
+        try:
+            asyncio.run(ainvoke_llm(llm, messages, deadline=time.time() + 0.1))
+            raise AssertionError("expected DeadlineExceeded")
+        except DeadlineExceeded:
+            pass
+        assert llm.calls == 0
+        print("  ✓ No call is made with the deadline too close")
+
+        try:
+            asyncio.run(ainvoke_llm(StubLLM(5), messages, deadline=time.time() + 0.7))
+            raise AssertionError("expected timeout")
+        except asyncio.TimeoutError:
+            pass
+        print("  ✓ Timeout is clamped to the remaining budget")
+
+        original = settings.LLM_HEDGE_ENABLED, settings.LLM_HEDGE_DEFAULT_DELAY
+        settings.LLM_HEDGE_ENABLED, settings.LLM_HEDGE_DEFAULT_DELAY = True, 0.05
+        try:
+            llm = StubLLM(5, 0.01)
+            start = time.perf_counter()
+            response = asyncio.run(ainvoke_llm(llm, messages))
+            assert response.content == "after 0.01" and llm.calls == 2
+            assert time.perf_counter() - start < 1
+        finally:
+            settings.LLM_HEDGE_ENABLED, settings.LLM_HEDGE_DEFAULT_DELAY = original
+        print("  ✓ Hedged request wins over a slow original")
+
+        original_get, original_local = llm_registry.get, settings.LOCAL_INTENT_ENABLED
+        llm = StubLLM(0)
+        llm_registry.get = lambda *args, **kwargs: llm
+        settings.LOCAL_INTENT_ENABLED = False
+        try:
+            state = {
+                "current_message": "no fish please",
+                "chat_history": [],
+                "selected_recipe_uris": [],
+                "all_recipe_uris": [],
+                "search_params": {"query": "dinner"},
+                "diet_labels": [],
+                "excluded_ingredients": [],
+                "custom_preferences": [],
+                "family_members_info": "",
+                "deadline": time.time(),
+            }
+            result = asyncio.run(nodes.handle_chat_refinement(state))
+        finally:
+            llm_registry.get, settings.LOCAL_INTENT_ENABLED = original_get, original_local
+        assert llm.calls == 0
+        assert result["action"] == "re_search" and "fish" in result["search_params"]["excluded"]
+        print(f"  ✓ Expired deadline falls back to local intent: {result['agent_response']}")
+
+        print("✅ LLM deadline tests passed!\n")
+        return True
+    except Exception as e:
+        print(f"❌ LLM deadline error: {e}\n")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_job_service():
+    """Test the bounded background job executor."""
+    print("Testing job service...")
+    try:
+        import asyncio
+        import tempfile
+        from pathlib import Path
+        from fastapi import HTTPException
+        from app.config import settings
+        from app.services.job_service import JobQueueFull, JobService
+        from app.services.job_store import SqliteJobStore
+        from app.services.metrics import metrics
+
+        original = settings.JOB_WORKERS, settings.JOB_QUEUE_MAX
+        settings.JOB_WORKERS, settings.JOB_QUEUE_MAX = 1, 1
+
+        async def scenario():
+            jobs = JobService()
+            release = asyncio.Event()
+
+            async def slow():
+                await release.wait()
+                return {"session_id": "abc"}
+
+            async def not_found():
+                raise HTTPException(status_code=404, detail="No recipes found")
+
+            first = jobs.submit("recipe_search", slow)
+            await asyncio.sleep(0)  # Worker picks up the first job
+            second = jobs.submit("chat", not_found)
+            assert jobs.get(first.job_id).status == "running"
+            assert jobs.queue_position(second.job_id) == 1
+            assert metrics.snapshot()["gauges"]["jobs_queue_depth"] == 1
+            try:
+                jobs.submit("recipe_search", slow)
+                raise AssertionError("expected JobQueueFull")
+            except JobQueueFull:
+                pass
+            print("  ✓ Concurrency cap and queue bound enforced")
+
+            pending = await jobs.wait(first.job_id, timeout=0.05)
+            assert pending.status == "running"
+            release.set()
+            done = await jobs.wait(first.job_id, timeout=1)
+            failed = await jobs.wait(second.job_id, timeout=1)
+            await jobs.shutdown()
+            return jobs, done, failed
+
+        async def shared(path):
+            # Two worker processes sharing one job store
+            worker_a, worker_b = JobService(), JobService()
+            worker_a.store, worker_b.store = SqliteJobStore(path), SqliteJobStore(path)
+            release = asyncio.Event()
+
+            async def slow():
+                await release.wait()
+                return {"session_id": "shared"}
+
+            running = worker_a.submit("chat", slow)
+            await asyncio.sleep(0)
+            queued = worker_a.submit("chat", slow)
+            assert worker_b.get(running.job_id).status == "running"
+            assert worker_b.queue_position(queued.job_id) == 1 and worker_b.get("unknown") is None
+            asyncio.get_running_loop().call_later(0.1, release.set)
+            done = await worker_b.wait(running.job_id, timeout=2)
+            await worker_a.shutdown()
+            await worker_b.shutdown()
+            return done
+
+        try:
+            jobs, done, failed = asyncio.run(scenario())
+            with tempfile.TemporaryDirectory() as tmp:
+                shared_done = asyncio.run(shared(Path(tmp) / "jobs.sqlite"))
+        finally:
+            settings.JOB_WORKERS, settings.JOB_QUEUE_MAX = original
+
+        assert done.status == "succeeded" and done.result == {"session_id": "abc"}
+        assert failed.status == "failed" and failed.status_code == 404
+        assert jobs.status()["rejected"] == 1 and jobs.status()["succeeded"] == 1
+        print(f"  ✓ Results and errors retained: {jobs.status()}")
+        assert shared_done.status == "succeeded" and shared_done.result == {"session_id": "shared"}
+        print("  ✓ Jobs polled through another worker via the shared store")
+
+        print("✅ Job service tests passed!\n")
+        return True
+    except Exception as e:
+        print(f"❌ Job service error: {e}\n")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_recipe_store():
+    """Test URI references into the shared recipe store."""
+    print("Testing recipe store...")
+    try:
+        from app.models.recipe import EdamamRecipe
+        from app.services.edamam_service import EdamamService
+        from app.services.recipe_store import RecipeStore
+        from fake_upstream.synthetic import synthetic_edamam_response
+
+        store = RecipeStore(max_entries=10)
+        recipes = EdamamService()._parse_recipes(synthetic_edamam_response({"q": ["recipe"], "to": ["8"]}))
+        uris = store.add(recipes)
+        assert uris == [r.uri for r in recipes] and len(store) == len(recipes)
+
+        # Views are built once and shared; models are the stored objects
+        assert store.view(uris[0]) is store.view(uris[0])
+        assert store.models(uris)[0] is recipes[0]
+        assert store.add(recipes) == uris and store.stats["views_built"] == 1
+        print(f"  ✓ {len(uris)} recipes stored once, views cached")
+
+        (uri,) = store.add([recipes[0].model_dump() | {"uri": "dict#1"}])
+        assert isinstance(store.model(uri), EdamamRecipe) and store.stats["models_built"] == 1
+        print("  ✓ Dicts are validated lazily, at most once")
+
+        store.add([recipes[1].model_copy(update={"uri": f"extra#{i}"}) for i in range(5)])
+        assert len(store) == 10 and uris[0] not in store
+        # Evicted models still held elsewhere (here by `recipes`, as by a session) resolve again
+        assert store.view(uris[0])["uri"] == uris[0] and store.stats["revived"] == 1
+        store.add([recipes[1].model_copy(update={"uri": f"more#{i}"}) for i in range(10)])
+        assert "extra#4" not in store and store.views(["extra#4", "more#9"]) == [store.view("more#9")]
+        print(f"  ✓ LRU eviction, held models revived, others skipped: {store.status()}")
+
+        print("✅ Recipe store tests passed!\n")
+        return True
+    except Exception as e:
+        print(f"❌ Recipe store error: {e}\n")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_checkpoint_service():
+    """Test resuming chat turns from a checkpointed session state."""
+    print("Testing checkpointed sessions...")
+    try:
+        import asyncio
+        from app.services.checkpoint_service import CheckpointService
+        from app.services.recipe_store import recipe_store
+
+        uris = recipe_store.add([
+            {"uri": "checkpoint#lasagna", "label": "Lasagna", "cuisineType": ["italian"], "totalTime": 60},
+            {"uri": "checkpoint#tacos", "label": "Tacos", "cuisineType": ["mexican"], "totalTime": 20},
+        ])
+        checkpoints = CheckpointService()
+        config = checkpoints.config("session-1")
+
+        async def scenario():
+            await checkpoints.save("session-1", {
+                "user_ids": [1], "family_members_info": "You are helping plan meals for: Ola",
+                "all_recipe_uris": uris, "selected_recipe_uris": uris,
+                "search_params": {"query": "dinner"}, "chat_history": [],
+                "action": "initial_search", "deadline": 0,
+            })
+            stored = await checkpoints.load("session-1")
+            assert stored["deadline"] is None and stored["selected_recipe_uris"] == uris
+
+            # The turn sends only the message; everything else is resumed
+            result = await checkpoints.graph.ainvoke(
+                {"current_message": "show only italian", "action": "refine", "agent_response": None},
+                config, durability="exit",
+            )
+            await checkpoints.save("session-1", result)
+            history = [c async for c in checkpoints.saver.alist(config)]
+            return result, await checkpoints.load("session-1"), history
+
+        result, stored, history = asyncio.run(scenario())
+        assert result["action"] == "filter" and result["selected_recipe_uris"] == ["checkpoint#lasagna"]
+        assert result["family_members_info"].endswith("Ola") and result["all_recipe_uris"] == uris
+        print("  ✓ Turn resumed from stored state with only the new message")
+
+        assert stored["selected_recipe_uris"] == ["checkpoint#lasagna"] and stored["current_message"] is None
+        # Earlier checkpoints are kept: saving appends instead of rewriting the thread
+        assert history[-1].checkpoint["channel_values"]["selected_recipe_uris"] == uris, "First save was lost"
+        assert asyncio.run(checkpoints.load("unknown")) is None
+        print(f"  ✓ Each save appends a checkpoint ({len(history)} in the thread)")
+
+        print("✅ Checkpointed session tests passed!\n")
+        return True
+    except Exception as e:
+        print(f"❌ Checkpointed session error: {e}\n")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_fake_llm():
+    """Test the deterministic fake LLM provider."""
+    print("Testing fake LLM provider...")
+    from app.config import settings
+    provider, latency = settings.LLM_PROVIDER, settings.FAKE_LLM_LATENCY_MS
+    try:
+        import asyncio
+        import time
+        from langchain_core.messages import HumanMessage, SystemMessage
+        from app.services.fake_llm import FakeChatModel
+        from app.services.llm_registry import LLMRegistry
+        from agent.utils.schemas import RefinementDecision
+
+        settings.LLM_PROVIDER, settings.FAKE_LLM_LATENCY_MS = "fake", 50
+        registry = LLMRegistry()
+        llm = registry.get(temperature=0.7)
+        assert isinstance(llm, FakeChatModel) and registry.get(temperature=0.7) is llm
+        print("  ✓ Registry builds fake profiles without an OpenAI key")
+
+        messages = [
+            SystemMessage(content="Read the user's message and detect their intent."),
+            HumanMessage(content='User message: "Only recipes under 30 minutes"'),
+        ]
+        structured = llm.with_structured_output(RefinementDecision, method="function_calling")
+
+        async def decide():
+            start = time.perf_counter()
+            decision = await structured.ainvoke(messages)
+            return decision, time.perf_counter() - start
+
+        first, elapsed = asyncio.run(decide())
+        second, _ = asyncio.run(decide())
+        assert isinstance(first, RefinementDecision) and first == second
+        assert elapsed >= 0.05, f"Expected the configured latency, took {elapsed:.3f}s"
+        print(f"  ✓ Structured output is schema-valid and repeatable ({first.intent})")
+
+        async def stream():
+            return [chunk async for chunk in llm.bind_tools([RefinementDecision]).astream(messages)]
+
+        chunks = asyncio.run(stream())
+        merged = chunks[0]
+        for chunk in chunks[1:]:
+            merged = merged + chunk
+        assert len(chunks) > 2 and merged.tool_calls[0]["name"] == "RefinementDecision"
+        assert merged.usage_metadata["output_tokens"] > 0
+        print(f"  ✓ Streams tool call deltas ({len(chunks)} chunks) with usage")
+
+        print("✅ Fake LLM tests passed!\n")
+        return True
+    except Exception as e:
+        print(f"❌ Fake LLM error: {e}\n")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        settings.LLM_PROVIDER, settings.FAKE_LLM_LATENCY_MS = provider, latency
+
+
+def test_session_eviction():
+    """Test session TTL expiry, LRU count/byte caps and the sweeper."""
+    print("Testing session eviction...")
+    from app.config import settings
+    limits = (settings.SESSION_TTL_SECONDS, settings.SESSION_MAX_COUNT,
+              settings.SESSION_MAX_BYTES, settings.SESSION_SWEEP_INTERVAL_SECONDS)
+    try:
+        import asyncio
+        import time
+        from app.models.user import MergedPreferences
+        from app.services.metrics import metrics
+        from app.services.session_service import SessionService
+
+        prefs = MergedPreferences(
+            user_ids=[1], diet_labels=[], excluded_ingredients=[],
+            fridge_items=[], custom_preferences=[],
+        )
+        sessions = SessionService()
+
+        def create():
+            return sessions.create_session(
+                user_ids=[1], merged_preferences=prefs, all_recipes=[], selected_recipes=[],
+            )
+
+        settings.SESSION_MAX_COUNT = 3
+        first, second, third = create(), create(), create()
+        sessions.get_session(first)  # second is now least recently used
+        fourth = create()
+        assert not sessions.session_exists(second)
+        assert list(sessions.sessions) == [third, first, fourth]
+        print("  ✓ Count cap evicts the least recently used session")
+
+        size = sessions.sizes[first]
+        sessions.update_chat_history(first, "hello " * 200, "hi")
+        assert sessions.sizes[first] > size + 1000
+        assert sessions.total_bytes == sum(sessions.sizes.values())
+        settings.SESSION_MAX_BYTES = sessions.total_bytes - 1
+        create()
+        assert not sessions.session_exists(third) and sessions.session_exists(first)
+        assert sessions.total_bytes <= settings.SESSION_MAX_BYTES
+        print(f"  ✓ Byte cap evicts by LRU ({sessions.total_bytes} bytes kept)")
+
+        settings.SESSION_TTL_SECONDS = 60
+        sessions.last_access[first] = time.time() - 120
+        sessions.sessions.move_to_end(first, last=False)
+        # Sessions evicted by the caps are handed to cleanup with the expired ones
+        gone = sessions.expire_idle()
+        assert gone[:3] == [first, second, third] and not set(gone) & set(sessions.sessions), gone
+        assert sessions.stats["expired"] == 1 and sessions.expire_idle() == []
+        assert metrics.gauges[metrics._key("sessions_active", {})] == len(sessions.sessions)
+        print("  ✓ Idle sessions expire after the TTL; evicted ones are cleaned up too")
+
+        # A session alone over the byte cap is evicted as well, not kept past it
+        settings.SESSION_MAX_BYTES = 2000
+        big = create()
+        sessions.update_chat_history(big, "hello " * 1000, "hi")
+        assert not sessions.sessions and sessions.total_bytes == 0, sessions.status()
+        assert big in sessions.expire_idle()
+        settings.SESSION_MAX_BYTES = limits[2]
+        create()
+        print("  ✓ A single session over the byte cap is evicted")
+
+        async def sweep():
+            expired = []
+
+            async def on_expired(session_id):
+                expired.append(session_id)
+
+            settings.SESSION_SWEEP_INTERVAL_SECONDS = 0.01
+            settings.SESSION_TTL_SECONDS = 0
+            sessions.start(on_expired=on_expired)
+            await asyncio.sleep(0.1)
+            await sessions.shutdown()
+            return expired
+
+        remaining = list(sessions.sessions)
+        assert asyncio.run(sweep()) == remaining and not sessions.sessions
+        assert sessions.total_bytes == 0
+        print(f"  ✓ Sweeper expired {len(remaining)} sessions: {sessions.status()}")
+
+        print("✅ Session eviction tests passed!\n")
+        return True
+    except Exception as e:
+        print(f"❌ Session eviction error: {e}\n")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        (settings.SESSION_TTL_SECONDS, settings.SESSION_MAX_COUNT,
+         settings.SESSION_MAX_BYTES, settings.SESSION_SWEEP_INTERVAL_SECONDS) = limits
+
+
+def test_session_store():
+    """Test sessions shared through the SQLite session store."""
+    print("Testing durable session store...")
+    from app.config import settings
+    from app.services.recipe_store import recipe_store
+    check_seconds = settings.SESSION_VERSION_CHECK_SECONDS
+    try:
+        import asyncio
+        import tempfile
+        import time
+        from pathlib import Path
+        from app.models.user import MergedPreferences
+        from app.services.edamam_service import EdamamService
+        from app.services.session_service import SessionService
+        from app.services.session_store import SqliteSessionStore
+        from fake_upstream.synthetic import synthetic_edamam_response
+
+        tmp = Path(tempfile.mkdtemp())
+        recipe_store.attach(tmp / "recipes.sqlite")
+        recipes = EdamamService()._parse_recipes(synthetic_edamam_response({"q": ["session"], "to": ["12"]}))
+        prefs = MergedPreferences(
+            user_ids=[1, 2], diet_labels=["vegetarian"], excluded_ingredients=[],
+            fridge_items=[], custom_preferences=[],
+        )
+
+        # Two workers, each with its own connection and cache; every read checks the version
+        settings.SESSION_VERSION_CHECK_SECONDS = 0
+        worker_a, worker_b = SessionService(), SessionService()
+        worker_a.attach(SqliteSessionStore(tmp / "sessions.sqlite"))
+        worker_b.attach(SqliteSessionStore(tmp / "sessions.sqlite"))
+
+        session_id = worker_a.create_session(
+            user_ids=[1, 2], merged_preferences=prefs, all_recipes=recipes,
+            selected_recipes=recipes[:9], search_params={"query": "session"},
+        )
+        data, version = worker_a.store.load(session_id)
+        full_size = len(worker_a.get_session(session_id).model_dump_json())
+        assert len(data) * 5 < full_size, f"Stored {len(data)} bytes for a {full_size} byte session"
+        print(f"  ✓ Stored compactly ({len(data)} of {full_size} bytes)")
+
+        session_b = worker_b.get_session(session_id)
+        assert session_b is not None and [r.uri for r in session_b.selected_recipes] == [r.uri for r in recipes[:9]]
+        assert session_b.merged_preferences == prefs and worker_b.stats["loaded"] == 1
+        assert worker_b.get_session(session_id) is session_b, "Current cached copy should be reused"
+        print("  ✓ Session created by one worker is served by another")
+
+        worker_b.update_chat_history(session_id, "no mushrooms", "Done!")
+        worker_b.update_selected_recipes(session_id, recipes[3:12])
+        session_a = worker_a.get_session(session_id)
+        assert [m.content for m in session_a.chat_history] == ["no mushrooms", "Done!"]
+        assert session_a.selected_recipes[0].uri == recipes[3].uri and worker_a.stats["loaded"] == 1
+        print("  ✓ Stale cached copy reloaded after another worker's write")
+
+        raced = []
+
+        def prefetch(session):
+            if not raced:
+                # Another worker saves between this worker's read and write
+                raced.append(worker_b.update_chat_history(session_id, "quicker", "Sure!"))
+            session.prefetched["quick"] = recipes[:3]
+
+        worker_a.update_session(session_id, prefetch)
+        assert worker_a.stats["save_conflicts"] == 1, worker_a.stats
+        session_b = worker_b.get_session(session_id)
+        assert [m.content for m in session_b.chat_history][-2:] == ["quicker", "Sure!"], "Concurrent turn lost"
+        assert [r.uri for r in session_b.prefetched["quick"]] == [r.uri for r in recipes[:3]]
+        worker_b.add_prefetched(session_id, "fast", recipes[3:6])
+        assert set(worker_a.get_session(session_id).prefetched) == {"quick", "fast"}
+        print("  ✓ Conflicting writes are retried on the newer copy, not overwritten")
+
+        # Within the check window the cached copy is used as is; writes still detect the race
+        settings.SESSION_VERSION_CHECK_SECONDS = 60
+        session_a = worker_a.get_session(session_id)
+        worker_b.update_chat_history(session_id, "spicier", "Okay!")
+        assert worker_a.get_session(session_id) is session_a, "Fresh cached copy should not be checked"
+        worker_a.add_prefetched(session_id, "spicy", recipes[6:9])
+        assert worker_a.stats["save_conflicts"] == 2, worker_a.stats
+        assert [m.content for m in worker_a.get_session(session_id).chat_history][-2:] == ["spicier", "Okay!"]
+        settings.SESSION_VERSION_CHECK_SECONDS = 0
+        worker_b.update_chat_history(session_id, "milder", "Sure!")
+        loaded = asyncio.run(worker_a.load_session(session_id))
+        assert [m.content for m in loaded.chat_history][-2:] == ["milder", "Sure!"], "Async read was stale"
+        print("  ✓ Version checks skipped within the window; async reads run off the event loop")
+
+        restarted = SessionService()
+        restarted.attach(SqliteSessionStore(tmp / "sessions.sqlite"))
+        assert restarted.session_exists(session_id)
+        assert len(restarted.get_all_recipes(session_id)) == len(recipes)
+        print("  ✓ Sessions survive a restart")
+
+        assert worker_a.expire_idle(now=time.time() + 10 ** 6) == [session_id]
+        assert worker_b.get_session(session_id) is None and not restarted.session_exists(session_id)
+        print(f"  ✓ Idle expiry removes the session for every worker: {worker_a.status()}")
+
+        for service in (worker_a, worker_b, restarted):
+            service.detach()
+        print("✅ Durable session store tests passed!\n")
+        return True
+    except Exception as e:
+        print(f"❌ Durable session store error: {e}\n")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        settings.SESSION_VERSION_CHECK_SECONDS = check_seconds
+        recipe_store.detach()
+
+
+def test_session_recipe_index():
+    """Test constant-time recipe lookups by URI within a session."""
+    print("Testing session recipe index...")
+    try:
+        from app.models.user import MergedPreferences
+        from app.services.edamam_service import EdamamService
+        from app.services.session_service import Session
+        from fake_upstream.synthetic import synthetic_edamam_response
+
+        recipes = EdamamService()._parse_recipes(synthetic_edamam_response({"q": ["index"], "to": ["30"]}))
+        # Hundreds of recipes, as after repeated re-searches with fan-out
+        pool = [r.model_copy(update={"uri": f"{r.uri}-{i}"}) for i in range(10) for r in recipes]
+        prefs = MergedPreferences(
+            user_ids=[1], diet_labels=[], excluded_ingredients=[],
+            fridge_items=[], custom_preferences=[],
+        )
+        session = Session(
+            session_id="index", user_ids=[1], merged_preferences=prefs,
+            all_recipes=pool, selected_recipes=pool[:9], created_at="now",
+        )
+        assert session.get_recipe(pool[250].uri) is pool[250] and session.get_recipe("missing") is None
+        assert session.selected_recipe_uris == [r.uri for r in pool[:9]] and session.is_selected(pool[8].uri)
+        print(f"  ✓ {len(pool)} recipes indexed by URI")
+
+        session.selected_recipes = pool[100:109]
+        assert session.is_selected(pool[100].uri) and not session.is_selected(pool[0].uri)
+        session.all_recipes = recipes
+        assert session.all_recipe_uris == [r.uri for r in recipes]
+        assert session.get_recipe(recipes[3].uri) is recipes[3]
+        assert session.get_recipe(pool[100].uri) is pool[100], "Selected recipes stay reachable"
+        assert session.get_recipe(pool[250].uri) is None
+        print("  ✓ Indexes follow selection updates and re-searches")
+
+        restored = Session.model_validate(session.model_dump())
+        assert restored.selected_recipe_uris == session.selected_recipe_uris
+        assert "_recipes_by_uri" not in session.model_dump_json()
+        print("  ✓ Indexes rebuilt on load, not serialized")
+
+        import asyncio
+        from app.api.agent import _chat_input, _finish_refinement
+        from app.models.chat import ChatRequest
+        from app.services.checkpoint_service import checkpoint_service
+        from app.services.recipe_store import recipe_store
+        from app.services.session_service import session_service
+
+        session_service.add_session(session)
+        request = ChatRequest(session_id="index", message="how do I cook these?")
+        selected = session.selected_recipe_uris
+
+        async def turn():
+            await _chat_input(request, session)  # Seeds the checkpoint
+            recipe_store.clear()  # Evicted from the bounded store between turns
+            added = recipe_store.stats["added"]
+            await _chat_input(request, session)
+            assert recipe_store.stats["added"] == added, "Session recipes re-added on a turn"
+            assert all(recipe_store.view(uri) is not None for uri in selected), "Session recipes not resolvable"
+            recipe_store.clear()
+            result = {"action": "answer", "agent_response": "Like this.", "selected_recipe_uris": selected,
+                      "all_recipe_uris": session.all_recipe_uris}
+            return await _finish_refinement(request, session, result)
+
+        try:
+            response = asyncio.run(turn())
+        finally:
+            session_service._evict("index", "deleted")
+        assert [r.uri for r in response.recipes] == selected, f"Selection shrank to {len(response.recipes)}"
+        print("  ✓ Evicted store entries neither empty nor shrink the selection")
+
+        print("✅ Session recipe index tests passed!\n")
+        return True
+    except Exception as e:
+        print(f"❌ Session recipe index error: {e}\n")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_chat_history_window():
+    """Test bounded chat history with a rolling summary and archive."""
+    print("Testing chat history window...")
+    from app.config import settings
+    from app.services import session_service as session_module
+    original_archive, window = session_module.chat_archive, settings.CHAT_HISTORY_WINDOW
+    try:
+        import tempfile
+        from pathlib import Path
+        from app.models.user import MergedPreferences
+        from app.services.chat_archive import ChatArchive
+        from app.services.session_service import SessionService
+        from agent.utils.history import extend_summary
+
+        session_module.chat_archive = ChatArchive(Path(tempfile.mkdtemp()) / "chat_archive.sqlite")
+        settings.CHAT_HISTORY_WINDOW = 4
+        prefs = MergedPreferences(
+            user_ids=[1], diet_labels=[], excluded_ingredients=[],
+            fridge_items=[], custom_preferences=[],
+        )
+        sessions = SessionService()
+        session_id = sessions.create_session(
+            user_ids=[1], merged_preferences=prefs, all_recipes=[], selected_recipes=[],
+        )
+        requests = [f"request {i}" for i in range(10)]
+        for i, message in enumerate(requests):
+            sessions.update_chat_history(session_id, message, f"reply {i}")
+
+        session = sessions.get_session(session_id)
+        assert [m.content for m in session.chat_history] == ["request 8", "reply 8", "request 9", "reply 9"]
+        assert session.chat_summary == "; ".join(requests[:8])
+        print(f"  ✓ Window kept at {len(session.chat_history)} messages, summary: {session.chat_summary!r}")
+
+        history = sessions.get_chat_history(session_id)
+        assert [m.content for m in history[::2]] == requests and len(history) == 20
+        print("  ✓ Older messages spilled to the archive and read back in order")
+
+        summary = extend_summary("", [{"role": "user", "content": "x" * 200}], max_chars=500)
+        assert len(summary) == 80 and summary.endswith("…")
+        summary = extend_summary(summary, [{"role": "user", "content": f"keep {i}"} for i in range(100)], max_chars=60)
+        assert len(summary) <= 60 and summary.endswith("keep 99")
+        print("  ✓ Summary items clipped, oldest dropped beyond the cap")
+
+        print("✅ Chat history window tests passed!\n")
+        return True
+    except Exception as e:
+        print(f"❌ Chat history window error: {e}\n")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        session_module.chat_archive.close()
+        session_module.chat_archive, settings.CHAT_HISTORY_WINDOW = original_archive, window
+
+
 def test_config():
     """Test configuration."""
     print("Testing configuration...")
@@ -189,6 +1770,29 @@ def main():
     results.append(("User Service", test_user_service()))
     results.append(("Session Service", test_session_service()))
     results.append(("Agent Graphs", test_agent_graphs()))
+    results.append(("Edamam Resilience", test_edamam_resilience()))
+    results.append(("Fan-out Merge", test_fanout_merge()))
+    results.append(("Refinement Prefetch", test_prefetch()))
+    results.append(("Fake Upstream", test_fake_upstream()))
+    results.append(("Non-blocking LLM", test_async_llm_calls()))
+    results.append(("Search Query Cache", test_search_query_cache()))
+    results.append(("Deterministic Params", test_deterministic_search_params()))
+    results.append(("Diversity Selection", test_diversity_selection()))
+    results.append(("Local Intent", test_local_intent()))
+    results.append(("Recipe Filter", test_recipe_filter()))
+    results.append(("Single-call Refinement", test_single_call_refinement()))
+    results.append(("Chat Streaming", test_chat_stream()))
+    results.append(("Prompt Encoding", test_prompt_encoding()))
+    results.append(("Metrics", test_metrics()))
+    results.append(("LLM Deadlines", test_llm_deadline()))
+    results.append(("Job Service", test_job_service()))
+    results.append(("Recipe Store", test_recipe_store()))
+    results.append(("Checkpointed Sessions", test_checkpoint_service()))
+    results.append(("Fake LLM", test_fake_llm()))
+    results.append(("Session Eviction", test_session_eviction()))
+    results.append(("Durable Session Store", test_session_store()))
+    results.append(("Session Recipe Index", test_session_recipe_index()))
+    results.append(("Chat History Window", test_chat_history_window()))
 
     print("\n" + "="*60)
     print("TEST SUMMARY")